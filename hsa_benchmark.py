@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+HSA Checker Benchmark
+Drives HSAChecker against the local mock API and reports scan wall time,
+request throughput, per-endpoint latency and time-to-detection of a seat opening
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from hsa_checker import HSAChecker, SlotEvent, endpoint_name, parse_arguments as parse_checker_arguments
+from hsa_mock_server import MockHSAServer
+
+def parse_arguments(argv: List[str] = None):
+    """Parse command line arguments; anything after -- is passed to the checker"""
+    parser = argparse.ArgumentParser(description="HSA Checker Benchmark",
+                                     epilog="Example: python hsa_benchmark.py --locations 50 -- --engine async --concurrency 8")
+    parser.add_argument("--periods", type=int, default=1, help="Mock exam periods (default: 1)")
+    parser.add_argument("--batches", type=int, default=2, help="Mock batches (default: 2)")
+    parser.add_argument("--locations", type=int, default=20, help="Mock locations per batch (default: 20)")
+    parser.add_argument("--slots", type=int, default=4, help="Mock slots per location (default: 4)")
+    parser.add_argument("--latency", default="lognormal:20:0.4",
+                      help="Mock latency spec, see hsa_mock_server.py (default: lognormal:20:0.4)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Mock fraction of 500 responses (default: 0)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Mock fraction of 429 responses (default: 0)")
+    parser.add_argument("--max-rps", type=float, default=0.0, help="Mock server-side rate limit (default: unlimited)")
+    parser.add_argument("--scans", type=int, default=3, help="Timed full scans after the cold one (default: 3)")
+    parser.add_argument("--no-detection", action="store_true", help="Skip the time-to-detection measurement")
+    parser.add_argument("--interval", type=float, default=0.0,
+                      help="Seconds between scans while waiting for the scripted opening (default: 0)")
+    parser.add_argument("--detection-timeout", type=float, default=120.0,
+                      help="Give up waiting for the scripted opening after this many seconds (default: 120)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the mock server (default: 1)")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the checker's own output")
+    argv = sys.argv[1:] if argv is None else argv
+    if "--" in argv:
+        split = argv.index("--")
+        args = parser.parse_args(argv[:split])
+        args.checker_args = argv[split + 1:]
+    else:
+        args = parser.parse_args(argv)
+        args.checker_args = []
+    return args
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+class LatencyRecorder:
+    """Times every request sent through a checker's transports, per endpoint"""
+
+    def __init__(self):
+        self.samples = {}
+
+    def attach(self, transport):
+        """Wrap a transport's request method so its calls are timed"""
+        send = transport.request
+        def timed_request(method, url, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return send(method, url, *args, **kwargs)
+            finally:
+                endpoint = endpoint_name(url)
+                self.samples.setdefault(endpoint, []).append(time.perf_counter() - started)
+        transport.request = timed_request
+
+    def count(self) -> int:
+        """Total number of requests timed so far"""
+        return sum(len(samples) for samples in self.samples.values())
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Request count and p50/p99 latency in milliseconds per endpoint"""
+        return {endpoint: {
+            "requests": len(samples),
+            "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+            "p99_ms": round(percentile(samples, 0.99) * 1000, 2)
+        } for endpoint, samples in sorted(self.samples.items())}
+
+def build_checker(args, base_url: str) -> HSAChecker:
+    """Create a checker aimed at the mock; later checker args override the defaults"""
+    checker_args = parse_checker_arguments([
+        "--api-base", base_url, "-p", "0900000000", "-w", "benchmark",
+        "--all-batches", "-n", "-d", "0", "--notify", "file:notifications.jsonl"
+    ] + args.checker_args)
+    return HSAChecker(checker_args)
+
+def timed_scan(checker: HSAChecker, recorder: LatencyRecorder) -> Dict[str, float]:
+    """Run one full scan and return its wall time and request rate"""
+    requests_before = recorder.count()
+    started = time.perf_counter()
+    scan = checker.run_check()
+    elapsed = time.perf_counter() - started
+    requests_made = recorder.count() - requests_before
+    return {
+        "wall_s": round(elapsed, 4),
+        "requests": requests_made,
+        "requests_per_s": round(requests_made / elapsed, 2) if elapsed > 0 else 0.0,
+        "locations": sum(len(b.locations) for b in scan.batches)
+    }
+
+def measure_detection(args, checker: HSAChecker, mock: MockHSAServer, scan_time: float) -> Dict[str, float]:
+    """Open a seat in the middle of a scan and time how long the checker takes to report it"""
+    batch = mock.batches[-1]
+    location_id = mock.locations[batch["id"]][-1]["id"]
+    slot_id = mock.slot_ids[0]
+    opens_in = scan_time / 2
+    mock.schedule(time.monotonic() - mock.started_at + opens_in, location_id, slot_id, 3)
+
+    deadline = time.monotonic() + args.detection_timeout
+    scans = 0
+    while time.monotonic() < deadline:
+        scan = checker.run_check()
+        scans += 1
+        for event in scan.events:
+            if event.kind == SlotEvent.OPENED and event.location_id == location_id and event.slot_id == slot_id:
+                detected_at = time.monotonic()
+                applied_at = next(c["applied_at"] for c in mock.applied if c["location"] == location_id)
+                return {"location_id": location_id, "slot_id": slot_id, "scans": scans,
+                        "time_to_detection_s": round(detected_at - applied_at, 4)}
+        time.sleep(args.interval)
+    return {"location_id": location_id, "slot_id": slot_id, "scans": scans, "time_to_detection_s": None}
+
+def run_benchmark(args) -> dict:
+    """Start the mock, drive the checker against it and collect the report"""
+    mock = MockHSAServer(port=0, batches=args.batches, locations=args.locations, slots=args.slots,
+                         latency=args.latency, error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                         max_rps=args.max_rps, seed=args.seed, periods=args.periods).start()
+    recorder = LatencyRecorder()
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    workdir = tempfile.TemporaryDirectory(prefix="hsa-benchmark-")
+    cwd = os.getcwd()
+    # Result logs, history, token and limiter state all go to a scratch directory
+    os.chdir(workdir.name)
+    try:
+        with output:
+            checker = build_checker(args, mock.base_url)
+            try:
+                recorder.attach(checker.transport)
+                if checker.pool:
+                    for worker in checker.pool.workers:
+                        if worker.transport is not checker.transport:
+                            recorder.attach(worker.transport)
+                checker.discover_batches()
+
+                cold = timed_scan(checker, recorder)
+                warm = [timed_scan(checker, recorder) for _ in range(args.scans)]
+                warm_wall = statistics.median(s["wall_s"] for s in warm) if warm else cold["wall_s"]
+                detection = None if args.no_detection else measure_detection(args, checker, mock, warm_wall)
+            finally:
+                checker.close()
+    finally:
+        os.chdir(cwd)
+        workdir.cleanup()
+        mock.stop()
+
+    return {
+        "mock": {"periods": args.periods, "batches": args.batches, "locations_per_batch": args.locations, "slots": args.slots,
+                 "latency": args.latency, "error_rate": args.error_rate, "throttle_rate": args.throttle_rate,
+                 "max_rps": args.max_rps},
+        "checker_args": args.checker_args,
+        "cold_scan": cold,
+        "scans": warm,
+        "median_scan_s": warm_wall,
+        "median_requests_per_s": statistics.median(s["requests_per_s"] for s in warm) if warm else cold["requests_per_s"],
+        "endpoints": recorder.summary(),
+        "detection": detection,
+        "server": mock.stats
+    }
+
+def print_report(report: dict):
+    """Print the benchmark report"""
+    mock = report["mock"]
+    print("HSA Checker Benchmark")
+    print(f"Mock: {mock['periods']} period(s), {mock['batches']} batches x {mock['locations_per_batch']} locations x {mock['slots']} slots, "
+          f"latency {mock['latency']}")
+    if report["checker_args"]:
+        print(f"Checker args: {' '.join(report['checker_args'])}")
+    print("--------------------------------------------------------------------")
+    cold = report["cold_scan"]
+    print(f"Cold scan:   {cold['wall_s']:.3f}s, {cold['requests']} requests, {cold['requests_per_s']:.1f} req/s")
+    for index, scan in enumerate(report["scans"], 1):
+        print(f"Scan {index}:      {scan['wall_s']:.3f}s, {scan['requests']} requests, {scan['requests_per_s']:.1f} req/s")
+    print(f"Median scan: {report['median_scan_s']:.3f}s, {report['median_requests_per_s']:.1f} req/s")
+    print("--------------------------------------------------------------------")
+    print(f"{'Endpoint':<22}{'Requests':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for endpoint, stats in report["endpoints"].items():
+        print(f"{endpoint:<22}{stats['requests']:>10}{stats['p50_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+    detection = report["detection"]
+    if detection:
+        print("--------------------------------------------------------------------")
+        if detection["time_to_detection_s"] is None:
+            print(f"Scripted opening at {detection['location_id']} was not detected after {detection['scans']} scan(s)")
+        else:
+            print(f"Time to detection: {detection['time_to_detection_s']:.3f}s "
+                  f"({detection['scans']} scan(s), slot {detection['slot_id']} at {detection['location_id']})")
+
+def main():
+    """Main entry point"""
+    args = parse_arguments()
+    report = run_benchmark(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+
+if __name__ == "__main__":
+    main()
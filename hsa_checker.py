@@ -5,52 +5,3136 @@ Enhanced and flexible version with period and batch discovery
 Python implementation with support for checking all batches
 """
 
+import time
+
+# Start-up timing under -v is measured from here
+STARTED_AT = time.perf_counter()
+
 import argparse
+import base64
 import datetime
+import email.utils
+import fnmatch
+import glob
+import gzip
+import hashlib
+import importlib.util
 import json
 import os
-import platform
-import subprocess
+import queue
+import re
+import shutil
+import sqlite3
 import sys
-import time
+import threading
+import unicodedata
+import urllib.parse
+from array import array
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import CancelledError, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, as_completed
 from typing import Dict, List, Optional, Tuple, Union
 
-import requests
+import requests
+
+IMPORTED_AT = time.perf_counter()
+
+DEFAULT_API_BASE = "https://api.hsa.edu.vn"
+
+def parse_arguments(argv: List[str] = None):
+    """Parse command line arguments (sys.argv unless argv is given)"""
+    parser = argparse.ArgumentParser(description="HSA Exam Slot Checker")
+    parser.add_argument("-b", "--batch-code", help="Check specific batch by code (e.g. 502, 503)")
+    parser.add_argument("-l", "--location-id", help="Only check a specific location ID")
+    parser.add_argument("-i", "--interval", type=int, default=300, 
+                      help="Interval in seconds between checks when monitoring (default: 300)")
+    parser.add_argument("-d", "--delay", type=float, default=2,
+                      help="Initial delay in seconds between API calls, adapted to server responses (default: 2)")
+    parser.add_argument("-e", "--email", default="your-email-address",
+                      help="Email to send notifications to")
+    parser.add_argument("-n", "--no-email", action="store_true",
+                      help="No email notifications, just display results")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                      help="Verbose output (show progress for each location)")
+    parser.add_argument("-m", "--monitor", action="store_true",
+                      help="Monitor mode - continuously check at specified intervals")
+    parser.add_argument("-p", "--phone", help="Phone number for authentication")
+    parser.add_argument("-w", "--password", help="Password for authentication")
+    parser.add_argument("-t", "--token", help="Custom authorization token")
+    parser.add_argument("-a", "--show-batches", action="store_true",
+                      help="Show all available batches and exit")
+    parser.add_argument("--all-batches", action="store_true",
+                      help="Check all OPENING batches instead of just one")
+    parser.add_argument("--watchlist",
+                      help="JSON file of watch rules; only locations a rule can match are checked")
+    parser.add_argument("--status", default="OPENING", 
+                      help="Status of batches to check (default: OPENING)")
+    parser.add_argument("--periods", type=parse_periods, default="all",
+                      help="Exam periods to discover batches in: all, first, or comma-separated period IDs (default: all)")
+    parser.add_argument("--notify", action="append", metavar="SINK",
+                      help="Notification sink, repeatable: sound, ses, smtp, webhook:URL or file:PATH "
+                           "(default: sound, plus ses unless -n is given)")
+    parser.add_argument("--notify-window", type=float, default=10.0,
+                      help="Merge notifications arriving within this many seconds into one message (default: 10)")
+    parser.add_argument("--notify-retries", type=int, default=3,
+                      help="Retries with backoff for a failed notification (default: 3)")
+    parser.add_argument("--smtp-host", help="SMTP server for the smtp sink")
+    parser.add_argument("--smtp-port", type=int, default=587, help="SMTP server port (default: 587, 465 for SSL)")
+    parser.add_argument("--smtp-user", help="SMTP user name, also used as the sender address")
+    parser.add_argument("--smtp-password", help="SMTP password")
+    parser.add_argument("--serve", type=int, metavar="PORT",
+                      help="Daemon mode: monitor and publish live availability on a local HTTP/SSE API on PORT")
+    parser.add_argument("--serve-host", default="127.0.0.1",
+                      help="Address for --serve to listen on (default: 127.0.0.1)")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                      help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics (default: off)")
+    parser.add_argument("--metrics-json",
+                      help="Write all metrics to this JSON file after every check")
+    parser.add_argument("--api-base", default=DEFAULT_API_BASE,
+                      help=f"Base URL of the HSA API, e.g. a local mock server (default: {DEFAULT_API_BASE})")
+    parser.add_argument("--pool-size", type=int, default=10,
+                      help="Maximum pooled keep-alive connections per host (default: 10)")
+    parser.add_argument("--connect-timeout", type=float, default=5.0,
+                      help="Connect timeout in seconds for API calls (default: 5)")
+    parser.add_argument("--read-timeout", type=float, default=30.0,
+                      help="Read timeout in seconds for API calls (default: 30)")
+    parser.add_argument("--retries", type=int, default=3,
+                      help="Retries with backoff on 5xx and connection resets (default: 3)")
+    parser.add_argument("--engine", choices=["sync", "async"], default="sync",
+                      help="Scan engine: sync checks one location at a time, async fans out requests (default: sync)")
+    parser.add_argument("--concurrency", type=int, default=8,
+                      help="Maximum concurrent requests with --engine async (default: 8)")
+    parser.add_argument("--rps", type=float, default=5.0,
+                      help="Initial global requests-per-second budget with --engine async (default: 5)")
+    parser.add_argument("--max-rps", type=float, default=10.0,
+                      help="Upper bound for the adaptive request rate (default: 10)")
+    parser.add_argument("--scan-deadline", type=float, default=0,
+                      help="Stop a check after this many seconds and check the unfinished locations first next time (default: 0, no deadline)")
+    parser.add_argument("--hedge", action="store_true",
+                      help="Hedge slow available-slot requests with a duplicate, using whichever answers first")
+    parser.add_argument("--hedge-percentile", type=float, default=95,
+                      help="Send the duplicate once a request is slower than this latency percentile (default: 95)")
+    parser.add_argument("--hedge-budget", type=float, default=0.1,
+                      help="Maximum duplicates as a fraction of hedgeable requests (default: 0.1)")
+    parser.add_argument("--token-cache", default=".hsa-tokens.json",
+                      help="File caching sign-in tokens and their expiry between runs (default: .hsa-tokens.json)")
+    parser.add_argument("--accounts",
+                      help="JSON file with several accounts ([{\"phone\": ..., \"password\": ...} or {\"token\": ...}]) to shard slot checks across")
+    parser.add_argument("--budget", type=int, default=0,
+                      help="Maximum location checks per monitor cycle, spent on the hottest locations first (default: 0, check all)")
+    parser.add_argument("--cache-ttl", type=parse_ttls, default="periods=3600,batches=600,locations=1800",
+                      help="Discovery cache TTLs in seconds per endpoint (default: periods=3600,batches=600,locations=1800)")
+    parser.add_argument("--cache-size", type=int, default=256,
+                      help="Maximum number of cached discovery responses (default: 256)")
+    parser.add_argument("--limiter-state", default=".hsa-limiter-state.json",
+                      help="File that keeps the adaptive rate limiter state between runs (default: .hsa-limiter-state.json)")
+    parser.add_argument("--state-file", default=".hsa-state.json",
+                      help="Snapshot of discovery, slot, scheduler, limiter and token state for warm restarts "
+                           "(default: .hsa-state.json, empty to disable)")
+    parser.add_argument("--state-max-age", type=float, default=24.0,
+                      help="Ignore a state snapshot older than this many hours (default: 24)")
+    parser.add_argument("--cluster-db", metavar="PATH",
+                      help="Shared SQLite database through which several checkers split locations into leased shards")
+    parser.add_argument("--node-id", help="Name of this checker in the cluster (default: HOSTNAME-PID)")
+    parser.add_argument("--shards", type=int, default=16, help="Number of location shards in the cluster (default: 16)")
+    parser.add_argument("--lease-ttl", type=float, default=60.0,
+                      help="Seconds a shard lease or node heartbeat stays valid without renewal (default: 60)")
+    parser.add_argument("--record", metavar="FILE",
+                      help="Record every API request and response with timestamps to a gzipped JSON lines file")
+    parser.add_argument("--replay", metavar="FILE",
+                      help="Answer API calls from a --record file instead of the network and report detection latency")
+    parser.add_argument("--speed", type=float, default=1.0,
+                      help="Replay speed, e.g. 10 or 100 for a time-compressed replay (default: 1)")
+    parser.add_argument("--log-flush-every", type=int, default=500,
+                      help="Flush the results files after this many buffered records (default: 500, and after every check)")
+    parser.add_argument("--log-max-mb", type=float, default=10,
+                      help="Rotate and gzip a results file once it exceeds this size in MB (default: 10)")
+    parser.add_argument("--log-max-hours", type=float, default=24,
+                      help="Rotate and gzip the results files after this many hours (default: 24)")
+    parser.add_argument("--log-keep", type=int, default=10,
+                      help="Number of rotated results files to keep per file (default: 10)")
+    parser.add_argument("--history-db", default="hsa-history.sqlite3",
+                      help="SQLite database recording every slot observation (default: hsa-history.sqlite3)")
+    parser.add_argument("--no-history", action="store_true",
+                      help="Do not record slot observations")
+    
+    subparsers = parser.add_subparsers(dest="command")
+    history_parser = subparsers.add_parser("history", help="Query recorded slot availability history")
+    history_parser.add_argument("--db", default="hsa-history.sqlite3",
+                      help="History database to query (default: hsa-history.sqlite3)")
+    history_parser.add_argument("--location", help="Only report this location ID")
+    history_parser.add_argument("--batch", help="Only report this batch code")
+    history_parser.add_argument("--hours", type=float, default=24,
+                      help="How far back to look in hours (default: 24)")
+    history_parser.add_argument("--report", choices=["openings", "durations", "all"], default="all",
+                      help="Report seat openings, how long seats stay open, or both (default: all)")
+
+    return parser.parse_args(argv)
+
+def endpoint_name(url: str) -> str:
+    """Return the last path segment of an API URL, e.g. available-slot"""
+    return url.split('?', 1)[0].rstrip('/').rsplit('/', 1)[-1]
+
+class Metrics:
+    """Thread-safe counters, gauges and histograms, rendered for Prometheus or as JSON"""
+    
+    LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    DURATION_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+    DETECTION_BUCKETS = (5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+    
+    def __init__(self):
+        """Create an empty registry"""
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.server = None
+    
+    @staticmethod
+    def _key(name: str, labels: dict) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+    
+    def inc(self, name: str, value: float = 1.0, **labels):
+        """Add `value` to a counter"""
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+    
+    def set(self, name: str, value: float, **labels):
+        """Set a gauge"""
+        with self.lock:
+            self.gauges[self._key(name, labels)] = float(value)
+    
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels):
+        """Add one observation to a histogram"""
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": buckets, "counts": [0] * len(buckets),
+                                                    "sum": 0.0, "count": 0}
+            for index, bound in enumerate(histogram["buckets"]):
+                if value <= bound:
+                    histogram["counts"][index] += 1
+                    break
+            histogram["sum"] += value
+            histogram["count"] += 1
+    
+    @staticmethod
+    def _labels(labels: Tuple[Tuple[str, str], ...], extra: Tuple[str, str] = None) -> str:
+        pairs = list(labels) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+        escaped = (k + '="' + v.replace('\\', '\\\\').replace('"', '\\"') + '"' for k, v in pairs)
+        return "{" + ",".join(escaped) + "}"
+    
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for kind, series in (("counter", self.counters), ("gauge", self.gauges)):
+                typed = set()
+                for (name, labels), value in sorted(series.items()):
+                    if name not in typed:
+                        lines.append(f"# TYPE {name} {kind}")
+                        typed.add(name)
+                    lines.append(f"{name}{self._labels(labels)} {value!r}")
+            typed = set()
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._labels(labels, ('le', f'{bound:g}'))} {cumulative}")
+                lines.append(f"{name}_bucket{self._labels(labels, ('le', '+Inf'))} {histogram['count']}")
+                lines.append(f"{name}_sum{self._labels(labels)} {histogram['sum']!r}")
+                lines.append(f"{name}_count{self._labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+    
+    def to_dict(self) -> dict:
+        """Return all metrics as plain JSON-serialisable data"""
+        def series_name(name, labels):
+            return name + self._labels(labels)
+        with self.lock:
+            return {
+                "timestamp": time.time(),
+                "counters": {series_name(*key): value for key, value in sorted(self.counters.items())},
+                "gauges": {series_name(*key): value for key, value in sorted(self.gauges.items())},
+                "histograms": {series_name(*key): {
+                    "count": h["count"],
+                    "sum": h["sum"],
+                    "mean": h["sum"] / h["count"] if h["count"] else 0.0,
+                    "buckets": dict(zip((f"{b:g}" for b in h["buckets"]), h["counts"]))
+                } for key, h in sorted(self.histograms.items())}
+            }
+    
+    def dump(self, path: str):
+        """Atomically write to_dict() to a JSON file"""
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.to_dict(), f, indent=2)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: Could not write metrics to {path}: {str(e)}")
+    
+    def serve(self, port: int, host: str = "127.0.0.1") -> bool:
+        """Serve render() on http://host:port/metrics from a background thread"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        try:
+            self.server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            print(f"Warning: Could not serve metrics on {host}:{port}: {str(e)}")
+            return False
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="hsa-metrics", daemon=True).start()
+        print(f"Serving metrics on http://{host}:{port}/metrics")
+        return True
+    
+    def close(self):
+        """Stop the metrics server if it is running"""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+class HTTPTransport:
+    """Pooled keep-alive HTTP transport shared by all API calls"""
+    
+    RETRY_STATUSES = (500, 502, 503, 504)
+    
+    def __init__(self, pool_size: int = 10, connect_timeout: float = 5.0, read_timeout: float = 30.0,
+                 retries: int = 3, backoff: float = 0.5, recorder: 'TrafficRecorder' = None):
+        """Create a session whose connections are reused across calls and monitor cycles"""
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=frozenset(['GET', 'POST']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._scan_start = (0, 0)
+        self.first_requests = {}
+        self.recorder = recorder
+    
+    def request(self, method: str, url: str, headers: dict = None, json: dict = None) -> 'requests.Response':
+        """Send a request over the pooled session"""
+        started = time.perf_counter()
+        self.first_requests.setdefault(endpoint_name(url), started)
+        response = self.session.request(method.upper(), url, headers=headers, json=json, timeout=self.timeout)
+        if self.recorder:
+            self.recorder.record(method, url, response, time.perf_counter() - started)
+        return response
+    
+    def host_stats(self) -> Dict[str, Dict[str, int]]:
+        """Return request and handshake counters per host"""
+        stats = {}
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                host = f"{pool.scheme}://{pool.host}:{pool.port}"
+                entry = stats.setdefault(host, {"requests": 0, "handshakes": 0})
+                entry["requests"] += pool.num_requests
+                entry["handshakes"] += pool.num_connections
+        return stats
+    
+    def totals(self) -> Tuple[int, int]:
+        """Return (requests, handshakes) summed over all hosts"""
+        stats = self.host_stats().values()
+        return sum(s["requests"] for s in stats), sum(s["handshakes"] for s in stats)
+    
+    def start_scan(self):
+        """Remember the counters at the start of a scan"""
+        self._scan_start = self.totals()
+    
+    def scan_stats(self) -> Dict[str, float]:
+        """Return pool statistics for the scan started by start_scan()"""
+        total_requests, total_handshakes = self.totals()
+        requests_made = total_requests - self._scan_start[0]
+        handshakes = total_handshakes - self._scan_start[1]
+        reuse_ratio = 1 - handshakes / requests_made if requests_made else 0.0
+        return {
+            "requests": requests_made,
+            "handshakes": handshakes,
+            "reuse_ratio": max(reuse_ratio, 0.0),
+            "total_requests": total_requests,
+            "total_handshakes": total_handshakes
+        }
+    
+    def close(self):
+        """Close all pooled connections"""
+        self.session.close()
+
+def request_key(url: str) -> str:
+    """Path and query of a URL, so recordings replay against any --api-base"""
+    parts = urllib.parse.urlsplit(url)
+    return f"{parts.path}?{parts.query}" if parts.query else parts.path
+
+def slot_availability(body: str) -> Dict[str, int]:
+    """Map slot IDs to free seats in an available-slot response body"""
+    try:
+        slots = json.loads(body)
+    except ValueError:
+        return {}
+    if not isinstance(slots, list):
+        return {}
+    return {str(slot.get('id')): max(int(slot.get('numberOfSeats', 0)) - int(slot.get('registeredSlots', 0)), 0)
+            for slot in slots}
+
+class TrafficRecorder:
+    """Gzipped JSON lines log of every API request and response, for --replay
+    
+    Each line holds the seconds since recording started, the request, the
+    response status, headers and body, and how long the response took.
+    Sign-in responses are stored without the token.
+    """
+    
+    HEADERS = ("ETag", "Last-Modified", "Retry-After", "Content-Type")
+    
+    def __init__(self, path: str, api_base: str):
+        """Start a new recording at `path`"""
+        self.path = path
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.count = 0
+        self.file = gzip.open(path, 'wt', encoding='utf-8')
+        self._write({"type": "header", "version": 1, "api_base": api_base, "started_at": time.time()})
+    
+    def record(self, method: str, url: str, response: 'requests.Response', latency: float):
+        """Append one exchange"""
+        body = response.text
+        if endpoint_name(url) == "sign-in":
+            body = json.dumps({"token": "recorded"})
+        self._write({
+            "t": round(time.monotonic() - self.started - latency, 4),
+            "latency": round(latency, 4),
+            "method": method.upper(),
+            "url": request_key(url),
+            "status": response.status_code,
+            "headers": {name: response.headers[name] for name in self.HEADERS if name in response.headers},
+            "body": body
+        })
+    
+    def _write(self, entry: dict):
+        """Write one line"""
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + "\n")
+            self.count += 1
+    
+    def flush(self):
+        """Make everything recorded so far readable even if the process is killed"""
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+    
+    def close(self):
+        """Finish the gzip stream"""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+class VirtualClock:
+    """Clock with the time module's interface that runs `speed` times faster than real time
+    
+    --replay hands it to the rate limiters, poll scheduler, discovery cache,
+    worker pool and scan deadline of its checker, so pacing, intervals and
+    expiry follow the recording's timeline at the chosen speed. Everything
+    else in the process keeps the real clock.
+    """
+    
+    def __init__(self, real_time, speed: float, epoch: float):
+        """Start the clock at `epoch` (wall time of the recording's start)"""
+        self.real = real_time
+        self.speed = max(speed, 0.001)
+        self.epoch = epoch
+        self.start_monotonic = real_time.monotonic()
+        self.start_perf = real_time.perf_counter()
+    
+    def elapsed(self) -> float:
+        """Virtual seconds since the clock started"""
+        return (self.real.monotonic() - self.start_monotonic) * self.speed
+    
+    def monotonic(self) -> float:
+        return self.start_monotonic + self.elapsed()
+    
+    def perf_counter(self) -> float:
+        return self.start_perf + (self.real.perf_counter() - self.start_perf) * self.speed
+    
+    def time(self) -> float:
+        return self.epoch + self.elapsed()
+    
+    def sleep(self, seconds: float):
+        self.real.sleep(max(seconds, 0) / self.speed)
+    
+    def __getattr__(self, name: str):
+        return getattr(self.real, name)
+
+class ReplayTransport:
+    """Answers API calls from a TrafficRecorder file instead of the network
+    
+    A request made `t` virtual seconds into the replay gets the last response
+    recorded for the same path at or before `t`, after its recorded latency.
+    Every seat opening in the recording is tracked, so the report shows how
+    long after the recording first saw it the replayed checker did.
+    """
+    
+    def __init__(self, path: str):
+        """Load a recording and find the seat openings in it"""
+        self.path = path
+        self.header = {}
+        self.entries = {}
+        self.duration = 0.0
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry.get("type") == "header":
+                        self.header = entry
+                        continue
+                    self.entries.setdefault((entry["method"], entry["url"]), []).append(entry)
+                    self.duration = max(self.duration, entry["t"])
+            except EOFError:
+                # A recording cut short by a killed process is still usable up to its last flush
+                pass
+        for entries in self.entries.values():
+            entries.sort(key=lambda entry: entry["t"])
+        self.openings = self._find_openings()
+        self.clock = None
+        self.lock = threading.Lock()
+        self.served = 0
+        self._scan_start = 0
+        self.first_requests = {}
+    
+    def _find_openings(self) -> List[dict]:
+        """Slots whose free seats went from zero to some between two recorded responses"""
+        openings = []
+        for (method, url), entries in self.entries.items():
+            if endpoint_name(url) != "available-slot":
+                continue
+            previous = None
+            for index, entry in enumerate(entries):
+                if entry["status"] != 200:
+                    continue
+                seats = slot_availability(entry["body"])
+                if previous is not None:
+                    for slot_id, available in seats.items():
+                        if available > 0 and previous.get(slot_id, 0) == 0:
+                            openings.append({"url": url, "slot_id": slot_id, "index": index, "opened_at": entry["t"],
+                                             "seats": available, "closed_at": None, "detected_at": None})
+                for opening in openings:
+                    if (opening["url"] == url and opening["closed_at"] is None and opening["index"] < index
+                            and seats.get(opening["slot_id"], 0) == 0):
+                        opening["closed_at"] = entry["t"]
+                previous = seats
+        return sorted(openings, key=lambda opening: opening["opened_at"])
+    
+    def start(self, speed: float) -> VirtualClock:
+        """Start the replay clock"""
+        self.clock = VirtualClock(time, speed, self.header.get("started_at", time.time()))
+        return self.clock
+    
+    @property
+    def finished(self) -> bool:
+        """True once the replay has passed the end of the recording"""
+        return self.clock is not None and self.clock.elapsed() > self.duration
+    
+    def request(self, method: str, url: str, headers: dict = None, json: dict = None) -> 'requests.Response':
+        """Answer with the response recorded for this path as of the current virtual time"""
+        key = request_key(url)
+        now = self.clock.elapsed()
+        self.first_requests.setdefault(endpoint_name(url), time.perf_counter())
+        entries = self.entries.get((method.upper(), key))
+        if not entries:
+            return self._response(url, 404, {}, '{"message": "Not in recording"}')
+        
+        index = 0
+        for position, entry in enumerate(entries):
+            if entry["t"] > now:
+                break
+            index = position
+        entry = entries[index]
+        self.clock.sleep(entry["latency"])
+        with self.lock:
+            self.served += 1
+        
+        etag = entry["headers"].get("ETag")
+        if etag and (headers or {}).get("If-None-Match") == etag:
+            return self._response(url, 304, entry["headers"], "")
+        if entry["status"] == 200 and endpoint_name(url) == "available-slot":
+            self._detect(key, index, entry)
+        return self._response(url, entry["status"], entry["headers"], entry["body"])
+    
+    def _detect(self, url: str, index: int, entry: dict):
+        """Mark openings that this response shows as detected"""
+        seats = slot_availability(entry["body"])
+        received_at = self.clock.elapsed()
+        with self.lock:
+            for opening in self.openings:
+                if (opening["url"] == url and opening["detected_at"] is None and opening["index"] <= index
+                        and seats.get(opening["slot_id"], 0) > 0):
+                    opening["detected_at"] = received_at
+    
+    @staticmethod
+    def _response(url: str, status: int, headers: dict, body: str) -> 'requests.Response':
+        """Build a requests.Response as if it came over the network"""
+        response = requests.Response()
+        response.status_code = status
+        response.reason = "Replayed"
+        response.url = url
+        response.headers = requests.structures.CaseInsensitiveDict(headers)
+        response.encoding = 'utf-8'
+        response._content = body.encode('utf-8')
+        return response
+    
+    def host_stats(self) -> Dict[str, Dict[str, int]]:
+        """Replayed requests open no connections"""
+        return {"replay": {"requests": self.served, "handshakes": 0}}
+    
+    def totals(self) -> Tuple[int, int]:
+        return self.served, 0
+    
+    def start_scan(self):
+        self._scan_start = self.served
+    
+    def scan_stats(self) -> Dict[str, float]:
+        return {"requests": self.served - self._scan_start, "handshakes": 0, "reuse_ratio": 1.0,
+                "total_requests": self.served, "total_handshakes": 0}
+    
+    def report(self) -> List[str]:
+        """Describe how quickly each seat opening in the recording was detected"""
+        latencies = []
+        lines = []
+        for opening in self.openings:
+            where = f"slot {opening['slot_id']} at {opening['url'].split('locationId=')[-1]}"
+            if opening["detected_at"] is not None:
+                latency = max(opening["detected_at"] - opening["opened_at"], 0.0)
+                latencies.append(latency)
+                lines.append(f"  +{opening['opened_at']:.1f}s {where}: detected after {latency:.2f}s")
+            else:
+                lasted = "" if opening["closed_at"] is None else f", closed after {opening['closed_at'] - opening['opened_at']:.1f}s"
+                lines.append(f"  +{opening['opened_at']:.1f}s {where}: missed{lasted}")
+        summary = [f"Replayed {self.duration:.1f}s of traffic from {self.path}: {len(self.openings)} seat opening(s), "
+                   f"{len(latencies)} detected, {len(self.openings) - len(latencies)} missed"]
+        if latencies:
+            import statistics
+            latencies.sort()
+            p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+            summary.append(f"Detection latency: median {statistics.median(latencies):.2f}s, p95 {p95:.2f}s, "
+                           f"max {latencies[-1]:.2f}s")
+        return summary + lines
+    
+    def close(self):
+        pass
+
+class RateLimiter:
+    """Thread-safe token bucket shared by concurrent requests"""
+    
+    def __init__(self, rate: float, burst: float = 1.0, clock=time):
+        """Allow `rate` requests per second with bursts of up to `burst` requests, timed by `clock`"""
+        self.clock = clock
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = clock.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self, cancelled: threading.Event = None) -> bool:
+        """Block until a request may be sent; False if `cancelled` was set before a token was taken"""
+        if self.rate <= 0:
+            return not (cancelled and cancelled.is_set())
+        while True:
+            if cancelled is not None and cancelled.is_set():
+                return False
+            with self.lock:
+                now = self.clock.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            self.clock.sleep(wait)
+
+class AdaptiveRateLimiter(RateLimiter):
+    """Token bucket whose rate follows server health (AIMD)
+    
+    The rate grows additively while responses are fast and healthy, is halved
+    on HTTP 429/503 and honours Retry-After. The rate at which the server last
+    throttled us is kept as a ceiling so we probe just below it, and growth
+    stops while an endpoint answers much slower than its usual latency.
+    Decreases happen at most once per DECREASE_INTERVAL, so a burst of
+    concurrent responses to the same overload only backs off once.
+    """
+    
+    THROTTLE_STATUSES = (429, 503)
+    MIN_RATE = 0.05
+    INCREASE = 0.05
+    DECREASE = 0.5
+    HEADROOM = 0.9
+    SLOW_FACTOR = 2.0
+    DECREASE_INTERVAL = 1.0
+    
+    def __init__(self, rate: float, max_rate: float, burst: float = 1.0, clock=time):
+        """Start at `rate` requests per second and never exceed `max_rate`"""
+        self.max_rate = max(max_rate, self.MIN_RATE)
+        super().__init__(min(max(rate, self.MIN_RATE), self.max_rate), burst, clock)
+        self.start_rate = self.rate
+        self.ceiling = None
+        self.backoff_events = 0
+        self.latency = {}
+        self.base_latency = {}
+        self.healthy_streak = 0
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+    
+    def acquire(self, cancelled: threading.Event = None) -> bool:
+        """Block until a request may be sent, honouring any Retry-After pause"""
+        wait = self.blocked_until - self.clock.monotonic()
+        if wait > 0:
+            self.clock.sleep(wait)
+        return super().acquire(cancelled)
+    
+    def record(self, status: Optional[int], latency: float, retry_after: Optional[float] = None,
+               endpoint: str = ''):
+        """Adapt the rate to the outcome of one request to an endpoint"""
+        with self.lock:
+            if status in self.THROTTLE_STATUSES:
+                self._backoff(retry_after)
+                return
+            if status is None or status >= 500:
+                self.healthy_streak = 0
+                return
+            
+            average = self.latency.get(endpoint)
+            average = latency if average is None else 0.8 * average + 0.2 * latency
+            self.latency[endpoint] = average
+            base = self.base_latency.get(endpoint)
+            if base is None or latency < base:
+                base = latency
+            else:
+                # Let the baseline drift up slowly so one fast outlier does not pin it
+                base += 0.01 * (latency - base)
+            self.base_latency[endpoint] = base
+            
+            if average > base * self.SLOW_FACTOR:
+                # The server is queueing our requests: stop growing, and ease off
+                # before it starts throttling if the slowdown is severe
+                if average > base * self.SLOW_FACTOR * 2 and self._may_decrease():
+                    self.rate = max(self.MIN_RATE, self.rate * 0.9)
+                self.healthy_streak = 0
+                return
+            
+            self.healthy_streak += 1
+            limit = self.max_rate
+            if self.ceiling is not None:
+                if self.healthy_streak % 50 == 0:
+                    self.ceiling *= 1.05
+                limit = min(limit, self.ceiling * self.HEADROOM)
+            self.rate = min(limit, self.rate + self.INCREASE)
+    
+    def _may_decrease(self) -> bool:
+        """Return True (and start a new interval) if the rate may be lowered now"""
+        now = self.clock.monotonic()
+        if now - self.last_decrease < self.DECREASE_INTERVAL:
+            return False
+        self.last_decrease = now
+        return True
+    
+    def _backoff(self, retry_after: Optional[float]):
+        """Halve the rate after the server throttled us"""
+        self.healthy_streak = 0
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, self.clock.monotonic() + retry_after)
+        if not self._may_decrease():
+            return
+        self.ceiling = self.rate
+        self.rate = max(self.MIN_RATE, self.rate * self.DECREASE)
+        self.tokens = min(self.tokens, 0.0)
+        self.backoff_events += 1
+    
+    def to_dict(self) -> dict:
+        """Return the state worth keeping between runs"""
+        return {
+            "rate": self.rate,
+            "ceiling": self.ceiling,
+            "backoff_events": self.backoff_events,
+            "latency": self.latency,
+            "base_latency": self.base_latency,
+            "saved_at": time.time()
+        }
+    
+    def load_dict(self, state: dict):
+        """Restore state saved by to_dict(); the saved rate never exceeds the starting rate asked for now"""
+        self.rate = min(max(float(state.get("rate") or self.rate), self.MIN_RATE), self.start_rate)
+        self.ceiling = state.get("ceiling")
+        self.backoff_events = int(state.get("backoff_events", 0))
+        self.latency = dict(state.get("latency") or {})
+        self.base_latency = dict(state.get("base_latency") or {})
+    
+    def load(self, path: str) -> bool:
+        """Load state from a JSON file if it exists"""
+        if not path or not os.path.exists(path):
+            return False
+        try:
+            with open(path, 'r') as f:
+                self.load_dict(json.load(f))
+            return True
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Warning: Could not load rate limiter state from {path}: {str(e)}")
+            return False
+    
+    def save(self, path: str):
+        """Atomically save state to a JSON file"""
+        if not path:
+            return
+        temp_path = f"{path}.tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(self.to_dict(), f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Warning: Could not save rate limiter state to {path}: {str(e)}")
+    
+    def describe(self) -> str:
+        """Return a one-line summary for verbose output"""
+        ceiling = f", throttled at {self.ceiling:.2f} req/s" if self.ceiling else ""
+        latency = ""
+        if self.latency:
+            average = sum(self.latency.values()) / len(self.latency)
+            latency = f", mean latency {average * 1000:.0f} ms"
+        return f"{self.rate:.2f} req/s{ceiling}{latency}, {self.backoff_events} backoff event(s)"
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def token_expiry(token: str) -> Optional[float]:
+    """Return the expiry timestamp of a JWT bearer token, or None if it has none"""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get('exp')
+        return float(exp) if exp else None
+    except (IndexError, ValueError, TypeError, AttributeError):
+        return None
+
+class TokenCache:
+    """Sign-in tokens and their expiry, kept on disk between runs"""
+    
+    def __init__(self, path: str):
+        """Load the cache file if it exists"""
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not load token cache from {path}: {str(e)}")
+    
+    def get(self, key: str) -> Optional[dict]:
+        """Return the cached {"token", "expires_at"} entry for an account"""
+        with self.lock:
+            return self.entries.get(key)
+    
+    def merge(self, entries: Dict[str, dict]):
+        """Adopt tokens that outlive the ones already cached, e.g. from a state snapshot"""
+        for key, entry in entries.items():
+            current = self.get(key)
+            if entry.get("token") and (current is None or entry.get("expires_at", 0) > current.get("expires_at", 0)):
+                self.put(key, entry["token"], entry["expires_at"])
+    
+    def put(self, key: str, token: Optional[str], expires_at: float):
+        """Store or, with token=None, remove an account's token and write the file atomically"""
+        if not self.path:
+            return
+        with self.lock:
+            if token:
+                self.entries[key] = {"token": token, "expires_at": expires_at}
+            else:
+                self.entries.pop(key, None)
+            try:
+                temp_path = f"{self.path}.tmp"
+                fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(self.entries, f)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                print(f"Warning: Could not save token cache to {self.path}: {str(e)}")
+
+class TokenManager:
+    """Lifecycle of one account's bearer token
+    
+    Tokens are reused from the on-disk cache while they are valid, refreshed
+    shortly before they expire, and refreshed once when the server answers
+    401. Concurrent callers that hit a stale token share a single sign-in.
+    After a failed sign-in no new attempt is made for a backoff period that
+    doubles with every consecutive failure.
+    """
+    
+    REFRESH_MARGIN = 300
+    DEFAULT_TTL = 6 * 3600
+    FAILURE_BACKOFF = 30.0
+    MAX_FAILURE_BACKOFF = 900.0
+    
+    def __init__(self, key: str, cache: TokenCache, sign_in=None, token: str = None):
+        """Manage the token of the account `key`; sign_in() returns a new token or None"""
+        self.key = key
+        self.cache = cache
+        self.sign_in = sign_in
+        self.lock = threading.Lock()
+        self.token = None
+        self.expires_at = 0.0
+        self.sign_ins = 0
+        self.failures = 0
+        self.failed_at = 0.0
+        self.retry_at = 0.0
+        if token:
+            self._set(token, save=False)
+    
+    def _set(self, token: str, save: bool = True):
+        """Use a new token and remember when it expires"""
+        self.token = token
+        self.expires_at = token_expiry(token) or time.time() + self.DEFAULT_TTL
+        if save:
+            self.cache.put(self.key, token, self.expires_at)
+    
+    def load_cached(self) -> bool:
+        """Use the cached token if it is still comfortably valid"""
+        entry = self.cache.get(self.key)
+        if not entry or entry.get("expires_at", 0) - self.REFRESH_MARGIN <= time.time():
+            return False
+        self.token = entry["token"]
+        self.expires_at = entry["expires_at"]
+        return True
+    
+    @property
+    def can_refresh(self) -> bool:
+        """True if the manager can sign in again on its own"""
+        return self.sign_in is not None
+    
+    @property
+    def backing_off(self) -> bool:
+        """True while sign-ins are suspended after a failure"""
+        return time.time() < self.retry_at
+    
+    def ensure_fresh(self):
+        """Refresh the token ahead of time when it is about to expire"""
+        if (self.can_refresh and not self.backing_off
+                and self.expires_at - self.REFRESH_MARGIN <= time.time()):
+            self.refresh(self.token)
+    
+    def refresh(self, stale_token: Optional[str]) -> bool:
+        """Sign in again unless another caller already replaced `stale_token`
+        
+        Returns False without signing in while backing off after a failure.
+        """
+        with self.lock:
+            if self.token and self.token != stale_token:
+                return True
+            if not self.can_refresh or self.backing_off:
+                return False
+            self.sign_ins += 1
+            token = self.sign_in()
+            if not token:
+                self._failed()
+                return False
+            self.failures = 0
+            self.retry_at = 0.0
+            self._set(token)
+            return True
+    
+    def _failed(self):
+        """Suspend sign-ins for a period that doubles with each consecutive failure"""
+        self.failures += 1
+        self.failed_at = time.time()
+        delay = min(self.FAILURE_BACKOFF * 2 ** (self.failures - 1), self.MAX_FAILURE_BACKOFF)
+        self.retry_at = self.failed_at + delay
+        print(f"{self.key}: sign-in failed {self.failures} time(s) in a row, "
+              f"not signing in again for {delay:.0f}s")
+    
+    def invalidate(self):
+        """Forget a token the server rejected"""
+        self.cache.put(self.key, None, 0)
+
+class HedgePolicy:
+    """Hedged requests: send a duplicate of a slow request and use whichever answers first
+    
+    The duplicate is sent once a request has been outstanding longer than the
+    given percentile of recent latencies. Duplicates are capped at `budget`
+    times the number of requests so hedging cannot double the load.
+    """
+    
+    ENDPOINTS = ("available-slot",)
+    MIN_SAMPLES = 20
+    MIN_DELAY = 0.02
+    
+    def __init__(self, percentile: float = 95.0, budget: float = 0.1, metrics: Metrics = None):
+        """Create a policy with its own thread pool for the racing requests"""
+        self.percentile = min(max(percentile, 50.0), 99.9)
+        self.budget = max(budget, 0.0)
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.samples = deque(maxlen=500)
+        self.requests = 0
+        self.hedges = 0
+        self.wins = 0
+        self.executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hsa-hedge")
+    
+    def applies_to(self, method: str, url: str) -> bool:
+        """Only idempotent reads of the hedged endpoints are duplicated"""
+        return method == 'GET' and endpoint_name(url) in self.ENDPOINTS
+    
+    def delay(self) -> Optional[float]:
+        """Return how long to wait before hedging, or None until enough latencies are known"""
+        with self.lock:
+            if len(self.samples) < self.MIN_SAMPLES:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100.0))
+        return max(ordered[index], self.MIN_DELAY)
+    
+    def _timed(self, send):
+        """Run one attempt and record its latency, which excludes any rate limiter wait"""
+        start = time.perf_counter()
+        response = send()
+        with self.lock:
+            self.samples.append(time.perf_counter() - start)
+        return response
+    
+    def _take_hedge(self) -> bool:
+        """Reserve a duplicate request if the budget allows one"""
+        with self.lock:
+            if self.hedges >= self.budget * self.requests:
+                return False
+            self.hedges += 1
+        if self.metrics:
+            self.metrics.inc("hsa_hedged_requests_total", outcome="sent")
+        return True
+    
+    def _duplicate(self, send, acquire):
+        """Send the hedge once `acquire()` grants it a rate limiter token; None if it never does"""
+        if acquire is not None and not acquire():
+            return None
+        return self._timed(send)
+    
+    def call(self, send, acquire=None) -> 'requests.Response':
+        """Run `send()`, racing a second `send()` against it if the first is slow
+        
+        `send` must not wait for the rate limiter, so latencies measure the
+        server alone. `acquire()` is called for the duplicate's token, only
+        when a duplicate is actually sent.
+        """
+        with self.lock:
+            self.requests += 1
+        delay = self.delay()
+        if delay is None:
+            return self._timed(send)
+        
+        primary = self.executor.submit(self._timed, send)
+        try:
+            return primary.result(timeout=delay)
+        except FuturesTimeoutError:
+            pass
+        if not self._take_hedge():
+            return primary.result()
+        
+        hedge = self.executor.submit(self._duplicate, send, acquire)
+        error = None
+        for future in as_completed((primary, hedge)):
+            try:
+                response = future.result()
+            except requests.exceptions.RequestException as e:
+                error = e
+                continue
+            if response is None:
+                continue
+            if future is hedge:
+                with self.lock:
+                    self.wins += 1
+                if self.metrics:
+                    self.metrics.inc("hsa_hedged_requests_total", outcome="won")
+            return response
+        raise error
+    
+    def describe(self) -> str:
+        """Return a one-line summary for verbose output"""
+        delay = self.delay()
+        delay_text = f"p{self.percentile:g} delay {delay * 1000:.0f} ms" if delay is not None else "learning latency"
+        return f"{self.hedges} sent for {self.requests} requests, {self.wins} won, {delay_text}"
+    
+    def close(self):
+        """Stop the thread pool without waiting for losing requests"""
+        self.executor.shutdown(wait=False)
+
+class AccountWorker:
+    """One account with its own token, connection pool and rate limiter"""
+    
+    def __init__(self, name: str, transport: HTTPTransport, limiter: AdaptiveRateLimiter, base_headers: dict,
+                 token_cache: TokenCache, token: str = None, phone: str = None, password: str = None,
+                 api_base: str = DEFAULT_API_BASE, metrics: Metrics = None, hedge: HedgePolicy = None):
+        """Create a worker; call authenticate() if no token is given"""
+        self.name = name
+        self.api_base = api_base
+        self.metrics = metrics
+        self.hedge = hedge
+        self.transport = transport
+        self.limiter = limiter
+        self.base_headers = base_headers
+        self.phone = phone
+        self.password = password
+        sign_in = self._sign_in if phone and password else None
+        self.tokens = TokenManager(phone or name, token_cache, sign_in, token)
+        self.healthy = True
+        self.cooldown_until = 0.0
+        self.requests = 0
+    
+    @property
+    def token(self) -> Optional[str]:
+        """The current bearer token"""
+        return self.tokens.token
+    
+    def headers(self) -> dict:
+        """Return request headers carrying this account's token"""
+        return {**self.base_headers, "Authorization": f"Bearer {self.token}"}
+    
+    def request(self, method: str, url: str, data: dict = None, extra_headers: dict = None,
+                cancelled: threading.Event = None) -> 'requests.Response':
+        """Send an authenticated request, signing in again once and replaying it on 401
+        
+        Raises CancelledError if `cancelled` is set before the rate limiter lets it go.
+        """
+        self.tokens.ensure_fresh()
+        token = self.token
+        headers = {**self.headers(), **(extra_headers or {})}
+        if self.hedge and self.hedge.applies_to(method, url):
+            # The primary takes its token before the hedge timer starts, a duplicate only if one is sent
+            if not self.limiter.acquire(cancelled):
+                raise CancelledError()
+            response = self.hedge.call(lambda: self.transmit(method, url, headers, data),
+                                       lambda: self.limiter.acquire(cancelled))
+        else:
+            response = self.send(method, url, headers, data, cancelled)
+        
+        if response.status_code == 401 and self.tokens.can_refresh and not self.tokens.backing_off:
+            print(f"{self.name}: token rejected, signing in again...")
+            if self.tokens.refresh(token):
+                response = self.send(method, url, {**self.headers(), **(extra_headers or {})}, data, cancelled)
+            if response.status_code == 401:
+                self.tokens.invalidate()
+        return response
+    
+    def is_available(self) -> bool:
+        """True if the token works and the account is not cooling down after throttling"""
+        return self.healthy and self.limiter.clock.monotonic() >= self.cooldown_until
+    
+    def send(self, method: str, url: str, headers: dict, data: dict = None,
+             cancelled: threading.Event = None) -> 'requests.Response':
+        """Send a request once the rate limiter allows it and feed the outcome back"""
+        if not self.limiter.acquire(cancelled):
+            raise CancelledError()
+        return self.transmit(method, url, headers, data)
+    
+    def transmit(self, method: str, url: str, headers: dict, data: dict = None) -> 'requests.Response':
+        """Send a request that already has a rate limiter token and feed the outcome back"""
+        self.requests += 1
+        endpoint = endpoint_name(url)
+        start = time.perf_counter()
+        try:
+            response = self.transport.request(method, url, headers=headers, json=data)
+        except requests.exceptions.RequestException:
+            latency = time.perf_counter() - start
+            self.limiter.record(None, latency)
+            if self.metrics:
+                self.metrics.inc("hsa_requests_total", endpoint=endpoint, status="error")
+                self.metrics.observe("hsa_request_duration_seconds", latency, endpoint=endpoint)
+            raise
+        latency = time.perf_counter() - start
+        
+        # Throttling absorbed by transport retries still counts as a backoff signal
+        retries = getattr(response.raw, 'retries', None)
+        history = getattr(retries, 'history', None) or ()
+        for attempt in history:
+            if attempt.status in AdaptiveRateLimiter.THROTTLE_STATUSES:
+                self.limiter.record(attempt.status, 0.0)
+        
+        self.limiter.record(response.status_code, latency,
+                            parse_retry_after(response.headers.get('Retry-After')),
+                            endpoint=url.split('?', 1)[0])
+        
+        if self.metrics:
+            self.metrics.inc("hsa_requests_total", endpoint=endpoint, status=response.status_code)
+            self.metrics.observe("hsa_request_duration_seconds", latency, endpoint=endpoint)
+            if history:
+                self.metrics.inc("hsa_request_retries_total", len(history), endpoint=endpoint)
+        return response
+    
+    def authenticate(self) -> bool:
+        """Use a cached token if one is still valid, otherwise sign in"""
+        if self.tokens.load_cached():
+            expires = datetime.datetime.fromtimestamp(self.tokens.expires_at).strftime('%Y-%m-%d %H:%M:%S')
+            print(f"Using cached token for {self.phone} (expires {expires})")
+            return True
+        return self.tokens.refresh(None)
+    
+    def _sign_in(self) -> Optional[str]:
+        """Sign in with phone and password and return the new token"""
+        print(f"Authenticating with phone number {self.phone}...")
+        
+        auth_data = {"id": self.phone, "password": self.password}
+        
+        try:
+            response = self.send('POST', f"{self.api_base}/accounts/sign-in", self.base_headers, auth_data)
+            response.raise_for_status()
+            
+            auth_data = response.json()
+            token = auth_data.get('token')
+            
+            if not token:
+                print("Authentication failed. Check your phone number and password.")
+                print(f"Response: {response.text}")
+                return None
+            
+            print("Authentication successful!")
+            return token
+            
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Authentication failed: {str(e)}")
+            return None
+    
+    def describe(self) -> str:
+        """Return a one-line status for verbose output"""
+        if not self.healthy:
+            state = "token rejected"
+        elif self.limiter.clock.monotonic() < self.cooldown_until:
+            state = f"throttled for {self.cooldown_until - self.limiter.clock.monotonic():.0f}s"
+        else:
+            state = "healthy"
+        return f"{self.name}: {state}, {self.requests} requests, {self.limiter.rate:.2f} req/s"
+
+def load_accounts(path: str) -> List[dict]:
+    """Load the accounts file used by the multi-account worker pool"""
+    with open(path, 'r') as f:
+        accounts = json.load(f)
+    if not isinstance(accounts, list) or not all(isinstance(a, dict) for a in accounts):
+        raise ValueError("accounts file must contain a JSON list of objects")
+    for index, account in enumerate(accounts):
+        if not account.get('token') and not (account.get('phone') and account.get('password')):
+            raise ValueError(f"account #{index + 1} needs either a token or a phone and password")
+    return accounts
+
+class WorkerPool:
+    """Shards slot requests across several accounts and moves work off failing ones
+    
+    Each account works through its own shard with its own connection pool and
+    rate limiter. When a token is rejected or an account is throttled, its
+    unfinished URLs are redistributed over the remaining healthy accounts.
+    A URL whose request fails is retried on an account that has not tried it
+    yet; once every account has failed it, it is left to the primary account.
+    """
+    
+    THROTTLE_COOLDOWN = 300
+    
+    def __init__(self, workers: List[AccountWorker], clock=time):
+        """Create a pool over authenticated workers; deadlines are read from `clock`"""
+        self.workers = workers
+        self.clock = clock
+    
+    def fetch_all(self, urls: list, deadline: float = None) -> Dict[str, bytes]:
+        """Fetch every URL once across the healthy workers, until the monotonic deadline if given"""
+        results = {}
+        pending = deque(dict.fromkeys(urls))
+        tried = defaultdict(set)
+        lock = threading.Lock()
+        
+        while pending:
+            if deadline is not None and self.clock.monotonic() >= deadline:
+                break
+            workers = [w for w in self.workers if w.is_available()]
+            if not workers:
+                print(f"Warning: No healthy accounts left, {len(pending)} location(s) fall back to the primary account")
+                break
+            
+            shards = {worker: deque() for worker in workers}
+            exhausted = 0
+            for index, url in enumerate(pending):
+                candidates = [w for w in workers if w not in tried[url]]
+                if candidates:
+                    shards[candidates[index % len(candidates)]].append(url)
+                else:
+                    exhausted += 1
+            if exhausted:
+                print(f"Warning: {exhausted} location(s) failed on every account, falling back to the primary account")
+            pending = deque()
+            
+            with ThreadPoolExecutor(max_workers=len(workers)) as executor:
+                futures = [executor.submit(self._work, worker, shards[worker], pending, results, tried,
+                                           lock, deadline)
+                           for worker in workers]
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except RuntimeError as e:
+                        print(f"Warning: {e}: {e.__cause__!r}")
+        
+        return results
+    
+    def _work(self, worker: AccountWorker, shard: deque, pending: deque, results: dict, tried: dict,
+              lock: threading.Lock, deadline: float = None):
+        """Drain one worker's shard, handing the rest back if the worker fails or time runs out
+        
+        Raises RuntimeError naming the URL if fetching it fails unexpectedly.
+        """
+        while True:
+            with lock:
+                if not shard:
+                    return
+                if not worker.is_available() or (deadline is not None and self.clock.monotonic() >= deadline):
+                    pending.extend(shard)
+                    shard.clear()
+                    return
+                url = shard.popleft()
+                tried[url].add(worker)
+            
+            try:
+                done, payload = self._fetch(worker, url)
+            except Exception as e:
+                with lock:
+                    pending.extend(shard)
+                    shard.clear()
+                raise RuntimeError(f"Account {worker.name} failed to fetch {url}") from e
+            with lock:
+                if done:
+                    results[url] = payload
+                else:
+                    pending.append(url)
+    
+    def _fetch(self, worker: AccountWorker, url: str) -> Tuple[bool, Optional[bytes]]:
+        """Fetch one URL's raw body; returns (False, None) when another worker should retry it"""
+        try:
+            response = worker.request('GET', url)
+        except requests.exceptions.RequestException as e:
+            print(f"API call failed ({worker.name}), retrying on another account: {str(e)}")
+            return False, None
+        
+        if response.status_code in (401, 403):
+            worker.healthy = False
+            print(f"Account {worker.name} was rejected (HTTP {response.status_code}), moving its shard to healthy accounts")
+            return False, None
+        if response.status_code == 429:
+            cooldown = parse_retry_after(response.headers.get('Retry-After')) or self.THROTTLE_COOLDOWN
+            worker.cooldown_until = self.clock.monotonic() + cooldown
+            print(f"Account {worker.name} is throttled for {cooldown:.0f}s, moving its shard to healthy accounts")
+            return False, None
+        
+        try:
+            response.raise_for_status()
+            return True, response.content
+        except requests.exceptions.RequestException as e:
+            print(f"API call failed ({worker.name}), retrying on another account: {str(e)}")
+            return False, None
+    
+    def describe(self) -> List[str]:
+        """Return one status line per worker"""
+        return [worker.describe() for worker in self.workers]
+
+def parse_periods(value: str) -> Union[str, List[str]]:
+    """Parse --periods into 'all', 'first' or a list of period IDs"""
+    value = (value or '').strip()
+    if value in ("all", "first"):
+        return value
+    period_ids = [part.strip() for part in value.split(',') if part.strip()]
+    if not period_ids:
+        raise argparse.ArgumentTypeError("Expected all, first or comma-separated period IDs")
+    return list(dict.fromkeys(period_ids))
+
+def parse_ttls(value: str) -> Dict[str, float]:
+    """Parse 'endpoint=seconds,...' into a TTL mapping"""
+    ttls = dict(DiscoveryCache.DEFAULT_TTLS)
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        endpoint, _, seconds = item.partition('=')
+        if endpoint not in ttls:
+            raise argparse.ArgumentTypeError(f"Unknown cache endpoint '{endpoint}' (expected one of {', '.join(ttls)})")
+        ttls[endpoint] = float(seconds)
+    return ttls
+
+class DiscoveryCache:
+    """LRU cache with per-endpoint TTLs for period, batch and location lists
+    
+    Expired entries are kept so they can be revalidated with a conditional
+    request (ETag/Last-Modified) and served if the refresh fails.
+    """
+    
+    DEFAULT_TTLS = {"periods": 3600.0, "batches": 600.0, "locations": 1800.0}
+    
+    def __init__(self, ttls: Dict[str, float] = None, max_entries: int = 256, clock=time):
+        """Create an empty cache whose entries expire by `clock`"""
+        self.clock = clock
+        self.ttls = {**self.DEFAULT_TTLS, **(ttls or {})}
+        self.max_entries = max(1, max_entries)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "invalidated": 0}
+    
+    def get(self, url: str) -> Optional[dict]:
+        """Return the entry for a URL, fresh or stale, and mark it recently used"""
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is not None:
+                self.entries.move_to_end(url)
+            return entry
+    
+    def is_fresh(self, entry: dict) -> bool:
+        """Return True if the entry is still within its TTL"""
+        return self.clock.monotonic() < entry["expires"]
+    
+    def put(self, url: str, endpoint: str, payload, etag: str = None, last_modified: str = None):
+        """Store a response and evict the least recently used entries"""
+        with self.lock:
+            self.entries[url] = {
+                "endpoint": endpoint,
+                "payload": payload,
+                "etag": etag,
+                "last_modified": last_modified,
+                "expires": self.clock.monotonic() + self.ttls.get(endpoint, 0)
+            }
+            self.entries.move_to_end(url)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+    
+    def refresh(self, url: str):
+        """Restart the TTL of an entry the server confirmed as unchanged"""
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is not None:
+                entry["expires"] = self.clock.monotonic() + self.ttls.get(entry["endpoint"], 0)
+    
+    def invalidate(self, url: str):
+        """Drop an entry so the next lookup goes to the server"""
+        with self.lock:
+            if self.entries.pop(url, None) is not None:
+                self.stats["invalidated"] += 1
+    
+    def to_dict(self) -> List[dict]:
+        """Return the cached entries with wall-clock expiry, oldest first"""
+        offset = self.clock.time() - self.clock.monotonic()
+        with self.lock:
+            return [{"url": url, **entry, "expires": entry["expires"] + offset} for url, entry in self.entries.items()]
+    
+    def load_dict(self, entries: List[dict]):
+        """Restore entries saved by to_dict(); expired ones stay for revalidation"""
+        offset = self.clock.time() - self.clock.monotonic()
+        for entry in entries:
+            self.put(entry["url"], entry["endpoint"], entry["payload"], entry.get("etag"), entry.get("last_modified"))
+            with self.lock:
+                self.entries[entry["url"]]["expires"] = float(entry["expires"]) - offset
+    
+    def describe(self) -> str:
+        """Return a one-line summary for verbose output"""
+        stats = self.stats
+        return (f"{len(self.entries)} entries, {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['revalidated']} revalidated (304), {stats['invalidated']} invalidated")
+
+class SlotEvent:
+    """A change in the number of available seats of one slot"""
+    
+    OPENED = "opened"
+    CLOSED = "closed"
+    INCREASED = "increased"
+    DECREASED = "decreased"
+    
+    __slots__ = ("kind", "batch_code", "location_id", "slot_id", "name", "old", "new", "total")
+    
+    def __init__(self, kind: str, batch_code: str, location_id: str, slot_id: str, name: str,
+                 old: int, new: int, total: int):
+        self.kind = kind
+        self.batch_code = batch_code
+        self.location_id = location_id
+        self.slot_id = slot_id
+        self.name = name
+        self.old = old
+        self.new = new
+        self.total = total
+    
+    @property
+    def adds_seats(self) -> bool:
+        """True for events that make more seats available"""
+        return self.kind in (self.OPENED, self.INCREASED)
+    
+    def describe(self) -> str:
+        """Return a one-line description for the log"""
+        batch_prefix = f"[{self.batch_code}] " if self.batch_code else ""
+        return f"{batch_prefix}{self.name} (ID: {self.slot_id}) {self.kind}: {self.old} → {self.new}/{self.total}"
+
+class SlotResult:
+    """Seats of one slot as seen in an available-slot response"""
+    
+    __slots__ = ("slot_id", "name", "total", "registered")
+    
+    def __init__(self, slot_id: str, name: str, total: int, registered: int):
+        self.slot_id = slot_id
+        self.name = name
+        self.total = total
+        self.registered = registered
+    
+    @property
+    def available(self) -> int:
+        """Number of seats still free"""
+        return self.total - self.registered
+
+class LocationResult:
+    """Outcome of checking one location; truthy when any slot has seats
+    
+    With a `table`, the slots are read from the SlotStateTable only when a
+    consumer asks for them.
+    """
+    
+    __slots__ = ("batch_code", "batch_name", "location_id", "location_name", "_slots", "table", "events", "ok")
+    
+    def __init__(self, batch_code: str, batch_name: str, location_id: str, location_name: str, ok: bool = True,
+                 table: 'SlotStateTable' = None):
+        self.batch_code = batch_code
+        self.batch_name = batch_name
+        self.location_id = location_id
+        self.location_name = location_name
+        self._slots = None
+        self.table = table
+        self.events = []
+        self.ok = ok
+    
+    @property
+    def slots(self) -> List[SlotResult]:
+        """Seats of every slot at this location"""
+        if self._slots is None:
+            self._slots = self.table.slots(self.batch_code, self.location_id) if self.table else []
+        return self._slots
+    
+    @slots.setter
+    def slots(self, slots: List[SlotResult]):
+        self._slots = slots
+    
+    @property
+    def available_slots(self) -> List[SlotResult]:
+        """Slots that still have free seats"""
+        return [slot for slot in self.slots if slot.available > 0]
+    
+    def to_dict(self) -> dict:
+        """Return the result as plain JSON-serialisable data"""
+        return {
+            "batch_code": self.batch_code,
+            "location_id": self.location_id,
+            "location_name": self.location_name,
+            "ok": self.ok,
+            "slots": [
+                {"id": slot.slot_id, "name": slot.name, "available": slot.available, "total": slot.total}
+                for slot in self.slots
+            ],
+            "events": [
+                {"kind": event.kind, "slot_id": event.slot_id, "old": event.old, "new": event.new}
+                for event in self.events
+            ]
+        }
+    
+    def __bool__(self) -> bool:
+        if self._slots is None and self.table:
+            return self.table.has_seats(self.batch_code, self.location_id)
+        return any(slot.available > 0 for slot in self.slots)
+
+class BatchResult:
+    """Outcome of checking the locations of one batch; truthy when any location has seats"""
+    
+    __slots__ = ("batch_id", "batch_code", "batch_name", "locations")
+    
+    def __init__(self, batch_id: str, batch_code: str, batch_name: str):
+        self.batch_id = batch_id
+        self.batch_code = batch_code
+        self.batch_name = batch_name
+        self.locations = []
+    
+    @property
+    def locations_with_slots(self) -> List[LocationResult]:
+        """Locations that have at least one slot with free seats"""
+        return [location for location in self.locations if location]
+    
+    def __bool__(self) -> bool:
+        return any(self.locations)
+
+class ScanResult:
+    """Outcome of one run_check across all selected batches; truthy when seats were found"""
+    
+    __slots__ = ("batches", "started_at", "finished_at")
+    
+    def __init__(self):
+        self.batches = []
+        self.started_at = datetime.datetime.now()
+        self.finished_at = None
+    
+    @property
+    def available_locations(self) -> List[LocationResult]:
+        """Locations with free seats across all batches"""
+        return [location for batch in self.batches for location in batch.locations_with_slots]
+    
+    @property
+    def events(self) -> List['SlotEvent']:
+        """Slot transitions seen during this scan"""
+        return [event for batch in self.batches for location in batch.locations for event in location.events]
+    
+    def __bool__(self) -> bool:
+        return any(self.batches)
+
+def render_notification(result: ScanResult, batch_name: str = None, batch_code: str = None) -> Tuple[str, str, str]:
+    """Render the subject, text and HTML bodies of a notification from a scan result"""
+    subject = "HSA Exam Slots Available!"
+    timestamp = (result.finished_at or datetime.datetime.now()).strftime('%Y-%m-%d %H:%M:%S')
+    locations = result.available_locations
+    new_slots = {(e.batch_code, e.location_id, e.slot_id) for e in result.events if e.adds_seats}
+    
+    text_content = f"HSA Exam Slots Available as of {timestamp}\n\n"
+    html_content = "<html><body>"
+    html_content += "<h1>HSA Exam Slots Available!</h1>"
+    html_content += f"<p>As of {timestamp}, the following locations have available slots:</p>"
+    
+    if batch_name and batch_code:
+        text_content += f"Batch: {batch_name} (Code: {batch_code})\n\n"
+        html_content += f"<p><strong>Batch:</strong> {batch_name} (Code: {batch_code})</p>"
+    else:
+        text_content += "Multiple batches have available slots\n\n"
+        html_content += "<p><strong>Multiple batches have available slots</strong></p>"
+    
+    text_content += "Available slots summary:\n"
+    html_content += "<ul>"
+    
+    for location in locations:
+        batch_prefix = f"[{location.batch_code}] " if location.batch_code and not batch_code else ""
+        slots = location.available_slots
+        text_content += f"{batch_prefix}{location.location_name} (ID: {location.location_id}) has {len(slots)} available session(s):\n"
+        html_content += (f"<li>{batch_prefix}<strong>{location.location_name}</strong> "
+                         f"(ID: {location.location_id}): {len(slots)} available sessions<ul>")
+        for slot in slots:
+            is_new = (location.batch_code, location.location_id, slot.slot_id) in new_slots
+            marker = " (new)" if is_new else ""
+            text_content += f"  → {slot.name} (ID: {slot.slot_id}): {slot.available}/{slot.total}{marker}\n"
+            html_content += f"<li>{slot.name} (ID: {slot.slot_id}): {slot.available}/{slot.total}{marker}</li>"
+        html_content += "</ul></li>"
+    
+    text_content += "\n\nCheck https://id.hsa.edu.vn to register now."
+    html_content += "</ul>"
+    html_content += "<p>Visit <a href='https://id.hsa.edu.vn'>id.hsa.edu.vn</a> to register now!</p>"
+    html_content += "</body></html>"
+    
+    return subject, text_content, html_content
+
+def play_notification_sound():
+    """Play notification sound based on platform"""
+    import platform
+    import subprocess
+    system = platform.system()
+    if system == "Darwin":  # macOS
+        subprocess.Popen(['afplay', '/System/Library/Sounds/Submarine.aiff'])
+    elif system == "Linux":
+        if os.path.exists("/usr/bin/paplay"):
+            subprocess.Popen(['paplay', '/usr/share/sounds/freedesktop/stereo/complete.oga'])
+        elif os.path.exists("/usr/bin/aplay"):
+            subprocess.Popen(['aplay', '/usr/share/sounds/sound-icons/prompt.wav'])
+    elif system == "Windows":
+        subprocess.Popen(['powershell.exe', '-c', "(New-Object Media.SoundPlayer 'C:\\Windows\\Media\\notify.wav').PlaySync();"])
+
+class Notification:
+    """A rendered notification waiting to be delivered"""
+    
+    __slots__ = ("subject", "text", "html", "created_at")
+    
+    def __init__(self, subject: str, text: str, html: str):
+        self.subject = subject
+        self.text = text
+        self.html = html
+        self.created_at = datetime.datetime.now()
+    
+    @classmethod
+    def merge(cls, notifications: List['Notification']) -> 'Notification':
+        """Combine several notifications into one message, newest first"""
+        if len(notifications) == 1:
+            return notifications[0]
+        newest = notifications[::-1]
+        subject = f"{newest[0].subject} ({len(notifications)} updates)"
+        text = "\n\n--------------------\n\n".join(n.text for n in newest)
+        bodies = (n.html.replace("<html><body>", "").replace("</body></html>", "") for n in newest)
+        merged = cls(subject, text, "<html><body>" + "<hr>".join(bodies) + "</body></html>")
+        merged.created_at = notifications[0].created_at
+        return merged
+
+class SoundSink:
+    """Plays the platform notification sound"""
+    
+    name = "sound"
+    
+    def send(self, notification: Notification):
+        """Play the sound"""
+        play_notification_sound()
+    
+    def close(self):
+        pass
+
+class SESSink:
+    """Email through Amazon SES with one long-lived client"""
+    
+    name = "ses"
+    
+    def __init__(self, from_email: str, to_email: str, region: str = 'us-east-1'):
+        """Check that boto3 is available; raises ImportError if it is missing"""
+        if importlib.util.find_spec("boto3") is None:
+            raise ImportError("No module named 'boto3'")
+        self.region = region
+        self.client = None
+        self.from_email = from_email
+        self.to_email = to_email
+    
+    def send(self, notification: Notification):
+        """Send one email, creating the client on first use"""
+        if self.client is None:
+            import boto3
+            self.client = boto3.client('ses', region_name=self.region)
+        self.client.send_email(
+            Source=self.from_email,
+            Destination={'ToAddresses': [self.to_email]},
+            Message={
+                'Subject': {'Data': notification.subject, 'Charset': 'UTF-8'},
+                'Body': {
+                    'Text': {'Data': notification.text, 'Charset': 'UTF-8'},
+                    'Html': {'Data': notification.html, 'Charset': 'UTF-8'}
+                }
+            }
+        )
+        print(f"{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')} Email notification sent to {self.to_email}")
+    
+    def close(self):
+        pass
+
+class SMTPSink:
+    """Email through an SMTP server, keeping the connection open between messages"""
+    
+    name = "smtp"
+    
+    def __init__(self, host: str, port: int, user: str, password: str, to_email: str, from_email: str = None):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.to_email = to_email
+        self.from_email = from_email or user
+        self.connection = None
+    
+    def _connect(self) -> 'smtplib.SMTP':
+        """Return the open connection, reconnecting if the server dropped it"""
+        import smtplib
+        if self.connection is not None:
+            try:
+                if self.connection.noop()[0] == 250:
+                    return self.connection
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.close()
+        if self.port == 465:
+            connection = smtplib.SMTP_SSL(self.host, self.port, timeout=30)
+        else:
+            connection = smtplib.SMTP(self.host, self.port, timeout=30)
+            connection.ehlo()
+            if connection.has_extn('starttls'):
+                connection.starttls()
+                connection.ehlo()
+        if self.user and self.password:
+            connection.login(self.user, self.password)
+        self.connection = connection
+        return connection
+    
+    def send(self, notification: Notification):
+        """Send one email"""
+        import smtplib
+        from email.message import EmailMessage
+        message = EmailMessage()
+        message['Subject'] = notification.subject
+        message['From'] = self.from_email
+        message['To'] = self.to_email
+        message['Date'] = email.utils.formatdate(localtime=True)
+        message.set_content(notification.text)
+        message.add_alternative(notification.html, subtype='html')
+        self._connect().send_message(message)
+        print(f"{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')} Email notification sent to {self.to_email}")
+    
+    def close(self):
+        """Close the connection; a connection the server already dropped is just forgotten"""
+        import smtplib
+        if self.connection is not None:
+            try:
+                self.connection.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            finally:
+                self.connection = None
+
+class WebhookSink:
+    """POSTs notifications as JSON to a URL over a pooled session"""
+    
+    name = "webhook"
+    
+    def __init__(self, url: str, timeout: float = 10.0):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+    
+    def send(self, notification: Notification):
+        """POST one notification"""
+        response = self.session.post(self.url, timeout=self.timeout, json={
+            "subject": notification.subject,
+            "text": notification.text,
+            "html": notification.html,
+            "created_at": notification.created_at.isoformat()
+        })
+        response.raise_for_status()
+    
+    def close(self):
+        self.session.close()
+
+class FileSink:
+    """Appends notifications as JSON lines to a file, mainly for testing"""
+    
+    name = "file"
+    
+    def __init__(self, path: str):
+        self.path = path
+    
+    def send(self, notification: Notification):
+        """Append one notification"""
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({
+                "sent_at": datetime.datetime.now().isoformat(),
+                "created_at": notification.created_at.isoformat(),
+                "subject": notification.subject,
+                "text": notification.text
+            }, ensure_ascii=False) + "\n")
+    
+    def close(self):
+        pass
+
+class NotificationDispatcher:
+    """Delivers notifications from background threads so checks never wait on them
+    
+    Each sink has its own queue and thread. A sink sends at most one message
+    per `window` seconds: notifications arriving in between are merged into
+    the next message. Failed deliveries are retried with exponential backoff.
+    """
+    
+    def __init__(self, sinks: list, window: float = 10.0, retries: int = 3, backoff: float = 2.0,
+                 metrics: Metrics = None):
+        """Start one delivery thread per sink"""
+        self.sinks = sinks
+        self.window = window
+        self.retries = retries
+        self.backoff = backoff
+        self.metrics = metrics
+        self.stats = {sink.name: {"sent": 0, "merged": 0, "failed": 0} for sink in sinks}
+        self.queues = []
+        self.threads = []
+        for sink in sinks:
+            sink_queue = queue.Queue()
+            thread = threading.Thread(target=self._run, args=(sink, sink_queue), name=f"hsa-notify-{sink.name}",
+                                      daemon=True)
+            thread.start()
+            self.queues.append(sink_queue)
+            self.threads.append(thread)
+    
+    def submit(self, notification: Notification):
+        """Queue a notification for every sink and return immediately"""
+        for sink_queue in self.queues:
+            sink_queue.put(notification)
+    
+    def _run(self, sink, sink_queue: queue.Queue):
+        """Delivery loop of one sink"""
+        last_sent = 0.0
+        stopping = False
+        while not stopping:
+            notification = sink_queue.get()
+            if notification is None:
+                break
+            pending = [notification]
+            
+            # Gather everything that arrives before this sink may send again
+            while True:
+                remaining = last_sent + self.window - time.monotonic()
+                try:
+                    notification = sink_queue.get(timeout=remaining) if remaining > 0 else sink_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if notification is None:
+                    stopping = True
+                    break
+                pending.append(notification)
+            
+            self._deliver(sink, Notification.merge(pending), len(pending))
+            last_sent = time.monotonic()
+    
+    def _deliver(self, sink, notification: Notification, count: int):
+        """Send one message through a sink, retrying failures"""
+        stats = self.stats[sink.name]
+        for attempt in range(self.retries + 1):
+            try:
+                sink.send(notification)
+            except Exception as e:
+                if attempt < self.retries:
+                    time.sleep(self.backoff * 2 ** attempt)
+                    continue
+                print(f"Failed to deliver notification via {sink.name} after {attempt + 1} attempt(s): {str(e)}")
+                stats["failed"] += 1
+                if self.metrics:
+                    self.metrics.inc("hsa_notifications_total", sink=sink.name, outcome="failed")
+                return
+            stats["sent"] += 1
+            stats["merged"] += count - 1
+            if self.metrics:
+                self.metrics.inc("hsa_notifications_total", sink=sink.name, outcome="sent")
+                self.metrics.observe("hsa_notification_delay_seconds",
+                                     (datetime.datetime.now() - notification.created_at).total_seconds(),
+                                     Metrics.DURATION_BUCKETS, sink=sink.name)
+            return
+    
+    def describe(self) -> List[str]:
+        """Return one status line per sink for verbose output"""
+        return [f"{name}: {s['sent']} sent, {s['merged']} merged, {s['failed']} failed" for name, s in self.stats.items()]
+    
+    def close(self, timeout: float = 30.0):
+        """Deliver what is still queued, then stop the threads and release the sinks"""
+        for sink_queue in self.queues:
+            sink_queue.put(None)
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        for sink in self.sinks:
+            sink.close()
+
+class SlotStateTable:
+    """Last known seats of every slot in array-backed columns, diffed against each changed response
+    
+    Each location owns a contiguous block of rows in parallel columns of
+    slot IDs, names, total and registered seats. A response that hashes to
+    the location's last fingerprint is not looked at again. A changed one is
+    diffed in one pass over its block, rewritten in place while the location
+    keeps the same slots. The columns are compacted once more than half of
+    their rows belong to replaced blocks.
+    """
+    
+    def __init__(self):
+        """Create an empty table"""
+        self.slot_ids = []
+        self.names = []
+        self.total = array('l')
+        self.registered = array('l')
+        self.blocks = {}
+        self.fingerprints = {}
+        self.observed_at = {}
+        self.garbage = 0
+    
+    def __len__(self) -> int:
+        """Number of slots tracked"""
+        return len(self.total) - self.garbage
+    
+    def last_observed(self, batch_code: str, location_id: str) -> Optional[float]:
+        """Return when a location's snapshot was last updated (epoch seconds)"""
+        return self.observed_at.get((str(batch_code), str(location_id)))
+    
+    def unchanged(self, batch_code: str, location_id: str, fingerprint: bytes) -> bool:
+        """True if a response body hashes to the fingerprint stored for this location, which marks it observed"""
+        key = (str(batch_code), str(location_id))
+        if fingerprint is None or self.fingerprints.get(key) != fingerprint:
+            return False
+        self.observed_at[key] = time.time()
+        return True
+    
+    def slots(self, batch_code: str, location_id: str) -> List[SlotResult]:
+        """Rebuild a location's slots from its block"""
+        start, count = self.blocks.get((str(batch_code), str(location_id)), (0, 0))
+        return [SlotResult(self.slot_ids[row], self.names[row], self.total[row], self.registered[row])
+                for row in range(start, start + count)]
+    
+    def has_seats(self, batch_code: str, location_id: str) -> bool:
+        """True if any slot of the location has free seats"""
+        start, count = self.blocks.get((str(batch_code), str(location_id)), (0, 0))
+        return any(self.total[row] > self.registered[row] for row in range(start, start + count))
+    
+    def update(self, batch_code: str, location_id: str, slots: List[Tuple[str, str, int, int]],
+               fingerprint: bytes = None) -> List[SlotEvent]:
+        """Replace a location's block with the (slot_id, name, total, registered) rows of a changed response
+        
+        Returns the changes since the previous response.
+        """
+        location_key = (str(batch_code), str(location_id))
+        total, registered = self.total, self.registered
+        block = self.blocks.get(location_key)
+        
+        # Slots of a location rarely change, so its rows are usually rewritten in place
+        previous = None
+        if block is not None:
+            start, count = block
+            if count != len(slots) or any(self.slot_ids[start + i] != slot[0] for i, slot in enumerate(slots)):
+                previous = {self.slot_ids[row]: (self.names[row], max(total[row] - registered[row], 0))
+                            for row in range(start, start + count)}
+                self.garbage += count
+                block = None
+        if block is None:
+            start = len(total)
+            self.blocks[location_key] = (start, len(slots))
+            for slot_id, name, _, _ in slots:
+                self.slot_ids.append(slot_id)
+                self.names.append(name)
+            total.extend([0] * len(slots))
+            registered.extend([0] * len(slots))
+        
+        events = []
+        for row, (slot_id, name, slot_total, slot_registered) in enumerate(slots, start):
+            if previous is None:
+                old = max(total[row] - registered[row], 0)
+            else:
+                old = previous.pop(slot_id, (None, 0))[1]
+            total[row] = slot_total
+            registered[row] = slot_registered
+            self.names[row] = name
+            new = max(slot_total - slot_registered, 0)
+            if old == new:
+                continue
+            if old == 0:
+                kind = SlotEvent.OPENED
+            elif new == 0:
+                kind = SlotEvent.CLOSED
+            elif new > old:
+                kind = SlotEvent.INCREASED
+            else:
+                kind = SlotEvent.DECREASED
+            events.append(SlotEvent(kind, batch_code, location_id, slot_id, name, old, new, slot_total))
+        
+        # Slots missing from the new response are gone, so their seats are too
+        for slot_id, (name, old) in (previous or {}).items():
+            if old > 0:
+                events.append(SlotEvent(SlotEvent.CLOSED, batch_code, location_id, slot_id, name, old, 0, 0))
+        
+        self.fingerprints[location_key] = fingerprint
+        self.observed_at[location_key] = time.time()
+        if self.garbage > len(total) // 2:
+            self._compact()
+        return events
+    
+    def _compact(self):
+        """Drop the rows of replaced blocks"""
+        slot_ids, names, total, registered = [], [], array('l'), array('l')
+        for key, (start, count) in self.blocks.items():
+            self.blocks[key] = (len(total), count)
+            slot_ids.extend(self.slot_ids[start:start + count])
+            names.extend(self.names[start:start + count])
+            total.extend(self.total[start:start + count])
+            registered.extend(self.registered[start:start + count])
+        self.slot_ids, self.names, self.total, self.registered = slot_ids, names, total, registered
+        self.garbage = 0
+    
+    def to_dict(self) -> dict:
+        """Return the table as JSON-friendly lists, one entry per location"""
+        return {"locations": [
+            [*key, (self.fingerprints.get(key) or b"").hex(), self.observed_at.get(key),
+             [[self.slot_ids[row], self.names[row], self.total[row], self.registered[row]]
+              for row in range(start, start + count)]]
+            for key, (start, count) in self.blocks.items()
+        ]}
+    
+    def load_dict(self, state: dict):
+        """Restore a table saved by to_dict()"""
+        for batch_code, location_id, fingerprint, observed_at, slots in state.get("locations", []):
+            self.update(batch_code, location_id, [(str(slot_id), name, int(total), int(registered))
+                                                  for slot_id, name, total, registered in slots],
+                        bytes.fromhex(fingerprint) if fingerprint else None)
+            if observed_at is not None:
+                self.observed_at[(batch_code, location_id)] = observed_at
+
+class ResultWriter:
+    """Buffered writer for the text results log and its JSONL companion
+    
+    Lines and records are kept in memory and written after every check or
+    every `flush_every` records through long-lived file handles. Files are
+    rotated and gzipped by size or age, keeping the newest `keep` archives.
+    """
+    
+    def __init__(self, text_path: str, jsonl_path: str, flush_every: int = 500, max_bytes: int = 10 * 1024 * 1024,
+                 max_age: float = 24 * 3600, keep: int = 10):
+        """Create a writer; files are only opened on the first flush"""
+        self.paths = {"text": text_path, "jsonl": jsonl_path}
+        self.flush_every = max(1, flush_every)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.keep = keep
+        self.buffers = {"text": [], "jsonl": []}
+        self.files = {}
+        self.opened_at = time.time()
+        self.lock = threading.Lock()
+    
+    def write_text(self, line: str):
+        """Buffer one human-readable line"""
+        self._append("text", f"{line}\n")
+    
+    def write_record(self, record: dict):
+        """Buffer one structured record"""
+        self._append("jsonl", json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    
+    def _append(self, kind: str, data: str):
+        """Buffer data and flush once enough records are pending"""
+        with self.lock:
+            self.buffers[kind].append(data)
+            pending = len(self.buffers["text"]) + len(self.buffers["jsonl"])
+        if pending >= self.flush_every:
+            self.flush()
+    
+    def flush(self):
+        """Write all buffered data, then rotate files that grew too large or old"""
+        with self.lock:
+            for kind, buffer in self.buffers.items():
+                if not buffer:
+                    continue
+                handle = self.files.get(kind)
+                if handle is None:
+                    handle = self.files[kind] = open(self.paths[kind], 'a', encoding='utf-8')
+                handle.write("".join(buffer))
+                handle.flush()
+                buffer.clear()
+            
+            expired = time.time() - self.opened_at >= self.max_age
+            for kind, handle in list(self.files.items()):
+                if expired or handle.tell() >= self.max_bytes:
+                    handle.close()
+                    del self.files[kind]
+                    self._rotate(self.paths[kind])
+            if expired:
+                self.opened_at = time.time()
+    
+    def _rotate(self, path: str):
+        """Gzip the current file away and prune old archives"""
+        if not os.path.exists(path):
+            return
+        archive = f"{path}.{datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.gz"
+        with open(path, 'rb') as source, gzip.open(archive, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.remove(path)
+        
+        archives = sorted(glob.glob(f"{glob.escape(path)}.*.gz"))
+        for old_archive in archives[:max(len(archives) - self.keep, 0)]:
+            os.remove(old_archive)
+    
+    def close(self):
+        """Flush and close all files"""
+        self.flush()
+        with self.lock:
+            for handle in self.files.values():
+                handle.close()
+            self.files.clear()
+
+class HistoryStore:
+    """SQLite store of every slot observation, written in one transaction per scan"""
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS slots (
+            batch_code TEXT NOT NULL,
+            location_id TEXT NOT NULL,
+            slot_id TEXT NOT NULL,
+            location_name TEXT,
+            slot_name TEXT,
+            PRIMARY KEY (batch_code, location_id, slot_id)
+        );
+        CREATE TABLE IF NOT EXISTS observations (
+            observed_at REAL NOT NULL,
+            batch_code TEXT NOT NULL,
+            location_id TEXT NOT NULL,
+            slot_id TEXT NOT NULL,
+            seats INTEGER NOT NULL,
+            registered INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_observations_location_time ON observations (location_id, observed_at);
+        CREATE INDEX IF NOT EXISTS idx_observations_time ON observations (observed_at);
+    """
+    
+    def __init__(self, path: str):
+        """Open (and create if needed) the database at path"""
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(self.SCHEMA)
+        self.pending = []
+        self.names = {}
+    
+    def record(self, batch_code: str, location_id: str, location_name: str, slot_id: str, slot_name: str,
+               seats: int, registered: int, observed_at: float = None):
+        """Buffer one observation until the next flush()"""
+        key = (str(batch_code or ''), str(location_id), str(slot_id))
+        self.pending.append((observed_at or time.time(),) + key + (seats, registered))
+        self.names[key] = (location_name, slot_name)
+    
+    def flush(self):
+        """Write all buffered observations in a single transaction"""
+        if not self.pending:
+            return
+        with self.conn:
+            self.conn.executemany("INSERT INTO observations VALUES (?, ?, ?, ?, ?, ?)", self.pending)
+            self.conn.executemany("INSERT OR REPLACE INTO slots VALUES (?, ?, ?, ?, ?)",
+                                  [key + names for key, names in self.names.items()])
+        self.pending = []
+        self.names = {}
+    
+    def _transitions(self, since: float, location_id: str = None, batch_code: str = None) -> list:
+        """Return observations since `since` with the previous available count of the same slot
+        
+        Unchanged responses are not recorded, so the observation before an
+        opening can be older than the window. Each slot's last observation
+        before `since` is therefore included as the seed of its LAG().
+        """
+        scope = ""
+        params = []
+        if location_id:
+            scope += " AND location_id = ?"
+            params.append(str(location_id))
+        if batch_code:
+            scope += " AND batch_code = ?"
+            params.append(str(batch_code))
+        query = f"""
+            SELECT t.observed_at, t.batch_code, t.location_id, t.slot_id, t.available, t.previous,
+                   s.location_name, s.slot_name
+            FROM (
+                SELECT observed_at, batch_code, location_id, slot_id, available,
+                       LAG(available) OVER (
+                           PARTITION BY batch_code, location_id, slot_id ORDER BY observed_at) AS previous
+                FROM (
+                    SELECT observed_at, batch_code, location_id, slot_id, seats - registered AS available
+                    FROM observations WHERE observed_at >= ?{scope}
+                    UNION ALL
+                    SELECT MAX(observed_at), batch_code, location_id, slot_id, seats - registered
+                    FROM observations WHERE observed_at < ?{scope}
+                    GROUP BY batch_code, location_id, slot_id
+                )
+            ) t
+            LEFT JOIN slots s USING (batch_code, location_id, slot_id)
+            WHERE t.observed_at >= ?
+            ORDER BY t.batch_code, t.location_id, t.slot_id, t.observed_at
+        """
+        return self.conn.execute(query, [since] + params + [since] + params + [since]).fetchall()
+    
+    def openings(self, since: float, location_id: str = None, batch_code: str = None) -> list:
+        """Return (time, batch, location, slot, available, location name, slot name) for each seat opening"""
+        openings = [
+            (row[0], row[1], row[2], row[3], row[4], row[6], row[7])
+            for row in self._transitions(since, location_id, batch_code)
+            if row[4] > 0 and row[5] is not None and row[5] <= 0
+        ]
+        return sorted(openings)
+    
+    def open_durations(self, since: float, location_id: str = None, batch_code: str = None) -> List[float]:
+        """Return how long, in seconds, each seat opening lasted before it closed"""
+        durations = []
+        opened_at = None
+        slot = None
+        for observed_at, batch, location, slot_id, available, previous, _, _ in self._transitions(
+                since, location_id, batch_code):
+            if (batch, location, slot_id) != slot:
+                # First row of a new slot: an opening seen before the window is not counted
+                slot = (batch, location, slot_id)
+                opened_at = None
+            if previous is None:
+                continue
+            if available > 0 and previous <= 0:
+                opened_at = observed_at
+            elif available <= 0 and previous > 0 and opened_at is not None:
+                durations.append(observed_at - opened_at)
+                opened_at = None
+        return durations
+    
+    def close(self):
+        """Flush pending observations and close the database"""
+        self.flush()
+        self.conn.close()
+
+def show_history(args):
+    """Print seat openings and open durations from the history database"""
+    if not os.path.exists(args.db):
+        print(f"Error: History database {args.db} not found. Run a check first.")
+        return False
+    
+    store = HistoryStore(args.db)
+    since = time.time() - args.hours * 3600
+    scope = f"location {args.location}" if args.location else "all locations"
+    if args.batch:
+        scope += f" in batch {args.batch}"
+    
+    print("=====================================================================")
+    print(f"AVAILABILITY HISTORY: {scope}, last {args.hours:g} hours")
+    print("=====================================================================")
+    
+    if args.report in ("openings", "all"):
+        start = time.perf_counter()
+        openings = store.openings(since, args.location, args.batch)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"Seat openings: {len(openings)} (query took {elapsed_ms:.1f} ms)")
+        for observed_at, batch_code, location_id, slot_id, available, location_name, slot_name in openings:
+            when = datetime.datetime.fromtimestamp(observed_at).strftime('%Y-%m-%d %H:%M:%S')
+            print(f"{when} [{batch_code}] {location_name} (ID: {location_id}) → {slot_name} (ID: {slot_id}): {available} seat(s)")
+        print("---------------------------------------------------------------------")
+    
+    if args.report in ("durations", "all"):
+        start = time.perf_counter()
+        durations = store.open_durations(since, args.location, args.batch)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"Closed seat openings: {len(durations)} (query took {elapsed_ms:.1f} ms)")
+        if durations:
+            import statistics
+            print(f"Median time a seat stays open: {statistics.median(durations):.0f} seconds")
+            print(f"Shortest: {min(durations):.0f} seconds, longest: {max(durations):.0f} seconds")
+        print("---------------------------------------------------------------------")
+    
+    store.close()
+    return True
+
+def fold_text(text: str) -> str:
+    """Lower-case text and strip Vietnamese diacritics, so 'Ha Noi' matches 'Hà Nội'"""
+    decomposed = unicodedata.normalize('NFD', str(text).replace('đ', 'd').replace('Đ', 'D'))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+def slot_date(name: str) -> Optional[datetime.date]:
+    """Return the dd/mm/yyyy date in a slot name such as 'Ca 1 - 12/05/2025'"""
+    match = re.search(r'(\d{1,2})/(\d{1,2})/(\d{4})', name or '')
+    if not match:
+        return None
+    try:
+        return datetime.date(int(match.group(3)), int(match.group(2)), int(match.group(1)))
+    except ValueError:
+        return None
+
+class WatchRule:
+    """One watchlist rule over batch codes, status, locations and slots"""
+    
+    FIELDS = ("name", "batches", "status", "locations", "location_ids", "slots", "weekdays", "dates",
+              "min_seats", "notify")
+    WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+    
+    def __init__(self, spec: dict, index: int, default_status: str):
+        """Validate and compile a rule from its JSON object"""
+        if not isinstance(spec, dict):
+            raise ValueError(f"rule #{index + 1} must be an object")
+        unknown = set(spec) - set(self.FIELDS)
+        if unknown:
+            raise ValueError(f"rule #{index + 1} has unknown field(s): {', '.join(sorted(unknown))}")
+        
+        def as_list(value) -> list:
+            return [] if value is None else value if isinstance(value, list) else [value]
+        
+        def pattern(value) -> str:
+            # A plain word matches anywhere in the name; glob characters switch to a full match
+            folded = fold_text(value)
+            return folded if any(c in folded for c in '*?[') else f"*{folded}*"
+        
+        self.name = str(spec.get("name") or f"rule-{index + 1}")
+        self.batches = [str(code) for code in as_list(spec.get("batches"))]
+        self.status = spec.get("status", default_status)
+        self.location_patterns = [pattern(p) for p in as_list(spec.get("locations"))]
+        self.location_ids = {str(i) for i in as_list(spec.get("location_ids"))}
+        self.slot_patterns = [pattern(p) for p in as_list(spec.get("slots"))]
+        self.min_seats = int(spec.get("min_seats", 1))
+        self.notify = [str(sink) for sink in as_list(spec.get("notify"))]
+        
+        self.weekdays = set()
+        for day in as_list(spec.get("weekdays")):
+            day = str(day).lower()[:3]
+            if day not in self.WEEKDAYS:
+                raise ValueError(f"rule '{self.name}' has an unknown weekday: {day}")
+            self.weekdays.add(self.WEEKDAYS.index(day))
+        
+        dates = spec.get("dates") or {}
+        if not isinstance(dates, dict) or set(dates) - {"from", "to"}:
+            raise ValueError(f"rule '{self.name}': dates must look like {{\"from\": \"YYYY-MM-DD\", \"to\": \"YYYY-MM-DD\"}}")
+        self.date_from = datetime.date.fromisoformat(dates["from"]) if dates.get("from") else None
+        self.date_to = datetime.date.fromisoformat(dates["to"]) if dates.get("to") else None
+    
+    def matches_batch(self, batch: dict) -> bool:
+        """True if the rule covers this batch"""
+        if self.status and batch.get('status') != self.status:
+            return False
+        code = str(batch.get('code'))
+        return not self.batches or any(fnmatch.fnmatchcase(code, p) for p in self.batches)
+    
+    def matches_location(self, location: dict) -> bool:
+        """True if the rule covers this location of a matching batch"""
+        if not self.location_patterns and not self.location_ids:
+            return True
+        if str(location.get('id')) in self.location_ids:
+            return True
+        name = fold_text(location.get('name') or '')
+        return any(fnmatch.fnmatchcase(name, p) for p in self.location_patterns)
+    
+    def matches_slot(self, slot: SlotResult) -> bool:
+        """True if a slot of a matching location has enough seats and the wanted name or date"""
+        if slot.available < self.min_seats:
+            return False
+        if self.slot_patterns and not any(fnmatch.fnmatchcase(fold_text(slot.name or ''), p) for p in self.slot_patterns):
+            return False
+        if self.weekdays or self.date_from or self.date_to:
+            date = slot_date(slot.name)
+            if date is None:
+                return False
+            if self.weekdays and date.weekday() not in self.weekdays:
+                return False
+            if (self.date_from and date < self.date_from) or (self.date_to and date > self.date_to):
+                return False
+        return True
+
+class Watchlist:
+    """Declarative watch rules compiled into a pruned scan plan
+    
+    Batches and locations that no rule can match are never requested. The
+    rules that cover each planned location are indexed, so slot matches are
+    routed to the rules that asked for them.
+    """
+    
+    def __init__(self, rules: List[WatchRule]):
+        """Create a watchlist from compiled rules"""
+        self.rules = rules
+        self.index = {}
+    
+    @classmethod
+    def load(cls, path: str, default_status: str) -> 'Watchlist':
+        """Load rules from a JSON file: a list of rules or {"rules": [...]}"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        specs = data.get("rules") if isinstance(data, dict) else data
+        if not isinstance(specs, list) or not specs:
+            raise ValueError("watchlist must contain a non-empty list of rules")
+        rules = [WatchRule(spec, index, default_status) for index, spec in enumerate(specs)]
+        names = [rule.name for rule in rules]
+        if len(set(names)) != len(names):
+            raise ValueError("rule names must be unique")
+        return cls(rules)
+    
+    def wants_batch(self, batch: dict) -> bool:
+        """True if any rule covers this batch"""
+        return any(rule.matches_batch(batch) for rule in self.rules)
+    
+    def compile(self, batch: dict, locations: list) -> list:
+        """Return the locations of a batch that some rule can match, and index their rules"""
+        batch_code = str(batch.get('code'))
+        rules = [rule for rule in self.rules if rule.matches_batch(batch)]
+        planned = []
+        for location in locations or []:
+            matching = [rule for rule in rules if rule.matches_location(location)]
+            if matching:
+                self.index[(batch_code, str(location.get('id')))] = matching
+                planned.append(location)
+        return planned
+    
+    def route(self, scan: ScanResult) -> List[Tuple[WatchRule, ScanResult]]:
+        """Split a scan into one result per rule whose slots gained seats"""
+        routed = {}
+        for batch in scan.batches:
+            for location in batch.locations:
+                rules = self.index.get((str(batch.batch_code), str(location.location_id)), ())
+                new_slots = {event.slot_id for event in location.events if event.adds_seats}
+                if not rules or not new_slots:
+                    continue
+                for rule in rules:
+                    slots = [slot for slot in location.slots if rule.matches_slot(slot)]
+                    slot_ids = {slot.slot_id for slot in slots}
+                    if not slot_ids & new_slots:
+                        continue
+                    
+                    result = routed.get(rule.name)
+                    if result is None:
+                        result = routed[rule.name] = ScanResult()
+                        result.started_at, result.finished_at = scan.started_at, scan.finished_at
+                    if not result.batches or result.batches[-1].batch_id != batch.batch_id:
+                        result.batches.append(BatchResult(batch.batch_id, batch.batch_code, batch.batch_name))
+                    
+                    matched = LocationResult(location.batch_code, location.batch_name, location.location_id,
+                                             location.location_name)
+                    matched.slots = slots
+                    matched.events = [event for event in location.events if event.slot_id in slot_ids]
+                    result.batches[-1].locations.append(matched)
+        return [(rule, routed[rule.name]) for rule in self.rules if rule.name in routed]
+    
+    def describe(self) -> List[str]:
+        """Return one line per rule for start-up output"""
+        lines = []
+        for rule in self.rules:
+            parts = [f"batches {', '.join(sorted(rule.batches))}" if rule.batches else "all batches"]
+            if rule.location_ids or rule.location_patterns:
+                parts.append(f"{len(rule.location_ids) + len(rule.location_patterns)} location filter(s)")
+            if rule.slot_patterns or rule.weekdays or rule.date_from or rule.date_to:
+                parts.append("slot filters")
+            if rule.notify:
+                parts.append(f"notify {', '.join(rule.notify)}")
+            lines.append(f"{rule.name}: {'; '.join(parts)}")
+        return lines
+
+class AvailabilityServer:
+    """Local HTTP API publishing the latest slot state and a live event stream
+    
+    GET /snapshot returns the last result of every location as JSON and
+    GET /events streams slot changes and finished checks as Server-Sent
+    Events. Both accept ?batch=CODE and ?location=ID filters (repeatable or
+    comma separated), so one poller can serve any number of subscribers.
+    """
+    
+    HEARTBEAT = 15.0
+    REPLAY = 1000
+    SUBSCRIBER_QUEUE = 1000
+    
+    def __init__(self, port: int, host: str = "127.0.0.1"):
+        """Start serving on a background thread"""
+        self.lock = threading.Lock()
+        self.locations = {}
+        self.last_scan = None
+        self.event_id = 0
+        self.recent = deque(maxlen=self.REPLAY)
+        self.subscribers = set()
+        self.closing = False
+        
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        availability = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def do_GET(self):
+                availability.handle(self)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="hsa-serve", daemon=True).start()
+        print(f"Serving live availability on http://{host}:{port}/snapshot and /events")
+    
+    def publish_location(self, result: LocationResult):
+        """Store a location's latest result and broadcast its slot changes"""
+        key = (str(result.batch_code), str(result.location_id))
+        now = datetime.datetime.now().isoformat()
+        with self.lock:
+            if result.ok:
+                self.locations[key] = dict(result.to_dict(), batch_name=result.batch_name, checked_at=now)
+            elif key in self.locations:
+                self.locations[key]["last_error_at"] = now
+        for event in result.events:
+            self._broadcast("slot", {
+                "time": now,
+                "kind": event.kind,
+                "batch_code": event.batch_code,
+                "location_id": event.location_id,
+                "location_name": result.location_name,
+                "slot_id": event.slot_id,
+                "name": event.name,
+                "old": event.old,
+                "new": event.new,
+                "total": event.total
+            })
+    
+    def publish_scan(self, scan: ScanResult):
+        """Broadcast a summary of a finished check"""
+        summary = {
+            "started_at": scan.started_at.isoformat(),
+            "finished_at": datetime.datetime.now().isoformat(),
+            "locations": sum(len(b.locations) for b in scan.batches),
+            "locations_with_slots": len(scan.available_locations),
+            "events": len(scan.events)
+        }
+        with self.lock:
+            self.last_scan = summary
+        self._broadcast("scan", summary)
+    
+    def _broadcast(self, kind: str, data: dict):
+        """Number an event, keep it for replay and queue it for every subscriber"""
+        with self.lock:
+            self.event_id += 1
+            event = (self.event_id, kind, data)
+            self.recent.append(event)
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # A consumer that stopped reading is cut off instead of holding memory
+                with self.lock:
+                    self.subscribers.discard(subscriber)
+    
+    @staticmethod
+    def _filters(query: Dict[str, List[str]]) -> Tuple[set, set]:
+        def values(name):
+            return {v.strip() for value in query.get(name, []) for v in value.split(',') if v.strip()}
+        return values("batch"), values("location")
+    
+    @staticmethod
+    def _matches(data: dict, batches: set, locations: set) -> bool:
+        if batches and str(data.get("batch_code")) not in batches:
+            return False
+        if locations and str(data.get("location_id")) not in locations:
+            return False
+        return True
+    
+    def handle(self, request: 'BaseHTTPRequestHandler'):
+        """Route a GET request"""
+        path, _, query_string = request.path.partition('?')
+        batches, locations = self._filters(urllib.parse.parse_qs(query_string))
+        if path == "/snapshot":
+            with self.lock:
+                entries = [dict(entry) for _, entry in sorted(self.locations.items())
+                           if self._matches(entry, batches, locations)]
+                body = {"time": datetime.datetime.now().isoformat(), "last_scan": self.last_scan,
+                        "locations": entries}
+            self._send_json(request, 200, body)
+        elif path == "/events":
+            self._stream(request, batches, locations)
+        elif path == "/health":
+            with self.lock:
+                body = {"status": "ok", "last_scan": self.last_scan, "subscribers": len(self.subscribers)}
+            self._send_json(request, 200, body)
+        else:
+            self._send_json(request, 404, {"error": "not found"})
+    
+    @staticmethod
+    def _send_json(request: 'BaseHTTPRequestHandler', status: int, body: dict):
+        payload = json.dumps(body, ensure_ascii=False).encode()
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json; charset=utf-8")
+        request.send_header("Content-Length", str(len(payload)))
+        request.send_header("Access-Control-Allow-Origin", "*")
+        request.end_headers()
+        request.wfile.write(payload)
+    
+    def _stream(self, request: 'BaseHTTPRequestHandler', batches: set, locations: set):
+        """Send events to one subscriber until it disconnects"""
+        subscriber = queue.Queue(maxsize=self.SUBSCRIBER_QUEUE)
+        last_seen = request.headers.get("Last-Event-ID")
+        with self.lock:
+            # Events missed since Last-Event-ID are replayed from the recent buffer
+            backlog = [e for e in self.recent if last_seen and last_seen.isdigit() and e[0] > int(last_seen)]
+            self.subscribers.add(subscriber)
+        
+        request.close_connection = True
+        request.send_response(200)
+        request.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        request.send_header("Cache-Control", "no-cache")
+        request.send_header("Access-Control-Allow-Origin", "*")
+        request.end_headers()
+        try:
+            request.wfile.write(b"retry: 5000\n\n")
+            request.wfile.flush()
+            for event in backlog:
+                self._write_event(request, event, batches, locations)
+            while not self.closing:
+                try:
+                    event = subscriber.get(timeout=self.HEARTBEAT)
+                except queue.Empty:
+                    request.wfile.write(b": keep-alive\n\n")
+                    request.wfile.flush()
+                    continue
+                if event is None:
+                    break
+                self._write_event(request, event, batches, locations)
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            pass
+        finally:
+            with self.lock:
+                self.subscribers.discard(subscriber)
+    
+    def _write_event(self, request: 'BaseHTTPRequestHandler', event: tuple, batches: set, locations: set):
+        """Write one event if it passes the subscriber's filters"""
+        event_id, kind, data = event
+        if kind == "slot" and not self._matches(data, batches, locations):
+            return
+        message = f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        request.wfile.write(message.encode())
+        request.wfile.flush()
+    
+    def close(self):
+        """Disconnect subscribers and stop serving"""
+        self.closing = True
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(None)
+            except queue.Full:
+                pass
+        self.server.shutdown()
+        self.server.server_close()
+
+def parse_deadline(value) -> Optional[float]:
+    """Parse a registration deadline such as config.registrationEndDateTime into a timestamp"""
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
 
-def parse_arguments():
-    """Parse command line arguments"""
-    parser = argparse.ArgumentParser(description="HSA Exam Slot Checker")
-    parser.add_argument("-b", "--batch-code", help="Check specific batch by code (e.g. 502, 503)")
-    parser.add_argument("-l", "--location-id", help="Only check a specific location ID")
-    parser.add_argument("-i", "--interval", type=int, default=300, 
-                      help="Interval in seconds between checks when monitoring (default: 300)")
-    parser.add_argument("-d", "--delay", type=int, default=2,
-                      help="Delay in seconds between API calls (default: 2)")
-    parser.add_argument("-e", "--email", default="your-email-address",
-                      help="Email to send notifications to")
-    parser.add_argument("-n", "--no-email", action="store_true",
-                      help="No email notifications, just display results")
-    parser.add_argument("-v", "--verbose", action="store_true",
-                      help="Verbose output (show progress for each location)")
-    parser.add_argument("-m", "--monitor", action="store_true",
-                      help="Monitor mode - continuously check at specified intervals")
-    parser.add_argument("-p", "--phone", help="Phone number for authentication")
-    parser.add_argument("-w", "--password", help="Password for authentication")
-    parser.add_argument("-t", "--token", help="Custom authorization token")
-    parser.add_argument("-a", "--show-batches", action="store_true",
-                      help="Show all available batches and exit")
-    parser.add_argument("--all-batches", action="store_true",
-                      help="Check all OPENING batches instead of just one")
-    parser.add_argument("--status", default="OPENING", 
-                      help="Status of batches to check (default: OPENING)")
+class PollScheduler:
+    """Hot/cold scheduler that spends a fixed per-cycle budget on the locations that matter
+    
+    Each location gets a weight from its recent churn (slot events per check),
+    how often it had seats, and how close its batch's registration deadline
+    is. Locations are ranked by weight times the time since their last check,
+    so hot locations are revisited often while cold ones are still checked
+    eventually.
+    """
+    
+    URGENT_WINDOW = 72 * 3600
+    
+    def __init__(self, budget: int = 0, decay: float = 0.3, clock=time):
+        """Create a scheduler; a budget of 0 checks every location every cycle"""
+        self.clock = clock
+        self.budget = max(0, budget)
+        self.decay = decay
+        self.stats = {}
+        self.deadlines = {}
+        self.carried_over = set()
+    
+    def carry_over(self, keys: List[Tuple[str, str]]):
+        """Remember locations a check ran out of time for, so the next check starts with them"""
+        self.carried_over.update(keys)
+    
+    def carried_count(self, batch_code: str) -> int:
+        """Number of locations of this batch that were carried over"""
+        return sum(1 for key in self.carried_over if key[0] == str(batch_code))
+    
+    def set_deadline(self, batch_code: str, deadline: Optional[float]):
+        """Remember when registration for a batch closes"""
+        self.deadlines[str(batch_code)] = deadline
+    
+    def weight(self, key: Tuple[str, str], now: float) -> float:
+        """Return the importance of a (batch code, location id) pair"""
+        stats = self.stats.get(key, {})
+        weight = 0.1 + 2.0 * stats.get("churn", 0.0) + 1.0 * stats.get("seats", 0.0)
+        
+        deadline = self.deadlines.get(key[0])
+        if deadline is not None:
+            remaining = deadline - self.clock.time()
+            if remaining <= 0:
+                weight *= 0.2
+            elif remaining < self.URGENT_WINDOW:
+                weight *= 1 + 2 * (1 - remaining / self.URGENT_WINDOW)
+        return weight
+    
+    def score(self, key: Tuple[str, str], now: float) -> float:
+        """Return the priority of checking a location now"""
+        last_checked = self.stats.get(key, {}).get("last_checked")
+        if last_checked is None:
+            return float('inf')
+        return self.weight(key, now) * (now - last_checked + 1)
+    
+    def select(self, candidates: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """Return the locations to check this cycle: carried-over ones first, then hottest first"""
+        carried = [key for key in candidates if key in self.carried_over]
+        rest = [key for key in candidates if key not in self.carried_over]
+        if not self.budget or len(candidates) <= self.budget:
+            return carried + rest
+        now = self.clock.monotonic()
+        ranked = sorted(rest, key=lambda key: self.score(key, now), reverse=True)
+        return (carried + ranked)[:self.budget]
+    
+    def observe(self, result: 'LocationResult'):
+        """Update a location's churn and seat history after it was checked"""
+        key = (str(result.batch_code), str(result.location_id))
+        self.carried_over.discard(key)
+        stats = self.stats.setdefault(key, {"churn": 0.0, "seats": 0.0})
+        stats["last_checked"] = self.clock.monotonic()
+        if not result.ok:
+            return
+        stats["churn"] += self.decay * (min(len(result.events), 5) - stats["churn"])
+        stats["seats"] += self.decay * ((1.0 if result else 0.0) - stats["seats"])
+    
+    def to_dict(self) -> dict:
+        """Return priorities, deadlines and carried-over locations with wall-clock check times"""
+        offset = self.clock.time() - self.clock.monotonic()
+        stats = []
+        for key, entry in self.stats.items():
+            entry = dict(entry)
+            if "last_checked" in entry:
+                entry["last_checked"] += offset
+            stats.append([*key, entry])
+        return {"stats": stats, "deadlines": self.deadlines, "carried_over": sorted(self.carried_over)}
+    
+    def load_dict(self, state: dict):
+        """Restore a scheduler saved by to_dict()"""
+        offset = self.clock.time() - self.clock.monotonic()
+        for batch_code, location_id, entry in state.get("stats", []):
+            if "last_checked" in entry:
+                entry["last_checked"] -= offset
+            self.stats[(batch_code, location_id)] = entry
+        self.deadlines.update(state.get("deadlines") or {})
+        self.carried_over.update(tuple(key) for key in state.get("carried_over", []))
+    
+    def hottest(self, count: int = 5) -> List[Tuple[Tuple[str, str], float]]:
+        """Return the highest-weighted locations for verbose output"""
+        now = self.clock.monotonic()
+        weights = [(key, self.weight(key, now)) for key in self.stats]
+        return sorted(weights, key=lambda item: item[1], reverse=True)[:count]
+    
+    def run(self, run_check, interval: float, until=None):
+        """Run checks until `until()` returns True (forever without it), sleeping `interval` seconds between cycles"""
+        run_count = 0
+        while True:
+            run_count += 1
+            print(f"Run #{run_count} at {datetime.datetime.now()}")
+            
+            run_check()
+            if until is not None and until():
+                return
+            
+            print(f"Next check in {interval} seconds. Press Ctrl+C to stop.")
+            self.clock.sleep(interval)
+
+class AsyncScanEngine:
+    """Fans out location and slot requests across batches under one rate budget"""
+    
+    def __init__(self, checker: 'HSAChecker', concurrency: int):
+        """Create an engine that prefetches responses for the given checker"""
+        self.checker = checker
+        self.concurrency = max(1, concurrency)
+    
+    def prefetch_batches(self, batch_ids: list, plan: Dict[str, list] = None, deadline: float = None):
+        """Prefetch locations and available slots for all batches concurrently"""
+        import asyncio
+        asyncio.run(self._prefetch_batches(batch_ids, plan, deadline))
+    
+    async def _prefetch_batches(self, batch_ids: list, plan: Dict[str, list] = None, deadline: float = None):
+        """Fetch every batch's locations, then the slots of every (planned) location"""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        cancelled = threading.Event()
+        try:
+            if plan is not None:
+                location_responses = list(plan.values())
+            else:
+                batch_ids = list(dict.fromkeys(batch_ids))
+                tasks = [loop.run_in_executor(executor, self.checker.fetch_locations, b) for b in batch_ids]
+                location_responses = await asyncio.gather(*tasks)
+            
+            await self._fetch_all(loop, executor, self.checker._slot_urls(location_responses), deadline, cancelled)
+        finally:
+            # Requests still waiting for the rate limiter at the deadline give up their turn, and
+            # those already sent are abandoned rather than waited for
+            cancelled.set()
+            executor.shutdown(wait=deadline is None, cancel_futures=True)
+    
+    async def _fetch_all(self, loop, executor, urls: list, deadline: float = None, cancelled: threading.Event = None):
+        """Fetch URLs concurrently until the deadline and store them for the sequential scan"""
+        import asyncio
+        if not urls:
+            return
+        tasks = {loop.run_in_executor(executor, self._fetch, url, cancelled): url for url in urls}
+        timeout = max(0.0, deadline - self.checker.clock.monotonic()) if deadline is not None else None
+        done, _ = await asyncio.wait(tasks, timeout=timeout)
+        self.checker._prefetched.update((tasks[task], task.result()) for task in done)
+    
+    def _fetch(self, url: str, cancelled: threading.Event = None) -> bytes:
+        """Fetch one URL's raw body once the global rate budget allows it, unless the scan gave up on it"""
+        return self.checker.fetch_raw(url, cancelled)
+
+class ClusterCoordinator:
+    """Splits locations between checker instances through leases in a shared SQLite database
+    
+    Every (batch, location) pair hashes to one of `shards` shards. On each
+    check a node hands back shards above its fair share (shards divided by
+    live nodes, rounded up) so a joining node can pick them up, and claims
+    free or expired shards up to that share. A background thread renews the
+    heartbeat and leases every third of `lease_ttl`, independently of the
+    check interval and scan time, so only the shards of a node that died
+    become free after `lease_ttl`. The same database deduplicates
+    notifications across the cluster.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS nodes (
+            node_id TEXT PRIMARY KEY,
+            heartbeat_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS leases (
+            shard INTEGER PRIMARY KEY,
+            node_id TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS notified (
+            batch_code TEXT NOT NULL,
+            location_id TEXT NOT NULL,
+            slot_id TEXT NOT NULL,
+            seats INTEGER NOT NULL,
+            node_id TEXT NOT NULL,
+            notified_at REAL NOT NULL,
+            PRIMARY KEY (batch_code, location_id, slot_id)
+        );
+    """
+    
+    def __init__(self, path: str, node_id: str, shards: int = 16, lease_ttl: float = 60.0):
+        """Open (and create if needed) the shared database at path"""
+        self.path = path
+        self.node_id = node_id
+        self.shards = max(1, shards)
+        self.lease_ttl = lease_ttl
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(self.SCHEMA)
+        self.lock = threading.Lock()
+        self.owned = set()
+        self.nodes = 1
+        self.stopped = threading.Event()
+        self.thread = None
+    
+    def start(self) -> 'ClusterCoordinator':
+        """Join the cluster and keep the heartbeat and leases alive in the background"""
+        self.acquire()
+        self.thread = threading.Thread(target=self._keep_alive, name="hsa-cluster", daemon=True)
+        self.thread.start()
+        return self
+    
+    def _keep_alive(self):
+        """Renew the heartbeat and leases until the coordinator is closed"""
+        while not self.stopped.wait(self.lease_ttl / 3):
+            try:
+                self.renew()
+            except sqlite3.Error as e:
+                print(f"Warning: Could not renew cluster leases: {str(e)}")
+    
+    def shard_of(self, batch_code: str, location_id: str) -> int:
+        """Stable shard number of a location, the same on every node"""
+        digest = hashlib.blake2b(f"{batch_code}/{location_id}".encode(), digest_size=4).digest()
+        return int.from_bytes(digest, 'big') % self.shards
+    
+    def owns(self, batch_code: str, location_id: str) -> bool:
+        """True if this node currently holds the lease on the location's shard"""
+        return self.shard_of(batch_code, location_id) in self.owned
+    
+    def renew(self) -> set:
+        """Extend the heartbeat and the leases this node still holds, without rebalancing"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("INSERT OR REPLACE INTO nodes VALUES (?, ?)", (self.node_id, now))
+                self.conn.execute("UPDATE leases SET expires_at = ? WHERE node_id = ?",
+                                  (now + self.lease_ttl, self.node_id))
+                owned = {row[0] for row in self.conn.execute(
+                    "SELECT shard FROM leases WHERE node_id = ?", (self.node_id,))}
+                self.conn.execute("COMMIT")
+            except sqlite3.Error:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.owned = owned
+        return self.owned
+    
+    def acquire(self) -> set:
+        """Renew the heartbeat and leases, rebalance, and return the shards this node owns"""
+        now = time.time()
+        expires_at = now + self.lease_ttl
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("INSERT OR REPLACE INTO nodes VALUES (?, ?)", (self.node_id, now))
+                self.conn.execute("DELETE FROM nodes WHERE heartbeat_at < ?", (now - self.lease_ttl,))
+                self.nodes = self.conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+                fair_share = -(-self.shards // self.nodes)
+                
+                self.conn.execute("UPDATE leases SET expires_at = ? WHERE node_id = ?", (expires_at, self.node_id))
+                owned = [row[0] for row in self.conn.execute(
+                    "SELECT shard FROM leases WHERE node_id = ? ORDER BY shard", (self.node_id,))]
+                
+                # Give back the surplus, e.g. after another node joined
+                for shard in owned[fair_share:]:
+                    self.conn.execute("DELETE FROM leases WHERE shard = ? AND node_id = ?", (shard, self.node_id))
+                owned = owned[:fair_share]
+                
+                if len(owned) < fair_share:
+                    taken = {row[0] for row in self.conn.execute(
+                        "SELECT shard FROM leases WHERE expires_at >= ?", (now,))}
+                    for shard in range(self.shards):
+                        if len(owned) >= fair_share:
+                            break
+                        if shard not in taken:
+                            self.conn.execute("INSERT OR REPLACE INTO leases VALUES (?, ?, ?)",
+                                              (shard, self.node_id, expires_at))
+                            owned.append(shard)
+                self.conn.execute("COMMIT")
+            except sqlite3.Error:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.owned = set(owned)
+        return self.owned
+    
+    def claim_notifications(self, events: List[SlotEvent]) -> List[SlotEvent]:
+        """Record slot changes and return the seat gains no other node has notified about yet
+        
+        A slot's row holds the seats last notified. A gain is claimed only if it
+        raises that number, so each opening is announced by exactly one node.
+        Decreases lower the row again, so the next opening or increase is
+        announced too.
+        """
+        claimed = []
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for event in events:
+                    key = (str(event.batch_code), str(event.location_id), str(event.slot_id))
+                    if event.adds_seats:
+                        cursor = self.conn.execute(
+                            "INSERT INTO notified VALUES (?, ?, ?, ?, ?, ?) "
+                            "ON CONFLICT (batch_code, location_id, slot_id) DO UPDATE SET "
+                            "seats = excluded.seats, node_id = excluded.node_id, notified_at = excluded.notified_at "
+                            "WHERE notified.seats < excluded.seats",
+                            key + (event.new, self.node_id, now))
+                        if cursor.rowcount:
+                            claimed.append(event)
+                    else:
+                        self.conn.execute(
+                            "UPDATE notified SET seats = ? WHERE batch_code = ? AND location_id = ? AND slot_id = ? "
+                            "AND seats > ?", (event.new,) + key + (event.new,))
+                self.conn.execute("COMMIT")
+            except sqlite3.Error:
+                self.conn.execute("ROLLBACK")
+                raise
+        return claimed
+    
+    def describe(self) -> str:
+        """Return a one-line summary for the log"""
+        return f"node {self.node_id} owns {len(self.owned)} of {self.shards} shard(s), {self.nodes} live node(s)"
+    
+    def close(self):
+        """Leave the cluster: release leases so other nodes take over right away"""
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        with self.lock:
+            try:
+                self.conn.execute("DELETE FROM leases WHERE node_id = ?", (self.node_id,))
+                self.conn.execute("DELETE FROM nodes WHERE node_id = ?", (self.node_id,))
+            except sqlite3.Error as e:
+                print(f"Warning: Could not leave the cluster cleanly: {str(e)}")
+            self.conn.close()
+
+class StateStore:
+    """Compact on-disk snapshot of monitor state, so a restarted checker resumes where it stopped"""
+    
+    VERSION = 2
+    
+    def __init__(self, path: str, max_age: float):
+        """Keep the snapshot at `path`; snapshots older than max_age seconds are ignored"""
+        self.path = path
+        self.max_age = max_age
+    
+    def load(self, api_base: str) -> Optional[dict]:
+        """Return the saved state, or None if there is none or it does not apply"""
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not load state from {self.path}: {str(e)}")
+            return None
+        if state.get("version") != self.VERSION or state.get("api_base") != api_base:
+            return None
+        if self.max_age and time.time() - state.get("saved_at", 0) > self.max_age:
+            print(f"Ignoring state in {self.path}: older than {self.max_age / 3600:g} hour(s)")
+            return None
+        return state
+    
+    def save(self, state: dict):
+        """Atomically write the state; it may hold tokens, so only the owner can read it"""
+        if not self.path:
+            return
+        state = {"version": self.VERSION, "saved_at": time.time(), **state}
+        temp_path = f"{self.path}.tmp"
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(state, f, separators=(',', ':'))
+            os.replace(temp_path, self.path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Warning: Could not save state to {self.path}: {str(e)}")
 
-    return parser.parse_args()
+class StartupTimer:
+    """Time spent in each start-up phase, measured from when the script began executing"""
+    
+    def __init__(self, started_at: float = None):
+        """Start timing at `started_at` (a perf_counter value), or now"""
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        self.last = self.started_at
+        self.phases = []
+        self.reported = False
+    
+    def mark(self, phase: str, at: float = None):
+        """Close the current phase under the given name"""
+        at = time.perf_counter() if at is None else at
+        self.phases.append((phase, at - self.last))
+        self.last = at
+    
+    def describe(self, first_requests: Dict[str, float]) -> List[str]:
+        """Return the phase breakdown and when the first requests went out"""
+        lines = [", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in self.phases if seconds >= 0.0005)]
+        for endpoint, at in sorted(first_requests.items(), key=lambda item: item[1]):
+            lines.append(f"first {endpoint} request {(at - self.started_at) * 1000:.0f} ms after start")
+        return lines
 
 class HSAChecker:
     """HSA Exam Slot Checker class"""
     
-    def __init__(self, args):
+    def __init__(self, args, startup: StartupTimer = None):
         """Initialize the checker with arguments"""
+        self.startup = startup or StartupTimer()
+        
+        # Replay answers API calls from a recording on a virtual clock, without network or state files
+        self.replay = self._start_replay(args) if args.replay else None
+        self.clock = self.replay.clock if self.replay else time
         self.batch_code = args.batch_code
         self.location_id = args.location_id
         self.from_email = "validated-email"
@@ -59,20 +3143,33 @@ class HSAChecker:
         self.delay = args.delay
         self.no_email = args.no_email
         self.verbose = args.verbose
-        self.monitor_mode = args.monitor
+        self.monitor_mode = args.monitor or bool(args.serve) or bool(self.replay)
         self.phone = args.phone
         self.password = args.password
         self.token = args.token
         self.show_batches_only = args.show_batches
         self.check_all_batches = args.all_batches
         self.batch_status = args.status
+        self.api_base = args.api_base.rstrip('/')
         
         # Variables that will be set later
-        self.period_id = None
+        self.period_selection = args.periods
+        self.period_ids = []
+        self.periods = {}
+        self.batch_periods = {}
         self.batch_id = None
         self.batch_name = None
         self.batch_code = None
         self.results_file = f"results-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.tmp"
+        self.results_jsonl = os.path.splitext(self.results_file)[0] + ".jsonl"
+        self.writer = ResultWriter(
+            self.results_file,
+            self.results_jsonl,
+            flush_every=args.log_flush_every,
+            max_bytes=int(args.log_max_mb * 1024 * 1024),
+            max_age=args.log_max_hours * 3600,
+            keep=args.log_keep
+        )
         self.available_found = False
         
         # Setup headers
@@ -88,229 +3185,508 @@ class HSAChecker:
             "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36"
         }
         
+        # Responses fetched ahead of time by the async engine, keyed by URL
+        self._prefetched = {}
+        
+        # Period, batch and location lists rarely change within an exam period
+        self.discovery_cache = DiscoveryCache(args.cache_ttl, args.cache_size, self.clock)
+        self.batch_statuses = {}
+        # Period, batch and location lists are fetched concurrently on one shared pool
+        self.discovery_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hsa-discovery")
+        
+        # Counters and histograms for the metrics endpoint and JSON dump
+        self.metrics = Metrics()
+        self.metrics_json = args.metrics_json
+        if args.metrics_port:
+            self.metrics.serve(args.metrics_port)
+        
+        # Overall time budget per check, and duplicates for slow slot requests
+        self.scan_deadline = args.scan_deadline
+        self._deadline = None
+        self.hedge = HedgePolicy(args.hedge_percentile, args.hedge_budget, self.metrics) if args.hedge else None
+        
+        # Daemon mode: one poller publishing state and events to local subscribers
+        self.availability = None
+        if args.serve and not self.show_batches_only:
+            try:
+                self.availability = AvailabilityServer(args.serve, args.serve_host)
+            except OSError as e:
+                print(f"Error: Could not serve on {args.serve_host}:{args.serve}: {str(e)}")
+                sys.exit(1)
+        
+        # Notifications are delivered by background threads, one per sink
+        default_sinks = args.notify or (["sound"] + ([] if self.no_email else ["ses"]))
+        if self.show_batches_only:
+            default_sinks = []
+        self.notifier = NotificationDispatcher(self._create_sinks(default_sinks, args), args.notify_window,
+                                               args.notify_retries, metrics=self.metrics)
+        
+        # Watch rules narrow the scan plan and can have notifications of their own
+        self.watchlist = None
+        self.rule_notifiers = {}
+        if args.watchlist:
+            try:
+                self.watchlist = Watchlist.load(args.watchlist, self.batch_status)
+            except (OSError, ValueError) as e:
+                print(f"Error: Could not load watchlist from {args.watchlist}: {str(e)}")
+                sys.exit(1)
+            self.check_all_batches = True
+            for rule in self.watchlist.rules:
+                if rule.notify:
+                    self.rule_notifiers[rule.name] = NotificationDispatcher(
+                        self._create_sinks(rule.notify, args), args.notify_window, args.notify_retries,
+                        metrics=self.metrics)
+        
+        # Decides which locations each cycle checks when a budget is set
+        self.scheduler = PollScheduler(args.budget, clock=self.clock)
+        
+        # Several checkers can share the locations through leases in a common database
+        self.cluster = None
+        if args.cluster_db and not self.show_batches_only:
+            import socket
+            node_id = args.node_id or f"{socket.gethostname()}-{os.getpid()}"
+            try:
+                self.cluster = ClusterCoordinator(args.cluster_db, node_id, args.shards, args.lease_ttl).start()
+            except sqlite3.Error as e:
+                print(f"Error: Could not open cluster database {args.cluster_db}: {str(e)}")
+                sys.exit(1)
+        
+        # Seat counts from the previous responses, so only changes are reported
+        self.slot_states = SlotStateTable()
+        
+        # Every observation is kept for the history subcommand
+        self.history = None if args.no_history or self.show_batches_only else HistoryStore(args.history_db)
+        self.engine = AsyncScanEngine(self, args.concurrency) if args.engine == "async" else None
+        
+        # Adaptive rate limiter replacing the fixed delay between calls
+        if self.engine:
+            initial_rate, burst = args.rps, min(self.engine.concurrency, max(args.rps, 1.0))
+        else:
+            initial_rate, burst = (1.0 / self.delay if self.delay > 0 else args.max_rps), 1.0
+        self.limiter_state_file = args.limiter_state
+        self.limiter = AdaptiveRateLimiter(initial_rate, args.max_rps, burst, self.clock)
+        if self.limiter.load(self.limiter_state_file) and self.verbose:
+            print(f"Restored rate limiter state: {self.limiter.describe()}")
+        
+        # Every exchange can be recorded for a later --replay
+        self.recorder = None
+        if args.record:
+            try:
+                self.recorder = TrafficRecorder(args.record, self.api_base)
+            except OSError as e:
+                print(f"Error: Could not record to {args.record}: {str(e)}")
+                sys.exit(1)
+        
+        # Shared connection pool for every API call
+        pool_size = max(args.pool_size, args.concurrency) if self.engine else args.pool_size
+        self.transport = self.replay or HTTPTransport(
+            pool_size=pool_size,
+            connect_timeout=args.connect_timeout,
+            read_timeout=args.read_timeout,
+            retries=args.retries,
+            recorder=self.recorder
+        )
+        self.startup.mark("transport")
+        
+        # Several accounts: the first one also serves discovery unless -t/-p is given
+        accounts = []
+        if args.accounts:
+            try:
+                accounts = load_accounts(args.accounts)
+            except (OSError, ValueError) as e:
+                print(f"Error: Could not load accounts from {args.accounts}: {str(e)}")
+                sys.exit(1)
+            if not self.token and not (self.phone and self.password):
+                self.token = accounts[0].get('token')
+                self.phone = accounts[0].get('phone')
+                self.password = accounts[0].get('password')
+        
+        # Tokens are cached on disk so restarts skip the sign-in
+        self.token_cache = TokenCache(args.token_cache)
+        
+        self.startup.mark("setup")
+        
+        # A snapshot from the last run skips discovery and keeps already-seen seats quiet
+        self.state_store = StateStore(args.state_file, args.state_max_age * 3600)
+        self._restore_state()
+        self.startup.mark("state")
+        self.account = AccountWorker("primary", self.transport, self.limiter, self.base_headers, self.token_cache,
+                                     self.token, self.phone, self.password, self.api_base, self.metrics, self.hedge)
+        
         # Authenticate if needed
         if not self.token and self.phone and self.password:
             self.authenticate()
+        self.startup.mark("auth")
+        
+        # Listing batches only needs the primary account
+        self.pool = self._create_pool(args, accounts) if accounts and not self.show_batches_only else None
+        self.startup.mark("accounts")
             
-        if self.token:
-            self.headers = {**self.base_headers, "Authorization": f"Bearer {self.token}"}
-        else:
+        if not self.token:
             print("Error: No authentication token available. Please provide either a token with -t or phone/password with -p/-w")
             sys.exit(1)
     
+    def _start_replay(self, args) -> ReplayTransport:
+        """Load a --replay recording and start its virtual clock"""
+        try:
+            replay = ReplayTransport(args.replay)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error: Could not load recording from {args.replay}: {str(e)}")
+            sys.exit(1)
+        
+        # Nothing from a replay may leak into the state, history or token files of real runs
+        args.state_file = ""
+        args.limiter_state = ""
+        args.token_cache = ""
+        args.no_history = True
+        args.record = None
+        if not (args.token or args.phone or args.accounts):
+            args.token = "replay"
+        
+        print(f"Replaying {replay.duration:.1f}s of recorded traffic at {args.speed:g}x: "
+              f"{len(replay.openings)} seat opening(s) to detect")
+        replay.start(args.speed)
+        return replay
+    
     def authenticate(self) -> bool:
         """Authenticate and get a token"""
-        print(f"Authenticating with phone number {self.phone}...")
+        authenticated = self.account.authenticate()
+        self.token = self.account.token
+        return authenticated
+    
+    @property
+    def headers(self) -> dict:
+        """Request headers carrying the primary account's current token"""
+        return self.account.headers()
+    
+    def _create_pool(self, args, accounts: List[dict]) -> Optional[WorkerPool]:
+        """Authenticate every account and build the worker pool from the ones that work"""
+        workers = []
+        for index, account in enumerate(accounts):
+            name = account.get('name') or account.get('phone') or f"account-{index + 1}"
+            if index == 0 and account.get('phone') == self.phone and account.get('token') in (None, self.token):
+                # The primary account already has its own pool, limiter and token
+                self.account.name = name
+                workers.append(self.account)
+                continue
+            
+            transport = self.replay or HTTPTransport(
+                pool_size=args.pool_size,
+                connect_timeout=args.connect_timeout,
+                read_timeout=args.read_timeout,
+                retries=args.retries,
+                recorder=self.recorder
+            )
+            initial_rate = 1.0 / self.delay if self.delay > 0 else args.max_rps
+            limiter = AdaptiveRateLimiter(initial_rate, args.max_rps, clock=self.clock)
+            worker = AccountWorker(name, transport, limiter, self.base_headers, self.token_cache,
+                                   account.get('token'), account.get('phone'), account.get('password'), self.api_base,
+                                   self.metrics, self.hedge)
+            if worker.token or worker.authenticate():
+                workers.append(worker)
+            else:
+                print(f"Warning: Skipping account {name}, authentication failed")
         
-        auth_data = {"id": self.phone, "password": self.password}
+        if not workers:
+            print("Warning: No account in the accounts file could be authenticated")
+            return None
+        print(f"Sharding slot checks across {len(workers)} account(s)")
+        return WorkerPool(workers, self.clock)
+    
+    def api_call(self, url: str, method: str = 'GET', data: dict = None, raw: bool = False) -> Union[dict, bytes]:
+        """Safely make a rate-limited API call; raw=True returns the unparsed body (b"" on failure)"""
+        if url in self._prefetched:
+            self.metrics.inc("hsa_prefetched_responses_total", endpoint=endpoint_name(url))
+            return self._prefetched.pop(url)
         
         try:
-            response = requests.post(
-                'https://api.hsa.edu.vn/accounts/sign-in',
-                headers=self.base_headers,
-                json=auth_data
-            )
+            response = self._send(method, url, data)
             response.raise_for_status()
-            
-            auth_data = response.json()
-            self.token = auth_data.get('token')
-            
-            if not self.token:
-                print("Authentication failed. Check your phone number and password.")
-                print(f"Response: {response.text}")
-                return False
-            
-            print("Authentication successful!")
-            return True
-            
+            return response.content if raw else response.json()
         except requests.exceptions.RequestException as e:
-            print(f"Authentication failed: {str(e)}")
-            return False
-        finally:
-            time.sleep(self.delay)
+            print(f"API call failed: {str(e)}")
+            self.metrics.inc("hsa_api_call_failures_total", endpoint=endpoint_name(url))
+            return b"" if raw else {}
     
-    def api_call(self, url: str, method: str = 'GET', data: dict = None) -> dict:
-        """Safely make an API call with delay"""
+    def fetch_raw(self, url: str, cancelled: threading.Event = None) -> bytes:
+        """GET a raw body for the prefetch engine, bypassing prefetched responses (b"" on failure or cancellation)"""
+        if cancelled is not None and cancelled.is_set():
+            return b""
         try:
-            if method.upper() == 'GET':
-                response = requests.get(url, headers=self.headers)
-            else:  # POST
-                response = requests.post(url, headers=self.headers, json=data)
-            
+            response = self._send('GET', url, cancelled=cancelled)
             response.raise_for_status()
-            return response.json()
+            return response.content
+        except CancelledError:
+            return b""
         except requests.exceptions.RequestException as e:
             print(f"API call failed: {str(e)}")
-            return {}
-        finally:
-            time.sleep(self.delay)
+            self.metrics.inc("hsa_api_call_failures_total", endpoint=endpoint_name(url))
+            return b""
+    
+    def _send(self, method: str, url: str, data: dict = None, extra_headers: dict = None,
+              cancelled: threading.Event = None) -> 'requests.Response':
+        """Send an authenticated request through the primary account's pool and rate limiter"""
+        return self.account.request(method, url, data, extra_headers, cancelled)
+    
+    def cached_call(self, endpoint: str, url: str) -> Union[list, dict]:
+        """Make a GET call through the discovery cache, revalidating stale entries"""
+        cache = self.discovery_cache
+        entry = cache.get(url)
+        if entry is not None and cache.is_fresh(entry):
+            cache.stats["hits"] += 1
+            return entry["payload"]
+        
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        
+        try:
+            response = self._send('GET', url, extra_headers=headers)
+            if response.status_code == 304 and entry is not None:
+                cache.stats["revalidated"] += 1
+                cache.refresh(url)
+                return entry["payload"]
+            response.raise_for_status()
+            payload = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"API call failed: {str(e)}")
+            # Serve the stale copy rather than losing discovery for this cycle
+            return entry["payload"] if entry is not None else {}
+        
+        cache.stats["misses"] += 1
+        if payload:
+            cache.put(url, endpoint, payload, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return payload
     
     def fetch_periods(self) -> list:
         """Fetch available exam periods"""
-        return self.api_call("https://api.hsa.edu.vn/exam/views/registration/available-period")
+        return self.cached_call("periods", f"{self.api_base}/exam/views/registration/available-period")
     
     def fetch_batches(self, period_id: str) -> list:
         """Fetch batches for a period"""
-        return self.api_call(f"https://api.hsa.edu.vn/exam/views/registration/available-batch?periodId={period_id}")
+        batches = self.cached_call("batches", f"{self.api_base}/exam/views/registration/available-batch?periodId={period_id}")
+        
+        # A batch changing status (e.g. leaving OPENING) invalidates its cached locations
+        for batch in batches or []:
+            batch_id = batch.get('id')
+            status = batch.get('status')
+            previous = self.batch_statuses.get(batch_id)
+            if previous is not None and previous != status:
+                if self.verbose:
+                    print(f"Batch {batch.get('code')} changed status from {previous} to {status}")
+                self.discovery_cache.invalidate(self._locations_url(batch_id))
+            self.batch_statuses[batch_id] = status
+            self.scheduler.set_deadline(batch.get('code'), parse_deadline((batch.get('config') or {}).get('registrationEndDateTime')))
+        
+        return batches
     
     def fetch_locations(self, batch_id: str) -> list:
         """Fetch locations for a batch"""
-        return self.api_call(f"https://api.hsa.edu.vn/exam/views/registration/available-location?batchId={batch_id}")
+        return self.cached_call("locations", self._locations_url(batch_id))
     
-    def play_notification_sound(self):
-        """Play notification sound based on platform"""
-        try:
-            system = platform.system()
-            if system == "Darwin":  # macOS
-                subprocess.Popen(['afplay', '/System/Library/Sounds/Submarine.aiff'])
-            elif system == "Linux":
-                if os.path.exists("/usr/bin/paplay"):
-                    subprocess.Popen(['paplay', '/usr/share/sounds/freedesktop/stereo/complete.oga'])
-                elif os.path.exists("/usr/bin/aplay"):
-                    subprocess.Popen(['aplay', '/usr/share/sounds/sound-icons/prompt.wav'])
-            elif system == "Windows":
-                subprocess.Popen(['powershell.exe', '-c', "(New-Object Media.SoundPlayer 'C:\\Windows\\Media\\notify.wav').PlaySync();"])
-        except Exception as e:
-            print(f"Failed to play notification sound: {str(e)}")
-    
-    def send_email_notification(self, batch_name=None, batch_code=None):
-        """Send an email notification"""
+    def discover_batches(self) -> list:
+        """Fetch the batches of every selected exam period as one list
+        
+        Batch lists are fetched concurrently. With explicit --periods IDs they
+        are requested alongside the period list instead of waiting for it.
+        """
+        executor = self.discovery_executor
+        periods_future = executor.submit(self.fetch_periods)
+        if isinstance(self.period_selection, list):
+            period_ids = self.period_selection
+        else:
+            # IDs are compared as strings, like the --periods values
+            period_ids = [str(p.get('id')) for p in periods_future.result() or [] if p.get('id')]
+            if self.period_selection == "first":
+                period_ids = period_ids[:1]
+        batch_futures = [(period_id, executor.submit(self.fetch_batches, period_id)) for period_id in period_ids]
+        
+        self.periods = {str(p.get('id')): p for p in periods_future.result() or []}
+        self.period_ids = period_ids
+        batches = {}
+        for period_id, future in batch_futures:
+            for batch in future.result() or []:
+                # A batch listed under two overlapping periods is still checked once
+                if batch.get('id') not in batches:
+                    self.batch_periods[batch.get('id')] = period_id
+                    batches[batch.get('id')] = batch
+        return list(batches.values())
+    
+    def warm_locations(self, batch_ids: list):
+        """Fetch the location lists of several batches concurrently into the discovery cache"""
+        if len(batch_ids) > 1:
+            list(self.discovery_executor.map(self.fetch_locations, batch_ids))
+    
+    def _locations_url(self, batch_id: str) -> str:
+        """Return the URL listing locations for a batch"""
+        return f"{self.api_base}/exam/views/registration/available-location?batchId={batch_id}"
+    
+    def _slots_url(self, location_id: str) -> str:
+        """Return the URL listing slots for a location"""
+        return f"{self.api_base}/exam/views/registration/available-slot?locationId={location_id}"
+    
+    def _slot_urls(self, location_lists) -> List[str]:
+        """Return the distinct slot URLs a scan of these location lists will request"""
+        if self.location_id:
+            return [self._slots_url(self.location_id)]
+        urls = [self._slots_url(location.get('id')) for locations in location_lists for location in locations or []]
+        return list(dict.fromkeys(urls))
+    
+    def _prefetch(self, batch_ids: list, plan: Optional[Dict[str, list]]):
+        """Fetch slot responses ahead of the sequential scan with the worker pool or async engine"""
+        if self.pool:
+            location_lists = plan.values() if plan is not None else [self.fetch_locations(b) for b in batch_ids]
+            self._prefetched.update(self.pool.fetch_all(self._slot_urls(location_lists), self._deadline))
+        elif self.engine:
+            self.engine.prefetch_batches(batch_ids, plan, self._deadline)
+    
+    def _create_sinks(self, specs: List[str], args) -> list:
+        """Build notification sinks from specs such as sound, ses or file:PATH"""
+        sinks = []
+        for spec in specs:
+            kind, _, target = spec.partition(':')
+            if kind in ("ses", "smtp") and self.no_email:
+                continue
+            if kind == "sound":
+                sinks.append(SoundSink())
+            elif kind == "ses":
+                try:
+                    sinks.append(SESSink(self.from_email, self.to_email))
+                except ImportError:
+                    print("Warning: boto3 not installed. Email notifications disabled.")
+                    print("Install boto3 with: pip install boto3")
+            elif kind == "smtp":
+                if not args.smtp_host:
+                    print("Warning: --notify smtp needs --smtp-host. SMTP notifications disabled.")
+                    continue
+                sinks.append(SMTPSink(args.smtp_host, args.smtp_port, args.smtp_user, args.smtp_password, self.to_email))
+            elif kind == "webhook" and target:
+                sinks.append(WebhookSink(target))
+            elif kind == "file" and target:
+                sinks.append(FileSink(target))
+            else:
+                print(f"Error: Unknown notification sink '{spec}'. Use sound, ses, smtp, webhook:URL or file:PATH")
+                sys.exit(1)
+        return sinks
+    
+    def notify(self, result: ScanResult, batch_name=None, batch_code=None):
+        """Render a notification and hand it to the dispatcher without waiting for delivery"""
         if self.no_email:
             print(f"{self._timestamp()} Email notifications disabled.")
-            return True
         
-        try:
-            import boto3
-            from botocore.exceptions import ClientError
-            
-            subject = "HSA Exam Slots Available!"
-            timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
-            # Use provided batch details or instance variables
-            batch_name = batch_name or self.batch_name
-            batch_code = batch_code or self.batch_code
-            
-            # Read available slots from the results file
-            available_slots = []
-            with open(self.results_file, 'r') as f:
-                for line in f:
-                    if "✓" in line and "has" in line and "available" in line:
-                        available_slots.append(line.strip())
-            
-            # Create a simplified summary for the email
-            text_content = f"HSA Exam Slots Available as of {timestamp}\n\n"
-            
-            if batch_name and batch_code:
-                text_content += f"Batch: {batch_name} (Code: {batch_code})\n\n"
-            else:
-                text_content += "Multiple batches have available slots\n\n"
-                
-            text_content += "Available slots summary:\n"
-            for slot in available_slots:
-                text_content += f"{slot.split(' ', 1)[1]}\n"  # Remove timestamp
-            text_content += "\n\nCheck https://id.hsa.edu.vn to register now."
-            
-            # Create HTML version
-            html_content = "<html><body>"
-            html_content += f"<h1>HSA Exam Slots Available!</h1>"
-            html_content += f"<p>As of {timestamp}, the following locations have available slots:</p>"
-            
-            if batch_name and batch_code:
-                html_content += f"<p><strong>Batch:</strong> {batch_name} (Code: {batch_code})</p>"
-            else:
-                html_content += "<p><strong>Multiple batches have available slots</strong></p>"
-                
-            html_content += "<ul>"
-            
-            for slot in available_slots:
-                parts = slot.split(" ✓ ", 1)
-                if len(parts) > 1:
-                    slot_info = parts[1]
-                    location_info = slot_info.split(" (ID: ")
-                    if len(location_info) > 1:
-                        location = location_info[0]
-                        id_and_slots = location_info[1].split(") has ")
-                        if len(id_and_slots) > 1:
-                            location_id = id_and_slots[0]
-                            slots = id_and_slots[1].replace(" available", "")
-                            html_content += f"<li><strong>{location}</strong> (ID: {location_id}): {slots} available sessions</li>"
-            
-            html_content += "</ul>"
-            html_content += "<p>Visit <a href='https://id.hsa.edu.vn'>id.hsa.edu.vn</a> to register now!</p>"
-            html_content += "</body></html>"
-            
-            # Configure email
-            client = boto3.client('ses', region_name='us-east-1')
-            
-            message = {
-                'Subject': {'Data': subject, 'Charset': 'UTF-8'},
-                'Body': {
-                    'Text': {'Data': text_content, 'Charset': 'UTF-8'},
-                    'Html': {'Data': html_content, 'Charset': 'UTF-8'}
-                }
-            }
-            
-            client.send_email(
-                Source=self.from_email,
-                Destination={'ToAddresses': [self.to_email]},
-                Message=message
-            )
-            
-            print(f"{self._timestamp()} Email notification sent to {self.to_email}")
-            return True
-            
-        except ImportError:
-            print(f"{self._timestamp()} Warning: boto3 not installed. Email not sent.")
-            print("Install boto3 with: pip install boto3")
-            return False
-        except Exception as e:
-            print(f"{self._timestamp()} Failed to send email: {str(e)}")
-            return False
+        # Use provided batch details or instance variables
+        batch_name = batch_name or self.batch_name
+        batch_code = batch_code or self.batch_code
+        
+        if self.watchlist:
+            # Each rule hears only about its own matches, through its own sinks if it has any
+            for rule, matched in self.watchlist.route(result):
+                subject, text_content, html_content = render_notification(matched, batch_name, batch_code)
+                notifier = self.rule_notifiers.get(rule.name, self.notifier)
+                notifier.submit(Notification(f"{subject} [{rule.name}]", text_content, html_content))
+                self._log(f"Watch rule '{rule.name}' matched {len(matched.available_locations)} location(s)")
+            return
+        
+        self.notifier.submit(Notification(*render_notification(result, batch_name, batch_code)))
     
-    def check_slots(self, location_id: str, location_name: str, batch_name: str = None, batch_code: str = None) -> bool:
+    def check_slots(self, location_id: str, location_name: str, batch_name: str = None, batch_code: str = None) -> LocationResult:
         """Check available slots for a location"""
-        response = self.api_call(f"https://api.hsa.edu.vn/exam/views/registration/available-slot?locationId={location_id}")
+        body = self.api_call(self._slots_url(location_id), raw=True)
+        
+        # A body identical to the last one needs no parsing, diffing or logging
+        fingerprint = hashlib.blake2b(body, digest_size=16).digest() if body else None
+        if self.slot_states.unchanged(batch_code, location_id, fingerprint):
+            return self._unchanged_slots(location_id, location_name, batch_name, batch_code)
+        try:
+            response = json.loads(body) if body else None
+        except ValueError as e:
+            print(f"API call failed: invalid JSON in slot response: {str(e)}")
+            response = None
         
         if not response:
             self._log(f"× Failed to fetch slots for {location_name} (ID: {location_id})")
-            return False
+            self.metrics.inc("hsa_location_checks_total", outcome="failed")
+            result = LocationResult(batch_code, batch_name, location_id, location_name, ok=False)
+            self._log_record(result)
+            if self.availability:
+                self.availability.publish_location(result)
+            return result
         
-        # Get count of available slots
-        available_count = 0
-        available_slots = []
+        result = LocationResult(batch_code, batch_name, location_id, location_name, table=self.slot_states)
+        self.metrics.inc("hsa_slot_responses_total", outcome="changed")
         
-        for slot in response:
-            # Convert ID to string to ensure compatibility
-            slot_id = str(slot.get('id'))
-            name = slot.get('name')
-            total = int(slot.get('numberOfSeats', 0))
-            registered = int(slot.get('registeredSlots', 0))
-            available = total - registered
-            
-            if available > 0:
-                available_count += 1
-                batch_prefix = f"[{batch_code}] " if batch_code else ""
-                slot_info = f"{self._timestamp()} → {batch_prefix}{name} (ID: {slot_id}): {available}/{total}"
-                available_slots.append(slot_info)
+        # Convert IDs to strings to ensure compatibility
+        rows = [(str(slot.get('id')), slot.get('name'), int(slot.get('numberOfSeats', 0)),
+                 int(slot.get('registeredSlots', 0))) for slot in response]
+        available_count = sum(1 for _, _, total, registered in rows if total > registered)
+        if self.history:
+            for slot_id, name, total, registered in rows:
+                self.history.record(batch_code, location_id, location_name, slot_id, name, total, registered)
+        
+        # Diff against the previous response so only transitions are reported
+        previous_observation = self.slot_states.last_observed(batch_code, location_id)
+        events = self.slot_states.update(batch_code, location_id, rows, fingerprint)
+        result.events = events
+        
+        self.metrics.inc("hsa_location_checks_total", outcome="available" if available_count else "full")
+        for event in events:
+            self.metrics.inc("hsa_slot_events_total", kind=event.kind)
+            if event.adds_seats and previous_observation is not None:
+                # The seats opened at some point since the previous look: an upper bound on detection latency
+                self.metrics.observe("hsa_detection_latency_seconds", time.time() - previous_observation,
+                                     Metrics.DETECTION_BUCKETS)
         
         # Display results
         batch_info = f" for {batch_name} (Code: {batch_code})" if batch_name and batch_code else ""
         
         if available_count == 0:
-            if self.verbose:
+            if events:
+                self._log(f"× No available slots at {location_name} (ID: {location_id}){batch_info} anymore:")
+            elif self.verbose:
                 self._log(f"× No available slots at {location_name} (ID: {location_id}){batch_info}")
             else:
                 self._log_file(f"× No available slots at {location_name} (ID: {location_id}){batch_info}")
-        else:
+        elif events:
             self._log(f"✓ {location_name} (ID: {location_id}){batch_info} has {available_count} available session(s):")
-            for slot in available_slots:
-                self._log(slot)
-            return True
+        elif self.verbose:
+            self._log(f"= {location_name} (ID: {location_id}){batch_info} still has {available_count} available session(s)")
+        else:
+            self._log_file(f"= {location_name} (ID: {location_id}){batch_info} still has {available_count} available session(s)")
         
-        return False
+        for event in events:
+            self._log(f"→ {event.describe()}")
+        
+        self._log_record(result)
+        if self.availability:
+            self.availability.publish_location(result)
+        return result
+    
+    def _unchanged_slots(self, location_id: str, location_name: str, batch_name: str, batch_code: str) -> LocationResult:
+        """Result for a location whose slot response is byte-for-byte the previous one"""
+        result = LocationResult(batch_code, batch_name, location_id, location_name, table=self.slot_states)
+        self.metrics.inc("hsa_slot_responses_total", outcome="unchanged")
+        self.metrics.inc("hsa_location_checks_total", outcome="available" if result else "full")
+        if self.availability:
+            self.availability.publish_location(result)
+        return result
+    
+    def run_check_for_batch(self, batch_id, batch_name, batch_code, planned: list = None) -> BatchResult:
+        """Run a check for a specific batch, limited to the planned locations if given"""
+        result = BatchResult(batch_id, batch_code, batch_name)
+        started = time.perf_counter()
+        try:
+            self._check_batch(result, planned)
+        finally:
+            self.metrics.observe("hsa_batch_check_duration_seconds", time.perf_counter() - started,
+                                 Metrics.DURATION_BUCKETS, batch=batch_code)
+        return result
     
-    def run_check_for_batch(self, batch_id, batch_name, batch_code):
-        """Run a check for a specific batch"""
+    def _check_batch(self, result: BatchResult, planned: list = None):
+        """Check the locations of one batch into `result`"""
+        batch_id, batch_name, batch_code = result.batch_id, result.batch_name, result.batch_code
         self._log(f"Starting check for Batch: {batch_name} (Code: {batch_code}, ID: {batch_id})")
         self._log("-------------------------------------------------------------------")
         
@@ -328,26 +3704,35 @@ class HSAChecker:
                     break
             
             # Check slots for this location
-            locations_with_slots = 1 if self.check_slots(self.location_id, location_name, batch_name, batch_code) else 0
+            result.locations.append(self.check_slots(self.location_id, location_name, batch_name, batch_code))
         else:
             # Fetch all locations
             locations_response = self.fetch_locations(batch_id)
             
             if not locations_response:
                 self._log(f"Error: Failed to fetch locations for batch {batch_code} or empty response")
-                return False
+                return
             
             # Process each location
             location_count = 0
-            locations_with_slots = 0
             
-            self._log(f"Processing all locations in batch {batch_code}...")
+            if planned is not None:
+                self._log(f"Processing {len(planned)} of {len(locations_response)} locations in batch {batch_code}...")
+                locations_response = planned
+            else:
+                self._log(f"Processing all locations in batch {batch_code}...")
             
             total_locations = len(locations_response)
             
+            carried = []
             for location in locations_response:
                 location_id = location.get('id')
                 location_name = location.get('name')
+                
+                # Past the deadline only responses that were already fetched are used
+                if self._deadline_passed() and self._slots_url(location_id) not in self._prefetched:
+                    carried.append((str(batch_code), str(location_id)))
+                    continue
                 location_count += 1
                 
                 # Show progress
@@ -357,43 +3742,64 @@ class HSAChecker:
                     print(f"\rChecking location {location_count}/{total_locations}...", end="", flush=True)
                 
                 # Check slots
-                if self.check_slots(location_id, location_name, batch_name, batch_code):
-                    locations_with_slots += 1
+                location_result = self.check_slots(location_id, location_name, batch_name, batch_code)
+                self.scheduler.observe(location_result)
+                result.locations.append(location_result)
             
             # Clear progress line
             print("\r" + " " * 80 + "\r", end="", flush=True)
             
+            if carried:
+                self.scheduler.carry_over(carried)
+                self._log(f"Scan deadline reached: {len(carried)} location(s) in batch {batch_code} carried over to the next check")
+            
             # Display batch summary
             self._log(f"--------------------------------------------------------------------")
             self._log(f"Batch: {batch_name} (Code: {batch_code})")
             self._log(f"Total locations checked: {location_count}")
-            self._log(f"Locations with available slots: {locations_with_slots}")
+            self._log(f"Locations with available slots: {len(result.locations_with_slots)}")
             self._log("--------------------------------------------------------------------")
-        
-        # Return if slots were found
-        return locations_with_slots > 0
     
-    def run_check(self):
+    def run_check(self) -> ScanResult:
         """Run checks across all selected batches"""
         self._log("===================================================================")
         self._log("STARTING SLOT CHECK")
         self._log("===================================================================")
+        self.transport.start_scan()
+        scan = ScanResult()
+        if self.cluster:
+            try:
+                self.cluster.acquire()
+            except sqlite3.Error as e:
+                # Keep the shards from the last successful renewal rather than stop checking
+                print(f"Warning: Could not renew cluster leases: {str(e)}")
+            self.metrics.set("hsa_cluster_shards_owned", len(self.cluster.owned))
+            self.metrics.set("hsa_cluster_nodes", self.cluster.nodes)
+        self._deadline = self.clock.monotonic() + self.scan_deadline if self.scan_deadline else None
         
         if self.check_all_batches:
-            # Get all matching batches
-            batches_response = self.fetch_batches(self.period_id)
-            matching_batches = [b for b in batches_response if b.get('status') == self.batch_status]
+            # Get all matching batches across the selected periods
+            batches_response = self.discover_batches()
+            if self.watchlist:
+                matching_batches = [b for b in batches_response if self.watchlist.wants_batch(b)]
+            else:
+                matching_batches = [b for b in batches_response if b.get('status') == self.batch_status]
             
             if not matching_batches:
                 self._log(f"No batches with status '{self.batch_status}' found.")
-                return False
+                self.available_found = False
+                self._publish_scan(scan)
+                self.writer.flush()
+                return scan
             
             self._log(f"Checking {len(matching_batches)} batches with status '{self.batch_status}'")
             
-            # Track overall results
-            total_batches_checked = 0
-            batches_with_slots = 0
-            self.available_found = False
+            # Batches with the most locations left over from a check that hit its deadline go first
+            matching_batches.sort(key=lambda b: -self.scheduler.carried_count(b.get('code')))
+            self.warm_locations([b.get('id') for b in matching_batches])
+            
+            plan = self._plan_scan(matching_batches)
+            self._prefetch([b.get('id') for b in matching_batches], plan)
             
             # Check each batch
             for batch in matching_batches:
@@ -401,12 +3807,9 @@ class HSAChecker:
                 batch_name = batch.get('name')
                 batch_code = batch.get('code')
                 
-                total_batches_checked += 1
-                
                 # Run check for this batch
-                if self.run_check_for_batch(batch_id, batch_name, batch_code):
-                    batches_with_slots += 1
-                    self.available_found = True
+                planned = plan.get(batch_id) if plan is not None else None
+                scan.batches.append(self.run_check_for_batch(batch_id, batch_name, batch_code, planned))
                 
                 # Add a separator between batches
                 self._log("-------------------------------------------------------------------")
@@ -415,36 +3818,226 @@ class HSAChecker:
             self._log("====================================================================")
             self._log("OVERALL RESULTS SUMMARY:")
             self._log("====================================================================")
-            self._log(f"Total batches checked: {total_batches_checked}")
-            self._log(f"Batches with available slots: {batches_with_slots}")
+            self._log(f"Total batches checked: {len(scan.batches)}")
+            self._log(f"Batches with available slots: {sum(1 for b in scan.batches if b)}")
             self._log("--------------------------------------------------------------------")
             
-            # Notify if slots found in any batch
+            # Notify if new seats opened in any batch
+            scan.finished_at = datetime.datetime.now()
+            self._claim_cluster_events(scan)
+            self.available_found = bool(scan)
             if self.available_found:
-                if not self.no_email:
-                    self.send_email_notification(batch_name=None, batch_code=None)  # Send with no specific batch
-                self.play_notification_sound()
+                if self._has_new_seats(scan):
+                    self.notify(scan, batch_name=None, batch_code=None)  # Send with no specific batch
             else:
                 self._log("No available slots found in any batch.")
             
         else:
             # Use the single batch we've already identified
-            self.available_found = self.run_check_for_batch(self.batch_id, self.batch_name, self.batch_code)
+            plan = self._plan_scan([{'id': self.batch_id, 'code': self.batch_code}])
+            self._prefetch([self.batch_id], plan)
+            planned = plan.get(self.batch_id) if plan is not None else None
+            scan.batches.append(self.run_check_for_batch(self.batch_id, self.batch_name, self.batch_code, planned))
             
-            # Show results and send notification if slots are available
+            # Show results and send notification if new seats are available
+            scan.finished_at = datetime.datetime.now()
+            self._claim_cluster_events(scan)
+            self.available_found = bool(scan)
             if self.available_found:
-                if not self.no_email:
-                    self.send_email_notification()
-                self.play_notification_sound()
+                if self._has_new_seats(scan):
+                    self.notify(scan)
             else:
                 self._log("No available slots found.")
         
+        self._prefetched.clear()
+        if self.history:
+            self.history.flush()
+        
         self._log("====================================================================")
         self._log(f"Check completed at {datetime.datetime.now()}")
+        self.writer.write_record({
+            "type": "scan",
+            "started_at": scan.started_at.isoformat(),
+            "finished_at": datetime.datetime.now().isoformat(),
+            "batches": len(scan.batches),
+            "locations": sum(len(b.locations) for b in scan.batches),
+            "locations_with_slots": len(scan.available_locations),
+            "events": len(scan.events)
+        })
+        
+        self.limiter.save(self.limiter_state_file)
+        self._save_state()
+        if self.recorder:
+            self.recorder.flush()
+        self._publish_scan(scan)
+        
+        if self.verbose:
+            self._log_startup()
+            self._log_pool_stats()
+            self._log(f"Rate limiter: {self.limiter.describe()}")
+            self._log(f"Discovery cache: {self.discovery_cache.describe()}")
+            if self.pool:
+                for line in self.pool.describe():
+                    self._log(f"Account {line}")
+            for line in self.notifier.describe():
+                self._log(f"Notifications {line}")
+            if self.hedge:
+                self._log(f"Hedged requests: {self.hedge.describe()}")
+        
+        self.writer.flush()
+        return scan
+    
+    def _publish_scan(self, scan: ScanResult):
+        """Record scan metrics, write the metrics dump and tell live subscribers the check finished"""
+        duration = (datetime.datetime.now() - scan.started_at).total_seconds()
+        locations = sum(len(b.locations) for b in scan.batches)
+        metrics = self.metrics
+        metrics.inc("hsa_scans_total")
+        metrics.observe("hsa_scan_duration_seconds", duration, Metrics.DURATION_BUCKETS)
+        metrics.set("hsa_scan_locations", locations)
+        metrics.set("hsa_scan_locations_per_second", locations / duration if duration > 0 else 0.0)
+        metrics.set("hsa_scan_locations_with_slots", len(scan.available_locations))
+        metrics.set("hsa_last_scan_timestamp_seconds", time.time())
+        metrics.set("hsa_scan_carried_over", len(self.scheduler.carried_over))
+        metrics.set("hsa_rate_limit_requests_per_second", self.limiter.rate)
+        metrics.set("hsa_rate_limit_backoff_events", self.limiter.backoff_events)
+        if self.metrics_json:
+            metrics.dump(self.metrics_json)
+        if self.availability:
+            self.availability.publish_scan(scan)
+    
+    def _plan_scan(self, batches: list) -> Optional[Dict[str, list]]:
+        """Pick the locations to check this cycle within the scheduler budget
+        
+        Returns {batch_id: [location, ...]}, or None when every location is checked.
+        """
+        if self.location_id:
+            if self.watchlist:
+                # Only -l is checked, but the rules still decide which of its slots are reported and where
+                for batch in batches:
+                    locations = self.fetch_locations(batch.get('id')) or []
+                    self.watchlist.compile(batch, [l for l in locations if str(l.get('id')) == str(self.location_id)])
+            return None
+        if not (self.watchlist or self.scheduler.budget or self.scheduler.carried_over or self.cluster):
+            return None
+        
+        locations_by_key = {}
+        total_locations = 0
+        for batch in batches:
+            locations = self.fetch_locations(batch.get('id')) or []
+            total_locations += len(locations)
+            if self.watchlist:
+                locations = self.watchlist.compile(batch, locations)
+            for location in locations:
+                key = (str(batch.get('code')), str(location.get('id')))
+                locations_by_key[key] = (batch.get('id'), location)
+        
+        if self.cluster:
+            candidates = len(locations_by_key)
+            locations_by_key = {key: value for key, value in locations_by_key.items() if self.cluster.owns(*key)}
+            self._log(f"Cluster: {self.cluster.describe()}, checking {len(locations_by_key)} of {candidates} locations")
+        
+        selected = self.scheduler.select(list(locations_by_key))
+        plan = {batch.get('id'): [] for batch in batches}
+        for key in selected:
+            batch_id, location = locations_by_key[key]
+            plan[batch_id].append(location)
+        
+        if self.watchlist:
+            self._log(f"Watchlist: {len(locations_by_key)} of {total_locations} locations can match a rule")
+        carried = sum(1 for key in selected if key in self.scheduler.carried_over)
+        if carried:
+            self._log(f"Checking {carried} location(s) carried over from the last check first")
+        if self.scheduler.budget:
+            self._log(f"Scheduler: checking {len(selected)} of {len(locations_by_key)} locations (budget {self.scheduler.budget})")
+        if self.verbose:
+            for (batch_code, location_id), weight in self.scheduler.hottest():
+                self._log(f"  hot: [{batch_code}] location {location_id} (weight {weight:.2f})")
+        return plan
+    
+    def _restore_state(self):
+        """Load the state snapshot written by a previous run, if any"""
+        state = self.state_store.load(self.api_base)
+        if state is None:
+            return
+        try:
+            self.discovery_cache.load_dict(state.get("discovery", []))
+            self.batch_statuses.update(state.get("batch_statuses") or {})
+            self.batch_periods.update(state.get("batch_periods") or {})
+            self.slot_states.load_dict(state.get("slots") or {})
+            self.scheduler.load_dict(state.get("scheduler") or {})
+            if state.get("limiter"):
+                self.limiter.load_dict(state["limiter"])
+            if self.token_cache.path:
+                self.token_cache.merge(state.get("tokens") or {})
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Warning: Could not restore state from {self.state_store.path}: {str(e)}")
+            return
+        age = time.time() - state.get("saved_at", 0)
+        print(f"Restored state from {self.state_store.path} (saved {age:.0f}s ago): "
+              f"{len(self.discovery_cache.entries)} discovery list(s), {len(self.slot_states)} slot(s), "
+              f"{len(self.scheduler.stats)} scheduled location(s)")
+    
+    def _save_state(self):
+        """Write the state snapshot at the end of a check"""
+        self.state_store.save({
+            "api_base": self.api_base,
+            "discovery": self.discovery_cache.to_dict(),
+            "batch_statuses": self.batch_statuses,
+            "batch_periods": self.batch_periods,
+            "slots": self.slot_states.to_dict(),
+            "scheduler": self.scheduler.to_dict(),
+            "limiter": self.limiter.to_dict(),
+            "tokens": self.token_cache.entries if self.token_cache.path else {}
+        })
+    
+    def _deadline_passed(self) -> bool:
+        """True once the current check has used up --scan-deadline"""
+        return self._deadline is not None and self.clock.monotonic() >= self._deadline
+    
+    def _has_new_seats(self, scan: ScanResult) -> bool:
+        """Summarise this scan's slot transitions and return True if any added seats"""
+        events = scan.events
+        counts = {}
+        for event in events:
+            counts[event.kind] = counts.get(event.kind, 0) + 1
+        
+        if counts:
+            summary = ", ".join(f"{count} {kind}" for kind, count in counts.items())
+            self._log(f"Slot changes since last check: {summary}")
+        
+        if any(event.adds_seats for event in events):
+            return True
         
-        return self.available_found
+        self._log("No new seats since last check, no notification sent.")
+        return False
+    
+    def _claim_cluster_events(self, scan: ScanResult):
+        """Pass a scan's slot changes through the cluster, dropping gains another node already announced
+        
+        Runs after every scan, with or without free seats, so closed and shrunk
+        slots lower the announced seat count before the next gain.
+        """
+        events = scan.events
+        if not self.cluster or not events:
+            return
+        try:
+            gains = self.cluster.claim_notifications(events)
+        except sqlite3.Error as e:
+            print(f"Warning: Could not deduplicate notifications through the cluster: {str(e)}")
+            return
+        duplicates = sum(1 for event in events if event.adds_seats) - len(gains)
+        if duplicates:
+            # Seats another node already announced are not new in this node's notification
+            claimed = {id(event) for event in gains}
+            for batch in scan.batches:
+                for location in batch.locations:
+                    location.events = [event for event in location.events
+                                       if not event.adds_seats or id(event) in claimed]
+            self.metrics.inc("hsa_cluster_duplicate_notifications_total", duplicates)
+            self._log(f"{duplicates} seat gain(s) were already announced by another node")
     
-    def display_batches(self, period_id: str, batches: list):
+    def display_batches(self, batches: list):
         """Display available batches"""
         print("=====================================================================")
         print("AVAILABLE BATCHES:")
@@ -461,33 +4054,46 @@ class HSAChecker:
             end_date = config.get('endDate', 'N/A')
             reg_end = config.get('registrationEndDateTime', 'N/A')
             
-            print(f"Code: {code} | ID: {batch_id} | Name: {name} | Status: {status} | Start: {start_date} | End: {end_date} | Reg ends: {reg_end}")
+            period = f"Period: {self.batch_periods.get(batch_id, 'N/A')} | " if len(self.period_ids) > 1 else ""
+            print(f"{period}Code: {code} | ID: {batch_id} | Name: {name} | Status: {status} | Start: {start_date} | End: {end_date} | Reg ends: {reg_end}")
         
         print("=====================================================================")
     
     def run(self):
         """Main execution method"""
         print("HSA Exam Slot Checker - Python Version")
-        print(f"Using API delay: {self.delay} seconds")
+        if self.pool:
+            print(f"Using {len(self.pool.workers)} account worker(s) for slot checks")
+        elif self.engine:
+            print(f"Using async engine: {self.engine.concurrency} concurrent requests")
+        print(f"Using adaptive request rate: {self.limiter.describe()}")
         
-        # Fetch available periods first
-        print("Fetching available exam periods...")
-        periods_response = self.fetch_periods()
+        # A one-shot check of one location asks for its slots while the batch is being discovered
+        early_slots = None
+        if self.location_id and not self.monitor_mode and not self.show_batches_only:
+            url = self._slots_url(self.location_id)
+            early_slots = (url, self.discovery_executor.submit(self.api_call, url, raw=True))
         
-        if not periods_response:
+        # Fetch the selected periods and their batches
+        print("Fetching available exam periods and batches...")
+        batches_response = self.discover_batches()
+        self.startup.mark("discovery")
+        
+        if not self.period_ids:
             print("Error: No active exam periods found.")
             return False
         
-        # Extract the first period ID
-        self.period_id = periods_response[0].get('id')
-        print(f"Found period ID: {self.period_id}")
-        
-        # Fetch available batches
-        batches_response = self.fetch_batches(self.period_id)
+        for period_id in self.period_ids:
+            if period_id not in self.periods:
+                print(f"Warning: Period '{period_id}' is not among the active exam periods")
+        period_names = [f"{period_id} ({self.periods.get(period_id, {}).get('name', 'unknown')})" for period_id in self.period_ids]
+        print(f"Found {len(self.period_ids)} period(s): {', '.join(period_names)}")
         
         # Show all batches and exit if requested
         if self.show_batches_only:
-            self.display_batches(self.period_id, batches_response)
+            self.display_batches(batches_response)
+            if self.verbose:
+                self._log_startup()
             return True
         
         # If not checking all batches, extract specific batch details
@@ -506,7 +4112,7 @@ class HSAChecker:
                         
                 if not batch_found:
                     print(f"Error: Batch code '{self.batch_code}' not found.")
-                    self.display_batches(self.period_id, batches_response)
+                    self.display_batches(batches_response)
                     return False
                     
                 if batch_status != "OPENING":
@@ -517,7 +4123,7 @@ class HSAChecker:
                 
                 if not opening_batches:
                     print("Error: No OPENING batches found.")
-                    self.display_batches(self.period_id, batches_response)
+                    self.display_batches(batches_response)
                     return False
                     
                 batch = opening_batches[0]
@@ -527,39 +4133,60 @@ class HSAChecker:
             
             # For debugging - output what we're using
             print(f"Using batch: {self.batch_name} (Code: {self.batch_code}, ID: {self.batch_id}")
+        elif self.watchlist:
+            print(f"Will check locations matching {len(self.watchlist.rules)} watch rule(s):")
+            for line in self.watchlist.describe():
+                print(f"  {line}")
         else:
             print("Will check ALL batches with status:", self.batch_status)
         
         # Run once or in monitoring mode
         if self.monitor_mode:
-            print(f"Starting monitoring mode. Will check every {self.interval} seconds with {self.delay} seconds delay between API calls.")
+            print(f"Starting monitoring mode. Will check every {self.interval} seconds with an adaptive delay between API calls.")
             print("Press Ctrl+C to stop.")
             
-            run_count = 0
+            # A replay stops at the end of its recording
+            until = (lambda: self.replay.finished) if self.replay else None
             try:
-                while True:
-                    run_count += 1
-                    print(f"Run #{run_count} at {datetime.datetime.now()}")
-                    
-                    self.run_check()
-                    
-                    print(f"Next check in {self.interval} seconds. Press Ctrl+C to stop.")
-                    time.sleep(self.interval)
+                self.scheduler.run(self.run_check, self.interval, until)
             except KeyboardInterrupt:
                 print("\nMonitoring stopped by user.")
-                return True
+            if self.replay:
+                for line in self.replay.report():
+                    print(line)
+            return True
         else:
+            if early_slots:
+                url, future = early_slots
+                self._prefetched[url] = future.result()
             self.run_check()
             
             print("To continuously monitor, run with the -m flag")
             print("To check all batches, run with --all-batches")
-            print(f"Adjust API delay with -d SECONDS (current: {self.delay})")
+            print(f"Adjust the initial API delay with -d SECONDS (current: {self.delay}, now {self.limiter.describe()})")
             print(f"Set monitoring interval with -i SECONDS (current: {self.interval})")
-            print(f"Results saved to {self.results_file}")
+            print(f"Results saved to {self.results_file} (structured: {self.results_jsonl})")
             print("To view all available batches, run with the -a flag")
             
             return True
     
+    def _log_startup(self):
+        """Log the start-up breakdown once, after the first check or batch listing"""
+        if self.startup.reported:
+            return
+        self.startup.reported = True
+        for line in self.startup.describe(self.transport.first_requests):
+            print(f"{self._timestamp()} Start-up: {line}")
+    
+    def _log_pool_stats(self):
+        """Log connection pool statistics for the last scan"""
+        stats = self.transport.scan_stats()
+        self._log(f"Connection pool: {stats['requests']} requests, {stats['handshakes']} handshakes this scan "
+                  f"(reuse ratio {stats['reuse_ratio']:.0%}, {stats['total_handshakes']} handshakes for "
+                  f"{stats['total_requests']} requests since start)")
+        for host, host_stats in self.transport.host_stats().items():
+            self._log(f"  {host}: {host_stats['requests']} requests over {host_stats['handshakes']} connection(s)")
+    
     def _timestamp(self) -> str:
         """Return current timestamp in standard format"""
         return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -573,14 +4200,49 @@ class HSAChecker:
     
     def _log_file(self, message: str):
         """Log message to file only"""
-        with open(self.results_file, 'a') as f:
-            f.write(f"{message}\n")
+        self.writer.write_text(message)
+    
+    def _log_record(self, result: LocationResult):
+        """Log a location result as a structured JSONL record"""
+        self.writer.write_record({"type": "location", "time": self._timestamp(), **result.to_dict()})
+    
+    def close(self):
+        """Flush buffered output and release files, databases and connections"""
+        self.discovery_executor.shutdown(wait=False, cancel_futures=True)
+        self.notifier.close()
+        for notifier in self.rule_notifiers.values():
+            notifier.close()
+        if self.hedge:
+            self.hedge.close()
+        if self.availability:
+            self.availability.close()
+        self.metrics.close()
+        self.writer.close()
+        if self.recorder:
+            self.recorder.close()
+        if self.cluster:
+            self.cluster.close()
+        if self.history:
+            self.history.close()
+        self.transport.close()
+        if self.pool:
+            for worker in self.pool.workers:
+                worker.transport.close()
 
 def main():
     """Main entry point"""
     args = parse_arguments()
-    checker = HSAChecker(args)
-    checker.run()
+    if args.command == "history":
+        sys.exit(0 if show_history(args) else 1)
+    
+    startup = StartupTimer(STARTED_AT)
+    startup.mark("imports", IMPORTED_AT)
+    startup.mark("arguments")
+    checker = HSAChecker(args, startup)
+    try:
+        checker.run()
+    finally:
+        checker.close()
 
 if __name__ == "__main__":
     main()
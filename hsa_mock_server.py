@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+HSA Mock API Server
+Local stand-in for api.hsa.edu.vn used to test and benchmark the checker
+Serves the registration and sign-in endpoints with injected latency, errors and scripted seat changes
+"""
+
+import argparse
+import base64
+import datetime
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+ENDPOINTS = ("sign-in", "available-period", "available-batch", "available-location", "available-slot")
+CITIES = ("Hà Nội", "Hải Phòng", "Nam Định", "Thái Nguyên", "Đà Nẵng", "TP Hồ Chí Minh")
+FIRST_EXAM_DAY = datetime.date(2099, 5, 9)
+
+def parse_arguments(argv: List[str] = None):
+    """Parse command line arguments (sys.argv unless argv is given)"""
+    parser = argparse.ArgumentParser(description="HSA Mock API Server")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765)")
+    parser.add_argument("--periods", type=int, default=1, help="Number of active exam periods (default: 1)")
+    parser.add_argument("--batches", type=int, default=2,
+                      help="Number of OPENING batches, spread over the periods (default: 2)")
+    parser.add_argument("--locations", type=int, default=20, help="Locations per batch (default: 20)")
+    parser.add_argument("--slots", type=int, default=4, help="Slots per location (default: 4)")
+    parser.add_argument("--seats", type=int, default=300, help="Seats per slot (default: 300)")
+    parser.add_argument("--latency", default="fixed:20",
+                      help="Response latency in ms: fixed:MS, uniform:LO:HI or lognormal:MEDIAN:SIGMA (default: fixed:20)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500 (default: 0)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0,
+                      help="Fraction of requests answered with 429 (default: 0)")
+    parser.add_argument("--max-rps", type=float, default=0.0,
+                      help="Answer 429 once more than this many requests arrive within a second (default: unlimited)")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429 (default: 1)")
+    parser.add_argument("--token-ttl", type=int, default=3600, help="Lifetime of issued tokens in seconds (default: 3600)")
+    parser.add_argument("--script", help="JSON file of timed seat changes: [{\"at\": 5, \"location\": \"b1-L3\", \"slot\": \"2\", \"seats\": 4}]")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible latency and error injection")
+    return parser.parse_args(argv)
+
+def parse_latency(spec: str):
+    """Turn a latency spec into a function returning a delay in seconds"""
+    kind, _, params = spec.partition(':')
+    try:
+        values = [float(v) for v in params.split(':')] if params else []
+    except ValueError:
+        values = []
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0] / 1000.0
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000.0
+    if kind == "lognormal" and len(values) == 2:
+        # Median in ms and sigma of the underlying normal distribution
+        return lambda rng: values[0] / 1000.0 * rng.lognormvariate(0.0, values[1])
+    raise argparse.ArgumentTypeError(f"Invalid latency spec: {spec}")
+
+def make_token(ttl: int, serial: int) -> str:
+    """Build an unsigned JWT-shaped token carrying an exp claim"""
+    def encode(obj: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).decode().rstrip('=')
+    return f"{encode({'alg': 'none', 'typ': 'JWT'})}.{encode({'exp': int(time.time()) + ttl, 'n': serial})}.mock"
+
+class MockHSAServer:
+    """In-process mock of the HSA registration API"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, batches: int = 2, locations: int = 20,
+                 slots: int = 4, seats: int = 300, latency: str = "fixed:20", error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, max_rps: float = 0.0, retry_after: int = 1,
+                 token_ttl: int = 3600, script: List[dict] = None, seed: int = None, periods: int = 1):
+        """Build the batch and location catalogue; port 0 picks a free port"""
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.max_rps = max_rps
+        self.retry_after = retry_after
+        self.token_ttl = token_ttl
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+        self.periods = [{"id": f"mock-period-{k + 1}", "name": f"Mock exam period {k + 1}"} for k in range(max(1, periods))]
+        self.batches = [{
+            "id": f"b{i + 1}",
+            "code": str(501 + i),
+            "name": f"Mock batch {501 + i}",
+            "status": "OPENING",
+            "config": {"registrationEndDateTime": "2099-12-31T23:59:59"}
+        } for i in range(batches)]
+        # Batches are dealt round-robin over the periods
+        self.period_batches = {period["id"]: self.batches[k::len(self.periods)] for k, period in enumerate(self.periods)}
+        self.locations = {batch["id"]: [{"id": f"{batch['id']}-L{j + 1}",
+                                         "name": f"{CITIES[j % len(CITIES)]} - Điểm thi {j + 1}"}
+                                        for j in range(locations)] for batch in self.batches}
+
+        # Every slot starts fully booked: (location_id, slot_id) -> registered seats
+        self.seats = seats
+        self.slot_ids = [str(k + 1) for k in range(slots)]
+        self.registered = {(location["id"], slot_id): seats
+                           for batch_locations in self.locations.values()
+                           for location in batch_locations for slot_id in self.slot_ids}
+
+        self.script = sorted(script or [], key=lambda change: float(change["at"]))
+        self.applied = []
+        self.started_at = None
+        self.tokens = set()
+        self.recent = deque()
+        self.stats = {endpoint: {"requests": 0, "errors": 0, "throttled": 0, "not_modified": 0}
+                      for endpoint in ENDPOINTS}
+
+        mock = self
+        class Handler(MockRequestHandler):
+            server_mock = mock
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        """URL to pass to the checker's --api-base"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve requests on a background thread"""
+        self.started_at = time.monotonic()
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="hsa-mock", daemon=True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self):
+        """Serve requests on the calling thread until interrupted"""
+        self.started_at = time.monotonic()
+        self.httpd.serve_forever()
+
+    def stop(self):
+        """Stop serving and close the listening socket"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread:
+            self.thread.join()
+
+    def schedule(self, at: float, location_id: str, slot_id: str, seats: int):
+        """Free `seats` seats of a slot `at` seconds after start (0 closes it again)"""
+        with self.lock:
+            self.script.append({"at": at, "location": location_id, "slot": str(slot_id), "seats": seats})
+            self.script.sort(key=lambda change: float(change["at"]))
+
+    def set_seats(self, location_id: str, slot_id: str, seats: int):
+        """Free `seats` seats of a slot right now and record when it happened"""
+        with self.lock:
+            self._apply({"location": location_id, "slot": str(slot_id), "seats": seats})
+
+    def _apply(self, change: dict):
+        """Apply one seat change; the caller holds the lock"""
+        key = (change["location"], str(change["slot"]))
+        if key not in self.registered:
+            print(f"Warning: Scripted change for unknown slot {key[1]} at {key[0]}")
+            return
+        self.registered[key] = self.seats - max(0, min(self.seats, int(change["seats"])))
+        self.applied.append(dict(change, applied_at=time.monotonic()))
+
+    def _advance(self):
+        """Apply every scripted change that is due; the caller holds the lock"""
+        elapsed = time.monotonic() - (self.started_at or time.monotonic())
+        while self.script and float(self.script[0]["at"]) <= elapsed:
+            self._apply(self.script.pop(0))
+
+    def issue_token(self) -> str:
+        """Sign in: issue a new token and remember it"""
+        with self.lock:
+            token = make_token(self.token_ttl, len(self.tokens) + 1)
+            self.tokens.add(token)
+            return token
+
+    def is_authorized(self, header: Optional[str]) -> bool:
+        """Accept only unexpired tokens issued by this server"""
+        token = (header or "").replace("Bearer ", "", 1)
+        if token not in self.tokens:
+            return False
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload))["exp"] > time.time()
+
+    def inject(self, endpoint: str) -> Optional[int]:
+        """Count the request and decide whether to fail it with 500 or 429"""
+        with self.lock:
+            stats = self.stats[endpoint]
+            stats["requests"] += 1
+            now = time.monotonic()
+            self.recent.append(now)
+            while self.recent and now - self.recent[0] > 1.0:
+                self.recent.popleft()
+            if (self.max_rps and len(self.recent) > self.max_rps) or self.rng.random() < self.throttle_rate:
+                stats["throttled"] += 1
+                return 429
+            if self.rng.random() < self.error_rate:
+                stats["errors"] += 1
+                return 500
+            return None
+
+    def delay(self) -> float:
+        """Draw a response latency in seconds"""
+        with self.lock:
+            return max(0.0, self.latency(self.rng))
+
+    def slots_for(self, location_id: str) -> Optional[list]:
+        """Return the available-slot payload of a location"""
+        with self.lock:
+            self._advance()
+            if (location_id, self.slot_ids[0]) not in self.registered:
+                return None
+            return [{
+                "id": int(slot_id),
+                "name": f"Ca {slot_id} - {(FIRST_EXAM_DAY + datetime.timedelta(days=int(slot_id) - 1)).strftime('%d/%m/%Y')}",
+                "numberOfSeats": self.seats,
+                "registeredSlots": self.registered[(location_id, slot_id)]
+            } for slot_id in self.slot_ids]
+
+    def describe(self) -> List[str]:
+        """Return per-endpoint request counts for display"""
+        return [f"{endpoint}: {s['requests']} requests, {s['errors']} errors, {s['throttled']} throttled, "
+                f"{s['not_modified']} not modified" for endpoint, s in self.stats.items() if s['requests']]
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    """HTTP handler routing requests to the owning MockHSAServer"""
+
+    protocol_version = "HTTP/1.1"
+    server_mock: MockHSAServer = None
+
+    def log_message(self, format, *args):
+        """Keep the console quiet; statistics are kept instead"""
+
+    def do_POST(self):
+        """Handle accounts/sign-in"""
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        path = urlparse(self.path).path
+        if not path.endswith("/accounts/sign-in"):
+            return self._send(404, {"message": "Not found"})
+        if not self._admit("sign-in"):
+            return
+        try:
+            credentials = json.loads(body or b"{}")
+        except ValueError:
+            credentials = {}
+        if not credentials.get("id") or not credentials.get("password"):
+            return self._send(400, {"message": "Missing credentials"})
+        self._send(200, {"token": self.server_mock.issue_token()})
+
+    def do_GET(self):
+        """Handle the available-* registration endpoints"""
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        endpoint = url.path.rsplit('/', 1)[-1]
+        if endpoint not in ENDPOINTS[1:]:
+            return self._send(404, {"message": "Not found"})
+        if not self._admit(endpoint):
+            return
+        if not self.server_mock.is_authorized(self.headers.get("Authorization")):
+            return self._send(401, {"message": "Unauthorized"})
+
+        mock = self.server_mock
+        if endpoint == "available-period":
+            return self._send(200, mock.periods, endpoint)
+        if endpoint == "available-batch":
+            return self._send(200, mock.period_batches.get(query.get("periodId"), []), endpoint)
+        if endpoint == "available-location":
+            return self._send(200, mock.locations.get(query.get("batchId"), []), endpoint)
+
+        slots = mock.slots_for(query.get("locationId"))
+        if slots is None:
+            return self._send(404, {"message": "Unknown location"})
+        self._send(200, slots)
+
+    def _admit(self, endpoint: str) -> bool:
+        """Sleep for the injected latency and send an injected failure if one is drawn"""
+        time.sleep(self.server_mock.delay())
+        status = self.server_mock.inject(endpoint)
+        if status == 429:
+            self._send(429, {"message": "Too many requests"}, headers={"Retry-After": str(self.server_mock.retry_after)})
+            return False
+        if status == 500:
+            self._send(500, {"message": "Injected error"})
+            return False
+        return True
+
+    def _send(self, status: int, payload, etag_endpoint: str = None, headers: Dict[str, str] = None):
+        """Send a JSON response; discovery responses carry an ETag and honour If-None-Match"""
+        body = json.dumps(payload).encode()
+        headers = dict(headers or {})
+        if etag_endpoint:
+            etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+            headers["ETag"] = etag
+            if self.headers.get("If-None-Match") == etag:
+                with self.server_mock.lock:
+                    self.server_mock.stats[etag_endpoint]["not_modified"] += 1
+                status, body = 304, b""
+
+        self.send_response(status)
+        if body:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+def load_script(path: str) -> List[dict]:
+    """Load timed seat changes from a JSON file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        script = json.load(f)
+    if not isinstance(script, list) or not all({"at", "location", "slot", "seats"} <= set(c) for c in script):
+        raise ValueError("script must be a list of {at, location, slot, seats} objects")
+    return script
+
+def main():
+    """Main entry point"""
+    args = parse_arguments()
+    try:
+        script = load_script(args.script) if args.script else None
+    except (OSError, ValueError) as e:
+        print(f"Error: Could not load script from {args.script}: {str(e)}")
+        return 1
+
+    try:
+        mock = MockHSAServer(args.host, args.port, args.batches, args.locations, args.slots, args.seats,
+                             args.latency, args.error_rate, args.throttle_rate, args.max_rps, args.retry_after,
+                             args.token_ttl, script, args.seed, args.periods)
+    except argparse.ArgumentTypeError as e:
+        print(f"Error: {str(e)}")
+        return 1
+
+    print(f"HSA mock API listening on {mock.base_url}")
+    print(f"{len(mock.periods)} period(s), {len(mock.batches)} batches x {args.locations} locations x {args.slots} slots, latency {args.latency}")
+    print(f"Run the checker with: python hsa_checker.py --api-base {mock.base_url} -p 0900000000 -w secret")
+    try:
+        mock.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping mock server")
+        for line in mock.describe():
+            print(f"  {line}")
+    finally:
+        mock.httpd.server_close()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
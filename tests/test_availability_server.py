@@ -0,0 +1,68 @@
+"""Tests for the AvailabilityServer snapshot and event stream"""
+
+import json
+import os
+import sys
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hsa_checker import (AvailabilityServer, BatchResult, LocationResult, ScanResult, SlotEvent,
+                         SlotResult)
+
+def location(batch_code: str, location_id: str, opened: bool) -> LocationResult:
+    """A checked location whose slot 1 has one seat if `opened`"""
+    result = LocationResult(batch_code, f"Mock batch {batch_code}", location_id, f"Điểm thi {location_id}")
+    result.slots = [SlotResult("1", "Ca 1", 300, 299 if opened else 300)]
+    if opened:
+        result.events = [SlotEvent(SlotEvent.OPENED, batch_code, location_id, "1", "Ca 1", 0, 1, 300)]
+    return result
+
+def publish(server: AvailabilityServer):
+    """Publish one scan over two batches in which L1 and L3 opened"""
+    scan = ScanResult()
+    for batch_code, location_ids in (("502", ("L1", "L2")), ("503", ("L3",))):
+        batch = BatchResult(f"b{batch_code}", batch_code, f"Mock batch {batch_code}")
+        for location_id in location_ids:
+            result = location(batch_code, location_id, location_id != "L2")
+            server.publish_location(result)
+            batch.locations.append(result)
+        scan.batches.append(batch)
+    server.publish_scan(scan)
+
+def test_snapshot_is_filtered_by_batch_and_location():
+    """/snapshot returns the latest result of every location matching ?batch= and ?location="""
+    server = AvailabilityServer(0)
+    base = "http://127.0.0.1:%d" % server.server.server_address[1]
+    try:
+        publish(server)
+        body = requests.get(f"{base}/snapshot", timeout=5).json()
+        assert [entry["location_id"] for entry in body["locations"]] == ["L1", "L2", "L3"]
+        assert body["last_scan"]["events"] == 2
+        body = requests.get(f"{base}/snapshot?batch=502&location=L2,L3", timeout=5).json()
+        assert [entry["location_id"] for entry in body["locations"]] == ["L2"]
+        assert requests.get(f"{base}/missing", timeout=5).status_code == 404
+    finally:
+        server.close()
+
+def test_event_stream_replays_missed_events_through_its_filters():
+    """A subscriber reconnecting with Last-Event-ID gets the events it missed that match its filters"""
+    server = AvailabilityServer(0)
+    base = "http://127.0.0.1:%d" % server.server.server_address[1]
+    try:
+        publish(server)
+        response = requests.get(f"{base}/events?batch=503", headers={"Last-Event-ID": "0"}, stream=True, timeout=5)
+        events = []
+        kind = None
+        for line in response.iter_lines(chunk_size=1, decode_unicode=True):
+            if line.startswith("event: "):
+                kind = line[len("event: "):]
+            elif line.startswith("data: "):
+                events.append((kind, json.loads(line[len("data: "):])))
+                if kind == "scan":
+                    break
+        response.close()
+        assert [(kind, data.get("location_id")) for kind, data in events] == [("slot", "L3"), ("scan", None)]
+    finally:
+        server.close()
@@ -0,0 +1,61 @@
+"""Tests for ClusterCoordinator shard leases"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hsa_checker import ClusterCoordinator, SlotEvent
+
+LEASE_TTL = 0.6
+
+def test_leases_outlive_a_check_interval_longer_than_the_ttl(tmp_path):
+    """Two nodes keep an even split even when checks are further apart than --lease-ttl"""
+    path = str(tmp_path / "cluster.sqlite3")
+    first = ClusterCoordinator(path, "n1", shards=16, lease_ttl=LEASE_TTL).start()
+    second = ClusterCoordinator(path, "n2", shards=16, lease_ttl=LEASE_TTL).start()
+    try:
+        for _ in range(3):
+            for node in (first, second):
+                time.sleep(LEASE_TTL * 1.5)
+                node.acquire()
+            assert first.nodes == second.nodes == 2
+            assert len(first.owned) == len(second.owned) == 8
+            assert not first.owned & second.owned
+    finally:
+        first.close()
+        second.close()
+
+def test_shards_of_a_dead_node_are_taken_over(tmp_path):
+    """A node that stops renewing loses its shards after --lease-ttl"""
+    path = str(tmp_path / "cluster.sqlite3")
+    survivor = ClusterCoordinator(path, "n1", shards=16, lease_ttl=LEASE_TTL).start()
+    dead = ClusterCoordinator(path, "n2", shards=16, lease_ttl=LEASE_TTL)
+    try:
+        for node in (survivor, dead, survivor, dead):
+            node.acquire()
+        assert len(survivor.owned) == len(dead.owned) == 8
+
+        time.sleep(LEASE_TTL * 1.5)
+        survivor.acquire()
+        assert survivor.nodes == 1
+        assert len(survivor.owned) == 16
+    finally:
+        survivor.close()
+        dead.conn.close()
+
+def slot_event(kind, old, new):
+    """A change of slot 1 at location L1 in batch 502"""
+    return SlotEvent(kind, "502", "L1", "1", "Ca 1", old, new, 300)
+
+def test_reopening_after_a_close_is_announced_again(tmp_path):
+    """A close lowers the announced seat count, so reopening with the same seats is claimed"""
+    coordinator = ClusterCoordinator(str(tmp_path / "cluster.sqlite3"), "n1", lease_ttl=LEASE_TTL)
+    try:
+        assert len(coordinator.claim_notifications([slot_event(SlotEvent.OPENED, 0, 2)])) == 1
+        assert coordinator.claim_notifications([slot_event(SlotEvent.OPENED, 0, 2)]) == []
+        assert coordinator.claim_notifications([slot_event(SlotEvent.CLOSED, 2, 0)]) == []
+        assert len(coordinator.claim_notifications([slot_event(SlotEvent.OPENED, 0, 2)])) == 1
+    finally:
+        coordinator.close()
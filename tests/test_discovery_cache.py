@@ -0,0 +1,69 @@
+"""Tests for DiscoveryCache expiry and conditional revalidation"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hsa_checker import DiscoveryCache, HSAChecker, parse_arguments
+from hsa_mock_server import MockHSAServer
+
+class ManualClock:
+    """Monotonic clock that only moves when advanced"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+def test_entries_expire_after_their_endpoint_ttl():
+    """An entry is fresh for its endpoint's TTL, stays retrievable when stale and refresh() restarts it"""
+    clock = ManualClock()
+    cache = DiscoveryCache({"batches": 10.0}, clock=clock)
+    cache.put("/batches", "batches", [1], etag='"v1"')
+    assert cache.is_fresh(cache.get("/batches"))
+
+    clock.now += 10.0
+    entry = cache.get("/batches")
+    assert not cache.is_fresh(entry)
+    assert entry["payload"] == [1] and entry["etag"] == '"v1"'
+
+    cache.refresh("/batches")
+    assert cache.is_fresh(cache.get("/batches"))
+
+def test_least_recently_used_entry_is_evicted():
+    """Beyond max_entries the entry looked up least recently is dropped"""
+    cache = DiscoveryCache(max_entries=2, clock=ManualClock())
+    cache.put("/a", "locations", [1])
+    cache.put("/b", "locations", [2])
+    cache.get("/a")
+    cache.put("/c", "locations", [3])
+    assert cache.get("/b") is None
+    assert cache.get("/a") is not None and cache.get("/c") is not None
+
+def make_checker(base_url: str) -> HSAChecker:
+    """A checker aimed at the mock that keeps no state between runs"""
+    return HSAChecker(parse_arguments([
+        "--api-base", base_url, "-p", "0900000000", "-w", "test", "-n", "-d", "0",
+        "--token-cache", "", "--state-file", "", "--limiter-state", "", "--no-history",
+        "--cache-ttl", "periods=0"
+    ]))
+
+def test_stale_entry_is_revalidated_with_its_etag(tmp_path, monkeypatch):
+    """An expired entry is refreshed by a 304 answer to If-None-Match and served if the server is gone"""
+    monkeypatch.chdir(tmp_path)
+    mock = MockHSAServer(batches=1, locations=1, latency="fixed:0").start()
+    try:
+        checker = make_checker(mock.base_url)
+        periods = checker.fetch_periods()
+        assert periods and checker.discovery_cache.stats["misses"] == 1
+        assert checker.fetch_periods() == periods
+        assert checker.discovery_cache.stats["revalidated"] == 1
+        assert mock.stats["available-period"]["not_modified"] == 1
+    finally:
+        mock.stop()
+    assert checker.fetch_periods() == periods
@@ -0,0 +1,125 @@
+"""Tests for HedgePolicy latency tracking and duplicate requests"""
+
+import os
+import sys
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hsa_checker import AccountWorker, AdaptiveRateLimiter, HedgePolicy, TokenCache
+
+SLOT_URL = "https://api.example.com/exam/views/registration/available-slot?locationId=1"
+
+class FakeTransport:
+    """Answers every request with an empty slot list after `latency` seconds"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def request(self, method, url, headers=None, json=None):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b"[]"
+        return response
+
+class CountingLimiter(AdaptiveRateLimiter):
+    """Rate limiter that counts the tokens it hands out"""
+
+    def __init__(self, rate: float):
+        super().__init__(rate, rate)
+        self.granted = 0
+
+    def acquire(self, cancelled=None) -> bool:
+        granted = super().acquire(cancelled)
+        self.granted += granted
+        return granted
+
+def make_worker(transport, limiter, policy) -> AccountWorker:
+    """A worker with a fixed token that hedges slot requests"""
+    return AccountWorker("test", transport, limiter, {}, TokenCache(""), token="token", hedge=policy)
+
+def test_limiter_wait_does_not_inflate_the_hedge_delay():
+    """Requests spaced 50 ms apart by the limiter against a 5 ms server learn a delay near 5 ms"""
+    policy = HedgePolicy(percentile=95, budget=0.0)
+    worker = make_worker(FakeTransport(0.005), AdaptiveRateLimiter(20.0, 20.0), policy)
+    try:
+        for _ in range(HedgePolicy.MIN_SAMPLES + 5):
+            worker.request('GET', SLOT_URL)
+        assert policy.delay() < 0.03
+    finally:
+        policy.close()
+
+def test_duplicate_takes_a_token_only_when_sent():
+    """Fast responses never trigger a hedge, so each request takes exactly one token"""
+    policy = HedgePolicy(percentile=95, budget=1.0)
+    policy.samples.extend([0.5] * HedgePolicy.MIN_SAMPLES)
+    limiter = CountingLimiter(1000.0)
+    transport = FakeTransport(0.001)
+    worker = make_worker(transport, limiter, policy)
+    try:
+        for _ in range(10):
+            worker.request('GET', SLOT_URL)
+        assert policy.hedges == 0
+        assert limiter.granted == transport.calls == 10
+    finally:
+        policy.close()
+
+def test_slow_request_is_hedged_with_its_own_token():
+    """A request slower than the learned delay gets a duplicate that is charged to the limiter"""
+    policy = HedgePolicy(percentile=95, budget=1.0)
+    policy.samples.extend([0.02] * HedgePolicy.MIN_SAMPLES)
+    limiter = CountingLimiter(1000.0)
+    transport = FakeTransport(0.2)
+    worker = make_worker(transport, limiter, policy)
+    try:
+        assert worker.request('GET', SLOT_URL).status_code == 200
+        assert policy.hedges == 1
+        assert limiter.granted == 2
+    finally:
+        policy.close()
+
+def test_delay_follows_the_latency_percentile():
+    """No delay is learned before MIN_SAMPLES, then it is the chosen percentile, never below MIN_DELAY"""
+    policy = HedgePolicy(percentile=90, budget=0.1)
+    try:
+        policy.samples.extend([0.01 * i for i in range(1, HedgePolicy.MIN_SAMPLES)])
+        assert policy.delay() is None
+        policy.samples.append(0.2)
+        assert policy.delay() == 0.19
+        policy.samples.clear()
+        policy.samples.extend([0.001] * HedgePolicy.MIN_SAMPLES)
+        assert policy.delay() == HedgePolicy.MIN_DELAY
+    finally:
+        policy.close()
+
+def test_only_slot_reads_are_hedged():
+    """Sign-in and discovery requests are never duplicated"""
+    policy = HedgePolicy()
+    try:
+        assert policy.applies_to('GET', SLOT_URL)
+        assert not policy.applies_to('POST', SLOT_URL)
+        assert not policy.applies_to('GET', "https://api.example.com/exam/views/registration/available-batch")
+    finally:
+        policy.close()
+
+def test_budget_caps_the_number_of_duplicates():
+    """With a 10% budget, ten slow requests send a single duplicate"""
+    policy = HedgePolicy(percentile=95, budget=0.1)
+    policy.samples.extend([0.02] * HedgePolicy.MIN_SAMPLES)
+    transport = FakeTransport(0.05)
+    worker = make_worker(transport, AdaptiveRateLimiter(1000.0, 1000.0), policy)
+    try:
+        for _ in range(10):
+            worker.request('GET', SLOT_URL)
+        assert policy.hedges == 1
+        assert transport.calls == 11
+    finally:
+        policy.close()
@@ -0,0 +1,43 @@
+"""Tests for HistoryStore openings and open durations"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hsa_checker import HistoryStore
+
+HOUR = 3600
+
+def record(store, observed_at, seats, registered=0):
+    """Record one observation of slot 1 at location L1 in batch 502"""
+    store.record("502", "L1", "Hà Nội", "1", "Ca 1", seats, registered, observed_at)
+
+def test_opening_after_a_quiet_period_older_than_the_window(tmp_path):
+    """The observation before an opening may predate the window when unchanged responses are skipped"""
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+    now = int(time.time())
+    record(store, now - 48 * HOUR, 300, 300)
+    record(store, now - 2 * HOUR, 300, 297)
+    record(store, now - 1 * HOUR, 300, 300)
+    store.flush()
+
+    openings = store.openings(now - 24 * HOUR)
+    assert [(row[0], row[4]) for row in openings] == [(now - 2 * HOUR, 3)]
+    assert store.open_durations(now - 24 * HOUR) == [HOUR]
+    store.close()
+
+def test_opening_before_the_window_is_not_counted(tmp_path):
+    """A slot that was already open when the window starts has no opening or duration in it"""
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+    now = int(time.time())
+    record(store, now - 48 * HOUR, 300, 300)
+    record(store, now - 30 * HOUR, 300, 298)
+    record(store, now - 1 * HOUR, 300, 300)
+    store.flush()
+
+    assert store.openings(now - 24 * HOUR) == []
+    assert store.open_durations(now - 24 * HOUR) == []
+    assert len(store.openings(now - 72 * HOUR)) == 1
+    store.close()
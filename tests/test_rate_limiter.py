@@ -0,0 +1,81 @@
+"""Tests for AdaptiveRateLimiter increase and decrease"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hsa_checker import AdaptiveRateLimiter
+
+class ManualClock:
+    """Monotonic clock that only moves when slept on or advanced"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += max(seconds, 0)
+
+def test_healthy_responses_raise_the_rate_up_to_the_maximum():
+    """Each fast successful response adds INCREASE until max_rate is reached"""
+    limiter = AdaptiveRateLimiter(1.0, 1.2, clock=ManualClock())
+    limiter.record(200, 0.1)
+    assert limiter.rate == 1.0 + AdaptiveRateLimiter.INCREASE
+    for _ in range(20):
+        limiter.record(200, 0.1)
+    assert limiter.rate == 1.2
+
+def test_throttling_halves_the_rate_once_per_interval():
+    """A burst of 429/503 answers halves the rate once and remembers the rate it happened at"""
+    clock = ManualClock()
+    limiter = AdaptiveRateLimiter(4.0, 10.0, clock=clock)
+    limiter.record(429, 0.1)
+    limiter.record(503, 0.1)
+    assert limiter.rate == 2.0
+    assert limiter.ceiling == 4.0
+    assert limiter.backoff_events == 1
+
+    clock.sleep(AdaptiveRateLimiter.DECREASE_INTERVAL)
+    limiter.record(503, 0.1)
+    assert limiter.rate == 1.0
+    assert limiter.backoff_events == 2
+
+def test_growth_after_throttling_stays_below_the_ceiling():
+    """After a backoff the rate probes up to just below the rate that was throttled"""
+    limiter = AdaptiveRateLimiter(2.0, 10.0, clock=ManualClock())
+    limiter.record(429, 0.1)
+    for _ in range(49):
+        limiter.record(200, 0.1)
+    assert limiter.rate == limiter.ceiling * AdaptiveRateLimiter.HEADROOM == 1.8
+
+def test_errors_and_slow_responses_stop_the_increase():
+    """Errors leave the rate alone and responses far slower than usual ease it off once"""
+    limiter = AdaptiveRateLimiter(1.0, 10.0, clock=ManualClock())
+    limiter.record(200, 0.1)
+    rate = limiter.rate
+    limiter.record(500, 0.1)
+    limiter.record(None, 0.1)
+    assert limiter.rate == rate
+    for _ in range(5):
+        limiter.record(200, 1.0)
+    assert limiter.rate == rate * 0.9
+
+def test_retry_after_pauses_acquire():
+    """A Retry-After on a throttled response delays the next token by that long"""
+    clock = ManualClock()
+    limiter = AdaptiveRateLimiter(10.0, 10.0, clock=clock)
+    limiter.record(429, 0.1, retry_after=30.0)
+    start = clock.monotonic()
+    assert limiter.acquire()
+    assert clock.monotonic() - start >= 30.0
+
+def test_saved_rate_never_exceeds_the_starting_rate():
+    """Restoring a saved state keeps the rate at or below the --rate asked for on this run"""
+    limiter = AdaptiveRateLimiter(1.0, 10.0, clock=ManualClock())
+    limiter.load_dict({"rate": 8.0, "ceiling": 9.0, "backoff_events": 3})
+    assert limiter.rate == 1.0
+    assert limiter.ceiling == 9.0
+    assert limiter.backoff_events == 3
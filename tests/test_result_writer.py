@@ -0,0 +1,50 @@
+"""Tests for ResultWriter buffering and rotation"""
+
+import gzip
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hsa_checker import ResultWriter
+
+def make_writer(tmp_path, **options) -> ResultWriter:
+    """A writer for results.txt and results.jsonl in tmp_path"""
+    return ResultWriter(str(tmp_path / "results.txt"), str(tmp_path / "results.jsonl"), **options)
+
+def test_records_are_buffered_until_flush(tmp_path):
+    """Nothing reaches disk before flush_every records are pending or flush() is called"""
+    writer = make_writer(tmp_path, flush_every=3)
+    writer.write_text("first")
+    writer.write_record({"location": "Hà Nội"})
+    assert not (tmp_path / "results.txt").exists()
+
+    writer.write_text("second")
+    assert (tmp_path / "results.txt").read_text(encoding="utf-8") == "first\nsecond\n"
+    writer.write_record({"seats": 2})
+    writer.close()
+    records = [json.loads(line) for line in (tmp_path / "results.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert records == [{"location": "Hà Nội"}, {"seats": 2}]
+
+def test_large_files_are_gzipped_and_old_archives_pruned(tmp_path):
+    """A file over max_bytes is rotated into a gzip archive, keeping only the newest `keep`"""
+    writer = make_writer(tmp_path, max_bytes=10, keep=2)
+    lines = [f"line {i:04d}" for i in range(4)]
+    for line in lines:
+        writer.write_text(line)
+        writer.flush()
+    writer.close()
+
+    archives = sorted(tmp_path.glob("results.txt.*.gz"))
+    assert len(archives) == 2
+    assert [gzip.open(path, "rt").read() for path in archives] == [f"{line}\n" for line in lines[-2:]]
+    assert not (tmp_path / "results.txt").exists()
+
+def test_files_older_than_max_age_are_rotated(tmp_path):
+    """Files are rotated on the first flush after max_age even when they are small"""
+    writer = make_writer(tmp_path, max_age=0)
+    writer.write_record({"seats": 1})
+    writer.flush()
+    assert len(list(tmp_path.glob("results.jsonl.*.gz"))) == 1
+    writer.close()
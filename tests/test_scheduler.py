@@ -0,0 +1,76 @@
+"""Tests for PollScheduler hot/cold selection"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hsa_checker import LocationResult, PollScheduler, SlotEvent, SlotResult
+
+class ManualClock:
+    """Wall and monotonic clock that only moves when advanced"""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+def checked(scheduler, location_id: str, opened: bool = False):
+    """Report a check of a location in batch 502, with a seat opening if `opened`"""
+    result = LocationResult("502", "Mock batch 502", location_id, location_id)
+    result.slots = [SlotResult("1", "Ca 1", 300, 299 if opened else 300)]
+    if opened:
+        result.events = [SlotEvent(SlotEvent.OPENED, "502", location_id, "1", "Ca 1", 0, 1, 300)]
+    scheduler.observe(result)
+
+KEYS = [("502", f"L{i}") for i in range(1, 5)]
+
+def test_without_budget_every_location_is_checked():
+    """A budget of 0, or one covering every candidate, selects all of them in order"""
+    assert PollScheduler(0, clock=ManualClock()).select(KEYS) == KEYS
+    assert PollScheduler(4, clock=ManualClock()).select(KEYS) == KEYS
+
+def test_unchecked_locations_come_first_then_hot_ones():
+    """Locations never checked win, then locations with churn and seats beat quiet ones"""
+    clock = ManualClock()
+    scheduler = PollScheduler(2, clock=clock)
+    for key in KEYS[:3]:
+        checked(scheduler, key[1], opened=key[1] == "L2")
+    clock.now += 10
+    assert scheduler.select(KEYS) == [("502", "L4"), ("502", "L2")]
+
+def test_cold_locations_are_still_checked_eventually():
+    """A quiet location left unchecked long enough outranks a hot one checked just now"""
+    clock = ManualClock()
+    scheduler = PollScheduler(1, clock=clock)
+    checked(scheduler, "L1")
+    clock.now += 600
+    checked(scheduler, "L2", opened=True)
+    clock.now += 1
+    assert scheduler.select(KEYS[:2]) == [("502", "L1")]
+
+def test_carried_over_locations_are_checked_first():
+    """Locations a deadline cut off start the next check until they have been observed"""
+    clock = ManualClock()
+    scheduler = PollScheduler(2, clock=clock)
+    for key in KEYS:
+        checked(scheduler, key[1], opened=key[1] == "L1")
+    scheduler.carry_over([("502", "L4")])
+    assert scheduler.select(KEYS)[0] == ("502", "L4")
+    checked(scheduler, "L4")
+    assert scheduler.carried_count("502") == 0
+
+def test_closing_registration_deadline_raises_the_weight():
+    """Batches whose registration closes soon weigh more, and closed ones weigh less"""
+    clock = ManualClock()
+    scheduler = PollScheduler(clock=clock)
+    key = ("502", "L1")
+    base = scheduler.weight(key, clock.monotonic())
+    scheduler.set_deadline("502", clock.time() + 3600)
+    assert scheduler.weight(key, clock.monotonic()) > base
+    scheduler.set_deadline("502", clock.time() - 1)
+    assert scheduler.weight(key, clock.monotonic()) < base
@@ -0,0 +1,57 @@
+"""Tests for SlotStateTable diffing and fingerprint skips"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hsa_checker import SlotEvent, SlotStateTable
+
+def kinds(events):
+    """(kind, slot_id, old, new) of every event"""
+    return [(event.kind, event.slot_id, event.old, event.new) for event in events]
+
+def test_seat_changes_are_reported_as_transitions():
+    """Opening, growing, shrinking and closing a slot each produce one event, unchanged slots none"""
+    table = SlotStateTable()
+    assert table.update("502", "L1", [("1", "Ca 1", 300, 300), ("2", "Ca 2", 300, 300)]) == []
+    assert kinds(table.update("502", "L1", [("1", "Ca 1", 300, 298), ("2", "Ca 2", 300, 300)])) == [
+        (SlotEvent.OPENED, "1", 0, 2)]
+    assert kinds(table.update("502", "L1", [("1", "Ca 1", 300, 295), ("2", "Ca 2", 300, 300)])) == [
+        (SlotEvent.INCREASED, "1", 2, 5)]
+    assert kinds(table.update("502", "L1", [("1", "Ca 1", 300, 299), ("2", "Ca 2", 300, 300)])) == [
+        (SlotEvent.DECREASED, "1", 5, 1)]
+    assert kinds(table.update("502", "L1", [("1", "Ca 1", 300, 300), ("2", "Ca 2", 300, 300)])) == [
+        (SlotEvent.CLOSED, "1", 1, 0)]
+    assert len(table) == 2
+    assert not table.has_seats("502", "L1")
+
+def test_removed_slot_with_seats_is_closed():
+    """A slot that disappears from the response while it had seats is reported as closed"""
+    table = SlotStateTable()
+    table.update("502", "L1", [("1", "Ca 1", 300, 290), ("2", "Ca 2", 300, 300)])
+    events = table.update("502", "L1", [("2", "Ca 2", 300, 300), ("3", "Ca 3", 300, 299)])
+    assert sorted(kinds(events)) == [(SlotEvent.CLOSED, "1", 10, 0), (SlotEvent.OPENED, "3", 0, 1)]
+    assert [slot.slot_id for slot in table.slots("502", "L1")] == ["2", "3"]
+
+def test_matching_fingerprint_skips_the_response():
+    """Only a response whose fingerprint differs from the stored one needs to be diffed"""
+    table = SlotStateTable()
+    table.update("502", "L1", [("1", "Ca 1", 300, 298)], fingerprint=b"a")
+    assert table.unchanged("502", "L1", b"a")
+    assert not table.unchanged("502", "L1", b"b")
+    assert not table.unchanged("502", "L2", b"a")
+    assert not table.unchanged("502", "L1", None)
+    assert table.has_seats("502", "L1")
+
+def test_compaction_keeps_every_location():
+    """Replacing blocks until the columns are compacted leaves each location's latest slots intact"""
+    table = SlotStateTable()
+    for location in ("L1", "L2"):
+        table.update("502", location, [("1", "Ca 1", 300, 300)])
+    for count in range(2, 6):
+        table.update("502", "L1", [(str(i), f"Ca {i}", 300, 299) for i in range(1, count + 1)])
+    assert table.garbage <= len(table.total) // 2
+    assert [slot.slot_id for slot in table.slots("502", "L1")] == ["1", "2", "3", "4", "5"]
+    assert [(slot.slot_id, slot.available) for slot in table.slots("502", "L2")] == [("1", 0)]
+    assert len(table) == 6
@@ -0,0 +1,46 @@
+"""Tests for TokenManager refresh and sign-in backoff"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hsa_checker import TokenCache, TokenManager
+
+class FailingSignIn:
+    """A sign-in that fails until it is told to succeed"""
+
+    def __init__(self):
+        self.calls = 0
+        self.token = None
+
+    def __call__(self):
+        self.calls += 1
+        return self.token
+
+def test_failed_sign_in_is_not_retried_during_the_backoff(tmp_path):
+    """Requests after a failed sign-in do not sign in again until the backoff has passed"""
+    sign_in = FailingSignIn()
+    tokens = TokenManager("0900000000", TokenCache(str(tmp_path / "tokens.json")), sign_in)
+    assert not tokens.refresh(None)
+    for _ in range(5):
+        tokens.ensure_fresh()
+        assert not tokens.refresh(None)
+    assert sign_in.calls == 1
+    assert tokens.retry_at - tokens.failed_at == TokenManager.FAILURE_BACKOFF
+
+def test_backoff_grows_and_resets_after_a_successful_sign_in(tmp_path):
+    """Each consecutive failure doubles the backoff and a successful sign-in clears it"""
+    sign_in = FailingSignIn()
+    tokens = TokenManager("0900000000", TokenCache(str(tmp_path / "tokens.json")), sign_in)
+    tokens.refresh(None)
+    tokens.retry_at = 0.0
+    tokens.refresh(None)
+    assert tokens.failures == 2
+    assert tokens.retry_at - tokens.failed_at == 2 * TokenManager.FAILURE_BACKOFF
+
+    sign_in.token = "token"
+    tokens.retry_at = 0.0
+    assert tokens.refresh(None)
+    assert tokens.failures == 0
+    assert not tokens.backing_off
@@ -0,0 +1,78 @@
+"""Tests for WatchRule matching and Watchlist routing"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hsa_checker import (BatchResult, LocationResult, ScanResult, SlotEvent, SlotResult, Watchlist,
+                         WatchRule)
+
+BATCH = {"id": "b2", "code": "502", "status": "OPENING"}
+LOCATIONS = [{"id": "L1", "name": "Hà Nội - Điểm thi 1"}, {"id": "L2", "name": "Đà Nẵng - Điểm thi 2"},
+             {"id": "L3", "name": "Hồ Chí Minh - Điểm thi 3"}]
+
+def rule(**spec) -> WatchRule:
+    """Compile a single rule with OPENING as the default status"""
+    return WatchRule(spec, 0, "OPENING")
+
+def test_location_names_match_without_diacritics():
+    """A plain word matches anywhere in the name and ignores case and Vietnamese diacritics"""
+    hanoi = rule(locations="ha noi")
+    assert [l["id"] for l in LOCATIONS if hanoi.matches_location(l)] == ["L1"]
+    assert rule(locations="da nang").matches_location(LOCATIONS[1])
+    assert rule(location_ids=["L3"]).matches_location(LOCATIONS[2])
+    assert rule().matches_location(LOCATIONS[0])
+
+def test_glob_patterns_match_the_whole_name():
+    """Glob characters switch from a substring match to a full match"""
+    assert rule(locations="ha noi*").matches_location(LOCATIONS[0])
+    assert not rule(locations="noi*").matches_location(LOCATIONS[0])
+
+def test_batches_match_by_code_pattern_and_status():
+    """Batch codes may be globs, and the rule's status must match the batch's"""
+    assert rule(batches="50?").matches_batch(BATCH)
+    assert not rule(batches=["503"]).matches_batch(BATCH)
+    assert not rule(status="CLOSED").matches_batch(BATCH)
+    assert rule(status=None).matches_batch({**BATCH, "status": "CLOSED"})
+
+def test_slots_match_seats_weekday_and_date_range():
+    """Slot rules check the free seats and the date in the slot name"""
+    monday = SlotResult("1", "Ca 1 - 12/05/2025", 300, 298)
+    sunday = SlotResult("2", "Ca 2 - 18/05/2025", 300, 299)
+    assert rule(weekdays=["mon"]).matches_slot(monday)
+    assert not rule(weekdays=["mon"]).matches_slot(sunday)
+    assert not rule(min_seats=2).matches_slot(sunday)
+    assert rule(dates={"from": "2025-05-13"}).matches_slot(sunday)
+    assert not rule(dates={"to": "2025-05-13"}).matches_slot(sunday)
+    assert not rule(weekdays=["sat", "sun"]).matches_slot(SlotResult("3", "Ca 3", 300, 0))
+
+def test_invalid_rules_are_rejected():
+    """Unknown fields and weekdays fail when the watchlist is loaded"""
+    for spec in ({"city": "Hà Nội"}, {"weekdays": ["someday"]}, {"dates": {"on": "2025-05-12"}}):
+        try:
+            WatchRule(spec, 0, "OPENING")
+        except ValueError:
+            continue
+        raise AssertionError(f"{spec} was accepted")
+
+def test_scan_plan_and_routing_follow_the_rules():
+    """Only locations some rule covers are planned, and openings go to the rules whose slots gained seats"""
+    watchlist = Watchlist([WatchRule({"name": "hanoi", "locations": "ha noi"}, 0, "OPENING"),
+                           WatchRule({"name": "mondays", "weekdays": ["mon"]}, 1, "OPENING")])
+    assert Watchlist([rule(locations="ha noi")]).compile(BATCH, LOCATIONS) == LOCATIONS[:1]
+    assert watchlist.compile({**BATCH, "status": "CLOSED"}, LOCATIONS) == []
+    assert [l["id"] for l in watchlist.compile(BATCH, LOCATIONS)] == ["L1", "L2", "L3"]
+
+    scan = ScanResult()
+    batch = BatchResult("b2", "502", "Mock batch 502")
+    for location_id in ("L1", "L2"):
+        location = LocationResult("502", "Mock batch 502", location_id, location_id)
+        location.slots = [SlotResult("1", "Ca 1 - 18/05/2025", 300, 299)]
+        location.events = [SlotEvent(SlotEvent.OPENED, "502", location_id, "1", "Ca 1", 0, 1, 300)]
+        batch.locations.append(location)
+    scan.batches.append(batch)
+
+    routed = watchlist.route(scan)
+    assert [(matched.name, [l.location_id for l in result.available_locations]) for matched, result in routed] == [
+        ("hanoi", ["L1"])]
@@ -0,0 +1,54 @@
+"""Tests for WorkerPool retries across accounts"""
+
+import os
+import sys
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hsa_checker import AccountWorker, AdaptiveRateLimiter, TokenCache, WorkerPool
+
+URLS = [f"https://api.example.com/exam/views/registration/available-slot?locationId={i}" for i in range(6)]
+
+class Transport:
+    """Answers with the location ID, or fails every request when `broken`"""
+
+    def __init__(self, broken: bool = False, error: Exception = None):
+        self.broken = broken
+        self.error = error or requests.exceptions.ConnectionError("connection reset")
+        self.urls = []
+
+    def request(self, method, url, headers=None, json=None):
+        self.urls.append(url)
+        if self.broken:
+            raise self.error
+        response = requests.Response()
+        response.status_code = 200
+        response._content = url.rsplit('=', 1)[1].encode()
+        return response
+
+def make_worker(name: str, transport: Transport) -> AccountWorker:
+    """A worker with a fixed token and no practical rate limit"""
+    return AccountWorker(name, transport, AdaptiveRateLimiter(1000.0, 1000.0), {}, TokenCache(""), token="token")
+
+def test_failed_request_is_retried_on_another_account():
+    """Connection errors on one account do not leave empty results, the other account fetches the URLs"""
+    broken, working = Transport(broken=True), Transport()
+    pool = WorkerPool([make_worker("broken", broken), make_worker("working", working)])
+    results = pool.fetch_all(URLS)
+    assert results == {url: url.rsplit('=', 1)[1].encode() for url in URLS}
+    assert sorted(working.urls) == sorted(URLS)
+
+def test_url_failing_on_every_account_is_left_to_the_primary_account():
+    """Once every account has failed a URL it is dropped from the results instead of retried forever"""
+    first, second = Transport(broken=True), Transport(broken=True)
+    pool = WorkerPool([make_worker("first", first), make_worker("second", second)])
+    assert pool.fetch_all(URLS) == {}
+    assert len(first.urls) == len(second.urls) == len(URLS)
+
+def test_unexpected_error_is_reported_with_its_url(capsys):
+    """An exception other than a request failure is printed with the URL that caused it"""
+    pool = WorkerPool([make_worker("faulty", Transport(broken=True, error=ValueError("bad payload")))])
+    assert pool.fetch_all(URLS[:1]) == {}
+    assert f"Account faulty failed to fetch {URLS[0]}" in capsys.readouterr().out